@@ -3,16 +3,36 @@
 import sys
 import json, re
 import time
+import random
+import copy
+import collections
+import asyncio
+import concurrent.futures
+import os, io, tempfile
+import gzip, base64
+import struct, marshal, mmap
+import threading
+import datetime
+import email.utils
 import logging
 logger = logging.getLogger('habitica')
 import contextlib
 import pkg_resources
+try:
+    import fcntl
+except ImportError: # pragma: no cover -- non-POSIX systems.
+    fcntl = None
+try:
+    import ijson
+except ImportError: # pragma: no cover -- optional, used for incremental decoding.
+    ijson = None
 from pathlib import Path
 logging.captureWarnings(True)
 import requests
 import requests.adapters
-import urllib3
-import urllib3.util.retry
+import requests.structures
+import requests.utils
+import urllib3.exceptions
 logging.getLogger('urllib3.connectionpool').setLevel(logging.CRITICAL)
 from . import config
 
@@ -32,17 +52,63 @@ class dotdict(dict):
     """ Dict that support dotted access:
       d['value']['nested_value'] == d.value.nested_value
 
+    Nested plain dicts are converted to dotdicts in-place on the first dotted access,
+    so consequent accesses do not make copies and changes made via dotted access
+    are visible in the original dict:
+      d.value.nested_value = 1
+      d['value']['nested_value'] == 1
+    JSON can be decoded directly into dotdicts: json.loads(text, object_hook=dotdict)
+
     <https://stackoverflow.com/a/23689767/2128769>
     """
     def __getattr__(self, attr):
         value = dict.get(self, attr)
-        return dotdict(value) if type(value) is dict else value
+        if type(value) is dict:
+            value = dotdict(value)
+            dict.__setitem__(self, attr, value)
+        return value
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
 
+class ResponseStream(object):
+    """ Read-only file-like object over body of streamed HTTP response.
+    Body is read from network chunk by chunk on demand.
+    """
+    CHUNK_SIZE = 64 * 1024
+    def __init__(self, response, chunk_size=None):
+        self._chunks = response.iter_content(chunk_size=chunk_size or self.CHUNK_SIZE)
+        self._buffer = b''
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def decode_json_stream(response):
+    """ Decodes JSON body of streamed HTTP response into dotdicts.
+    If ijson is available (see extra 'streaming'),
+    body is parsed incrementally while being read from network,
+    so full raw body is never kept in memory.
+    Otherwise body is collected in a single buffer
+    and decoded from bytes without intermediate text copy.
+    """
+    if ijson is not None:
+        return next(ijson.items(ResponseStream(response), '',
+            map_type=dotdict, use_float=True))
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=ResponseStream.CHUNK_SIZE):
+        buffer.extend(chunk)
+    return json.loads(buffer, object_hook=dotdict)
+
 class Delay:
     """ Ensures specific interval between remote requests
     to reduce load on remote server.
+    Thread-safe.
     """
     def __init__(self, default_delay, **specific_method_delays):
         """ Sets default delay for request (in seconds).
@@ -52,29 +118,736 @@ class Delay:
         self.default_delay = default_delay
         self.method_delays = {key.lower():value for key,value in specific_method_delays.items()}
         self._last_request_time = 0
-    def wait_for(self, method):
-        """ Stops execution until proper delay between requests is reached.
-        May not freeze at all if last request was enough time ago.
+        self._lock = threading.Lock()
+    def get_delay(self, method):
+        """ Returns amount of seconds to wait before the next request.
+        Returns zero or negative value if last request was enough time ago.
         """
         delay = self.method_delays.get(method.lower(), self.default_delay)
-        passed = (time.time() - self._last_request_time)
+        with self._lock:
+            passed = (time.time() - self._last_request_time)
         logger.debug('Last request time: {0}, passed since then: {1}'.format(self._last_request_time, passed))
         logger.debug('Max delay: {0}'.format(delay))
         delay = delay - passed
         logger.debug('Actual delay: {0}'.format(delay))
+        return delay
+    def wait_for(self, method):
+        """ Stops execution until proper delay between requests is reached.
+        May not freeze at all if last request was enough time ago.
+        """
+        delay = self.get_delay(method)
         if delay > 0:
             time.sleep(delay)
-    def update(self):
+    def update(self, headers=None):
         """ Updates last request time.
         Should be called right after actual remote request.
+        Response headers are ignored.
+        """
+        with self._lock:
+            self._last_request_time = time.time()
+
+def _parse_rate_limit_time(value, now):
+    """ Parses time value from rate limit headers.
+    Returns absolute time (timestamp) or None if value cannot be parsed.
+    Supports: amount of seconds (Retry-After), epoch timestamp,
+    HTTP-date and JS Date string (Habitica's X-RateLimit-Reset).
+    """
+    value = str(value).strip()
+    try:
+        seconds = float(value)
+        return seconds if seconds > 1e9 else now + seconds
+    except ValueError:
+        pass
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        pass
+    try: # E.g.: 'Thu Apr 08 2021 12:00:00 GMT+0000 (Coordinated Universal Time)'
+        return datetime.datetime.strptime(value.split(' (')[0], '%a %b %d %Y %H:%M:%S GMT%z').timestamp()
+    except ValueError:
+        return None
+
+class RateLimiter:
+    """ Token bucket rate limiter.
+    Allows bursts of requests while there is budget left
+    and smoothly slows down when budget is running out.
+    Budget is synchronized with server's rate limit response headers:
+    X-RateLimit-Limit, X-RateLimit-Remaining, X-RateLimit-Reset, Retry-After.
+    Thread-safe.
+    If state file is specified, budget is shared between all processes
+    that use the same file (file is locked on every access).
+    """
+    LOW_BUDGET = 0.25 # Fraction of capacity when requests start to slow down.
+    STATE_FIELDS = ('_tokens', '_last_refill', '_reset_time', '_blocked_until', 'limit')
+
+    def __init__(self, limit=30, period=60.0, burst=None, state_file=None):
+        """ Allows `limit` requests per `period` seconds
+        with no more than `burst` requests at once (default is full limit).
+        If state_file is given, it is used to share budget between processes.
+        """
+        self.state_file = state_file
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(self.capacity)
+        self._last_refill = time.time()
+        self._reset_time = None
+        self._blocked_until = 0
+    @property
+    def capacity(self):
+        return min(self.burst or self.limit, self.limit)
+    @contextlib.contextmanager
+    def _locked(self):
+        """ Locks budget for exclusive access.
+        Budget is loaded from state file (if any) and stored back afterwards.
+        """
+        with self._lock:
+            if self.state_file is None or fcntl is None:
+                yield
+                return
+            with open(self.state_file, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    self._load_state(f.read())
+                    yield
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps({name:getattr(self, name) for name in self.STATE_FIELDS}))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    def _load_state(self, text):
+        try:
+            state = json.loads(text)
+        except ValueError:
+            return # Empty or corrupted state, using own.
+        for name in self.STATE_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+    def _refill(self, now):
+        if self._reset_time is not None:
+            if now >= self._reset_time:
+                self._tokens = self.capacity + min(self._tokens, 0)
+                self._reset_time = None
+        else:
+            rate = self.limit / self.period
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+    def _pace(self, now):
+        """ Returns delay that spreads remaining budget evenly
+        when it is running low.
+        """
+        low_budget = self.capacity * self.LOW_BUDGET
+        if self._tokens >= low_budget:
+            return 0
+        if self._reset_time is not None:
+            return (self._reset_time - now) / (self._tokens + 1)
+        return (1 - self._tokens / low_budget) * self.period / self.limit
+    def get_delay(self, method):
+        """ Reserves budget for the next request.
+        Returns amount of seconds to wait before actually making it.
+        """
+        with self._locked():
+            now = time.time()
+            self._refill(now)
+            delay = self._blocked_until - now
+            if self._tokens < 1:
+                if self._reset_time is not None:
+                    delay = max(delay, self._reset_time - now)
+                else:
+                    delay = max(delay, (1 - self._tokens) * self.period / self.limit)
+            else:
+                delay = max(delay, self._pace(now))
+            self._tokens -= 1
+        logger.debug('Rate limit delay for {0}: {1}'.format(method.upper(), delay))
+        return delay
+    def wait_for(self, method):
+        """ Stops execution until request is allowed by the rate limit.
+        Does not freeze at all while there is enough budget.
+        """
+        delay = self.get_delay(method)
+        if delay > 0:
+            time.sleep(delay)
+    def update(self, headers=None):
+        """ Synchronizes budget with rate limit headers from server response.
+        Should be called right after actual remote request.
+        """
+        if not headers:
+            return
+        with self._locked():
+            now = time.time()
+            self._refill(now)
+            if headers.get('X-RateLimit-Limit'):
+                self.limit = int(headers['X-RateLimit-Limit'])
+            if headers.get('X-RateLimit-Reset'):
+                self._reset_time = _parse_rate_limit_time(headers['X-RateLimit-Reset'], now)
+            if headers.get('X-RateLimit-Remaining'):
+                self._tokens = min(self._tokens, float(headers['X-RateLimit-Remaining']))
+            if headers.get('Retry-After'):
+                blocked_until = _parse_rate_limit_time(headers['Retry-After'], now)
+                if blocked_until:
+                    self._blocked_until = max(self._blocked_until, blocked_until)
+
+class RetryBudget:
+    """ Limits total amount of retries made within a period of time,
+    so during server outage requests fail fast instead of piling up in retry loops.
+    Budget is refilled smoothly over time.
+    Thread-safe.
+    """
+    def __init__(self, retries=10, period=60.0):
+        """ Allows no more than `retries` retries per `period` seconds. """
+        self.retries = retries
+        self.period = period
+        self._lock = threading.Lock()
+        self._tokens = float(retries)
+        self._last_refill = time.time()
+    def withdraw(self):
+        """ Takes one retry from the budget.
+        Returns False if budget is exhausted.
+        """
+        with self._lock:
+            now = time.time()
+            rate = self.retries / self.period
+            self._tokens = min(self.retries, self._tokens + max(0, now - self._last_refill) * rate)
+            self._last_refill = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+PROCESS_RETRY_BUDGET = RetryBudget() # Shared by all API objects within process.
+
+class RetryPolicy:
+    """ Decides whether failed request should be retried and how long to wait before that.
+    Uses exponential backoff with full jitter, honours server's Retry-After
+    and withdraws every retry from retry budget.
+    Errors are classified per HTTP method: requests that could have already been processed
+    by server (e.g. read timeout, connection dropped after request was sent)
+    are retried only for idempotent methods.
+    """
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    RETRY_ALWAYS_STATUSES = (429, 502, 503) # Request was not processed.
+    RETRY_IDEMPOTENT_STATUSES = (500, 504) # Request may have been processed.
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=30.0, budget=None):
+        """ Makes up to `max_retries` retries for a single request.
+        Delay before N-th retry is random value between zero and backoff_base * 2**N,
+        but no more than backoff_max.
+        If server asks to wait longer than backoff_max (Retry-After), request is not retried.
+        Default budget is shared by the whole process.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = budget if budget is not None else PROCESS_RETRY_BUDGET
+    def is_retryable(self, method, error):
+        """ Returns True if request with given method may be retried after given error. """
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        if self._is_connect_error(error):
+            return True # Request was not sent.
+        if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            return idempotent
+        if isinstance(error, requests.exceptions.HTTPError):
+            status_code = getattr(error.response, 'status_code', None)
+            if status_code in self.RETRY_ALWAYS_STATUSES:
+                return True
+            return idempotent and status_code in self.RETRY_IDEMPOTENT_STATUSES
+        return False
+    @staticmethod
+    def _is_connect_error(error):
+        """ Returns True if error happened while establishing connection,
+        i.e. request was not sent to server at all.
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if not isinstance(error, requests.exceptions.ConnectionError):
+            return False
+        reason = error.args[0] if error.args else None
+        if isinstance(reason, urllib3.exceptions.MaxRetryError):
+            reason = reason.reason
+        # NewConnectionError (e.g. connection refused, DNS failure) is a ConnectTimeoutError as well.
+        return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+    def get_delay(self, method, error, attempt):
+        """ Returns amount of seconds to wait before retrying request
+        that failed with given error on given attempt (starting from 0).
+        Returns None if request should not be retried.
         """
-        self._last_request_time = time.time()
+        if attempt >= self.max_retries or not self.is_retryable(method, error):
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        if headers.get('Retry-After'):
+            now = time.time()
+            retry_after = _parse_rate_limit_time(headers['Retry-After'], now)
+            if retry_after is not None:
+                if retry_after - now > self.backoff_max:
+                    logger.debug('Server asks to retry after {0}s, giving up.'.format(retry_after - now))
+                    return None
+                delay = max(delay, retry_after - now)
+        if not self.budget.withdraw():
+            logger.debug('Retry budget is exhausted.')
+            return None
+        return delay
+    def sleep(self, delay):
+        time.sleep(delay)
+
+class SingleFlight:
+    """ Coalesces identical concurrent calls:
+    while the first call for the key is in flight,
+    all other callers with the same key wait for its result
+    instead of performing the call again.
+    When there were waiting callers, each of them and the leader receive
+    their own deep copies of the result (made from the untouched original),
+    so they can modify it safely.
+    Re-entrant call with the same key from the thread that performs it
+    (e.g. from response hook) is performed directly instead of waiting for itself.
+    Thread-safe.
+    """
+    class _Call:
+        def __init__(self):
+            self.thread = threading.get_ident()
+            self.done = threading.Event()
+            self.waiters = 0
+            self.result = None
+            self.error = None
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+    def do(self, key, func, *args, **kwargs):
+        """ Calls func(*args, **kwargs) unless the call with the same key
+        is already in flight. Returns result or re-raises exception of the actual call.
+        """
+        call, is_leader = self._join(key)
+        if call is None:
+            return func(*args, **kwargs)
+        if not is_leader:
+            return self._wait(key, call)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._finish(key, call, error=e)
+            raise
+        return self._finish(key, call, result=result)
+    def _join(self, key):
+        """ Returns pair (call, True) if caller should perform the call,
+        (call, False) if it should wait for the call in flight
+        or (None, False) for re-entrant calls.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = self._Call()
+                return call, True
+            if call.thread == threading.get_ident():
+                return None, False
+            call.waiters += 1
+            return call, False
+    def _wait(self, key, call):
+        logger.debug('Waiting for in-flight call: {0}'.format(key))
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+    def _finish(self, key, call, result=None, error=None):
+        """ Releases waiting callers. Returns result for the leader. """
+        call.result, call.error = result, error
+        with self._lock:
+            del self._calls[key]
+            has_waiters = call.waiters > 0
+        call.done.set()
+        if has_waiters and error is None:
+            return copy.deepcopy(result)
+        return result
+
+class ValidatorCache:
+    """ Stores HTTP validators (ETag, Last-Modified) for GET requests,
+    so they can be revalidated with conditional requests (If-None-Match, If-Modified-Since).
+    Only requests that caller opted in for (see put()) are tracked:
+    along with validators caller provides a loader, callable that returns decoded response
+    (e.g. from disk cache) when server reports that it was not modified.
+    Response bodies are never kept by cache itself.
+    Keeps at most MAX_SIZE most recent entries.
+    Thread-safe.
+    """
+    MAX_SIZE = 64
+    Entry = collections.namedtuple('Entry', 'etag last_modified load')
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or self.MAX_SIZE
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+    def get(self, key):
+        """ Returns stored Entry or None. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    def put(self, key, etag, last_modified, load):
+        """ Starts tracking of validators for the key
+        with known validators (if any) and loader of response.
+        """
+        with self._lock:
+            self._entries[key] = self.Entry(etag, last_modified, load)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    def update(self, key, etag, last_modified):
+        """ Replaces validators (or clears them, if there are none) for tracked key.
+        Does nothing if key is not tracked.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry._replace(etag=etag, last_modified=last_modified)
+    def conditional_headers(self, key):
+        """ Returns dict of conditional request headers for stored entry
+        (empty if there is no entry for the key).
+        """
+        entry = self.get(key)
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['if-none-match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['if-modified-since'] = entry.last_modified
+        return headers
+
+def _plain(value):
+    """ Converts dict/list subclasses (e.g. dotdict) to plain builtin types recursively. """
+    if isinstance(value, dict):
+        return {key:_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+class LazySections(dotdict):
+    """ Dict which values are decoded from snapshot payload on the first access
+    (see Snapshot.load_lazy). Behaves as regular dotdict otherwise.
+    """
+    class _Section:
+        __slots__ = ('offset', 'size')
+        def __init__(self, offset, size):
+            self.offset, self.size = offset, size
+    def __init__(self, payload, sections):
+        super().__init__((key, self._Section(offset, size)) for key, (offset, size) in sections.items())
+        object.__setattr__(self, '_payload', payload)
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is LazySections._Section:
+            value = marshal.loads(self._payload[value.offset:value.offset + value.size])
+            dict.__setitem__(self, key, value)
+        return value
+    def __getattr__(self, attr):
+        if attr not in self:
+            return None
+        value = self[attr]
+        if type(value) is dict:
+            value = dotdict(value)
+            dict.__setitem__(self, attr, value)
+        return value
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    def __iter__(self): # Also disables fast copying of raw values by dict(...).
+        return dict.__iter__(self)
+    def values(self):
+        return [self[key] for key in self]
+    def items(self):
+        return [(key, self[key]) for key in self]
+    def __eq__(self, other):
+        return dict(self.items()) == other
+    def __ne__(self, other):
+        return not self == other
+    __hash__ = None
+    def __reduce__(self): # Copies and pickles are plain dotdicts with all sections decoded.
+        return dotdict, (dict(self.items()),)
+
+class Snapshot:
+    """ Versioned binary snapshot of JSON-like data on disk.
+    Layout: MAGIC, header size (4 bytes), header (JSON), payload (marshal).
+    Header contains format version and custom metadata (e.g. ETag of data).
+    Snapshot is written atomically and is loaded via memory mapping.
+    Snapshots of incompatible format are treated as missing.
+
+    Values of a nested dict (see save(_sections=...)) can be stored as separate sections,
+    so they can be decoded only on demand (see load_lazy()).
+    """
+    MAGIC = b'HABITICA-SNAPSHOT\n'
+    FORMAT_VERSION = 2
+
+    def __init__(self, path):
+        self.path = Path(path)
+    @classmethod
+    def _format(cls):
+        return [cls.FORMAT_VERSION, marshal.version, list(sys.version_info[:2])]
+    def _read(self, with_data, lazy=False):
+        try:
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(self.MAGIC)] != self.MAGIC:
+                    return None
+                offset = len(self.MAGIC)
+                header_size, = struct.unpack_from('>I', mm, offset)
+                offset += 4
+                header = json.loads(mm[offset:offset + header_size])
+                if header.get('format') != self._format():
+                    return None
+                if not with_data:
+                    return header['meta'], None
+                offset += header_size
+                if len(mm) - offset != header['size']:
+                    return None
+                if lazy: # Sections are decoded later, so payload should outlive the mapping.
+                    payload = mm[offset:]
+                    data = marshal.loads(payload[:header['main']])
+                    if header['sections_path'] is not None:
+                        self._replace_at(data, header['sections_path'], LazySections(payload, header['sections']))
+                    return header['meta'], data
+                with memoryview(mm) as view, view[offset:] as payload:
+                    data = marshal.loads(payload[:header['main']])
+                    if header['sections_path'] is not None:
+                        self._replace_at(data, header['sections_path'], {
+                            key : marshal.loads(payload[section_offset:section_offset + size])
+                            for key, (section_offset, size) in header['sections'].items()
+                            })
+                    return header['meta'], data
+        except (OSError, ValueError, EOFError, KeyError, struct.error):
+            return None
+    @staticmethod
+    def _replace_at(data, path, value):
+        for key in path[:-1]:
+            data = data[key]
+        data[path[-1]] = value
+    def meta(self):
+        """ Returns snapshot metadata without loading the data.
+        Returns None if snapshot is missing or incompatible.
+        """
+        result = self._read(with_data=False)
+        return result[0] if result else None
+    def load(self):
+        """ Returns pair (meta, data) or None if snapshot is missing or incompatible. """
+        return self._read(with_data=True)
+    def load_lazy(self):
+        """ Returns pair (meta, data) or None if snapshot is missing or incompatible.
+        Sections (if any) are decoded only on the first access (see LazySections).
+        """
+        return self._read(with_data=True, lazy=True)
+    def mtime(self):
+        return self.path.stat().st_mtime
+    def touch(self):
+        self.path.touch()
+    def save(self, data, _sections=None, **meta):
+        """ Atomically replaces snapshot with given data and metadata.
+        If _sections is given (sequence of keys, path to nested dict in data),
+        values of that dict are stored as separate sections.
+        """
+        data = _plain(data)
+        sections = {}
+        section_payloads = []
+        if _sections is not None:
+            nested = data
+            for key in _sections:
+                nested = nested[key]
+            self._replace_at(data, list(_sections), {})
+            main = marshal.dumps(data)
+            offset = len(main)
+            for key, value in nested.items():
+                section_payloads.append(marshal.dumps(value))
+                sections[key] = [offset, len(section_payloads[-1])]
+                offset += len(section_payloads[-1])
+        else:
+            main = marshal.dumps(data)
+        header = json.dumps({
+            'format' : self._format(),
+            'meta' : meta,
+            'main' : len(main),
+            'sections_path' : list(_sections) if _sections is not None else None,
+            'sections' : sections,
+            'size' : len(main) + sum(map(len, section_payloads)),
+            }).encode('utf-8')
+        fd, temp_name = tempfile.mkstemp(dir=str(self.path.parent), prefix=self.path.name + '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.MAGIC)
+                f.write(struct.pack('>I', len(header)))
+                f.write(header)
+                f.write(main)
+                for payload in section_payloads:
+                    f.write(payload)
+            os.replace(temp_name, str(self.path))
+        except:
+            os.unlink(temp_name)
+            raise
+
+class CassetteMiss(requests.exceptions.RequestException):
+    """ Raised in replay mode when cassette has no recorded response for the request. """
+
+class Cassette:
+    """ Recorded HTTP interactions (requests and responses), stored in gzipped JSON file.
+    In record mode every request made via API is performed for real
+    and saved along with its response (auth headers are scrubbed).
+    In replay mode responses are served from the file without network access.
+    Requests are matched by method, URL and body;
+    repeated identical requests get recorded responses in the same order
+    (the last one is served again when all of them are used).
+    >>> API(base_url, login, password, cassette=Cassette('user.cassette', Cassette.RECORD))
+    >>> API(base_url, login, password, cassette=Cassette('user.cassette', latency=True))
+    """
+    RECORD, REPLAY = 'record', 'replay'
+    FORMAT_VERSION = 1
+    SCRUBBED_HEADERS = ('x-api-user', 'x-api-key', 'authorization', 'cookie', 'set-cookie')
+    SKIPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding') # Body is stored decoded.
+
+    def __init__(self, path, mode=REPLAY, latency=None):
+        """ Latency (replay mode only) is either fixed amount of seconds to wait before each response
+        or True to use actual response times that were recorded.
+        """
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError('Unknown cassette mode: {0}'.format(mode))
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._played = collections.Counter()
+        if mode == self.REPLAY:
+            self.load()
+    def load(self):
+        with gzip.open(str(self.path), 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != self.FORMAT_VERSION:
+            raise ValueError('Unsupported cassette format version: {0}'.format(data.get('version')))
+        self.interactions = data['interactions']
+    def save(self):
+        """ Atomically writes all recorded interactions to the file. """
+        fd, temp_name = tempfile.mkstemp(dir=str(self.path.parent), prefix=self.path.name + '.')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                with self._lock:
+                    data = {'version':self.FORMAT_VERSION, 'interactions':self.interactions}
+                    f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            os.replace(temp_name, str(self.path))
+        except:
+            os.unlink(temp_name)
+            raise
+    @staticmethod
+    def _encode_body(body):
+        if body is None:
+            return None
+        if isinstance(body, str):
+            return body
+        try:
+            return bytes(body).decode('utf-8')
+        except UnicodeDecodeError:
+            return {'base64' : base64.b64encode(body).decode('ascii')}
+    @staticmethod
+    def _decode_body(body):
+        if body is None:
+            return b''
+        if isinstance(body, dict):
+            return base64.b64decode(body['base64'])
+        return body.encode('utf-8')
+    def _headers(self, headers):
+        return {name:('<scrubbed>' if name.lower() in self.SCRUBBED_HEADERS else value)
+                for name, value in headers.items()
+                if name.lower() not in self.SKIPPED_HEADERS
+                }
+    def _key(self, request):
+        return (request.method.upper(), request.url, self._encode_body(request.body))
+    def record(self, request, response):
+        """ Stores request and (already read) response. """
+        with self._lock:
+            self.interactions.append({
+                'request' : {
+                    'method' : request.method.upper(),
+                    'url' : request.url,
+                    'headers' : self._headers(request.headers),
+                    'body' : self._encode_body(request.body),
+                    },
+                'response' : {
+                    'status' : response.status_code,
+                    'reason' : response.reason,
+                    'headers' : self._headers(response.headers),
+                    'body' : self._encode_body(response.content),
+                    'elapsed' : response.elapsed.total_seconds(),
+                    },
+                })
+    def play(self, request):
+        """ Returns recorded response for the request.
+        Raises CassetteMiss if there is no such request in the cassette.
+        """
+        key = self._key(request)
+        with self._lock:
+            matched = [interaction for interaction in self.interactions
+                    if (interaction['request']['method'], interaction['request']['url'], interaction['request']['body']) == key
+                    ]
+            if not matched:
+                raise CassetteMiss('Request is not found in cassette {0}: {1} {2}'.format(self.path, request.method, request.url), request=request)
+            index = min(self._played[key], len(matched) - 1)
+            self._played[key] += 1
+        recorded = matched[index]['response']
+        latency = self.latency
+        if latency is True:
+            latency = recorded.get('elapsed', 0)
+        if latency:
+            time.sleep(latency)
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded['reason']
+        response.headers = requests.structures.CaseInsensitiveDict(recorded['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(self._decode_body(recorded['body']))
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(seconds=latency or 0)
+        return response
+    def adapter(self, adapter):
+        """ Returns transport adapter for requests.Session
+        that records/replays requests, wrapping actual transport adapter.
+        """
+        return CassetteAdapter(self, adapter)
+
+class CassetteAdapter(requests.adapters.BaseAdapter):
+    """ Transport adapter for requests.Session that works via Cassette. """
+    def __init__(self, cassette, adapter):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+    def send(self, request, stream=False, **kwargs):
+        if self.cassette.mode == Cassette.REPLAY:
+            return self.cassette.play(request)
+        response = self.adapter.send(request, stream=False, **kwargs)
+        response.content # Reads the whole body, so it can be recorded and then read again.
+        self.cassette.record(request, response)
+        return response
+    def close(self):
+        self.adapter.close()
+        if self.cassette.mode == Cassette.RECORD:
+            self.cassette.save()
 
 class API(object):
-    """ Basic API facade. """
+    """ Basic API facade.
+    Owns single persistent HTTP session with connection pool,
+    which is shared between all calls (including APIv4 and cached calls).
+    Can be used as a context manager to release pooled connections:
+    >>> with API(base_url, login, password) as api:
+    ...     api.get('user')
+    Thread-safe: single API object can be shared between threads,
+    rate limit budget is shared between all of them.
+    """
     TIMEOUT = 10.0 # Call timeout.
     MAX_RETRY = 3 # Amount of retries for server errors (5xx, timeouts etc).
+    RETRY_BACKOFF = 0.5 # Base delay (seconds) for exponential backoff between retries.
+    RETRY_BACKOFF_MAX = 30.0 # Max delay between retries.
+    RATE_LIMIT = 30 # Max amount of requests per RATE_LIMIT_PERIOD (as stated by Habitica API docs).
+    RATE_LIMIT_PERIOD = 60.0 # Seconds.
+    BATCH_BURST = 10 # Max amount of consequent requests without delay in batch mode.
+    POOL_CONNECTIONS = 4 # Amount of hosts to keep connection pools for.
+    POOL_MAXSIZE = 10 # Max amount of connections to keep per host.
+    MAX_WORKERS = 4 # Max amount of concurrent requests in map().
     Delay = Delay
+    RateLimiter = RateLimiter
+    RetryPolicy = RetryPolicy
 
     class Exception(Exception):
         """ Basic API exception.
@@ -105,23 +878,74 @@ class API(object):
                     raise exc()
             raise
 
-    class Cached: # pragma: no cover -- TODO uses external FS cache and invalidation by time.
+    class Cached:
+        """ Cached API calls.
+        Responses are stored in binary snapshots (see Snapshot) in cache dir.
+        Snapshot is revalidated periodically using ETag/Last-Modified
+        and is kept only when server responds with 304 Not Modified,
+        otherwise it is replaced with the fresh response.
+        Each top-level entry of cached response data is decoded only on the first access.
+        """
+        REVALIDATE_AFTER = 60*60 # Seconds.
         def __init__(self, api, cache_entry_name):
             self.api = api
             self.name = cache_entry_name
+        @property
+        def snapshot(self):
+            return Snapshot(Path(config.get_cache_dir())/("{0}.cache".format(self.name)))
+        def sidecar(self, name):
+            """ Returns snapshot for derived data (e.g. indexes)
+            stored next to the cache entry.
+            """
+            return Snapshot(Path(config.get_cache_dir())/("{0}.{1}.cache".format(self.name, name)))
+        def version(self):
+            """ Returns version of cached data (ETag or Last-Modified) or None. """
+            meta = self.snapshot.meta()
+            if not meta:
+                return None
+            return meta.get('etag') or meta.get('last_modified')
         def _cached_request(self, method, *args, **kwargs):
-            cache_file = Path(config.get_cache_dir())/("{0}.cache.json".format(self.name))
+            snapshot = self.snapshot
             logger.debug("Using cache entry '{0}'".format(self.name))
-            invalidated = not cache_file.exists() or time.time() > cache_file.stat().st_mtime + 60*60*24 # TODO how to invalidate Habitica content cache
-            if invalidated and self.api._inside_response_hook:
+            meta = snapshot.meta()
+            invalidated = meta is None or time.time() > snapshot.mtime() + self.REVALIDATE_AFTER
+            if invalidated and meta is not None and self.api._inside_response_hook:
                 invalidated = False # Protection from direct API calls within response hook.
-            if invalidated:
-                logger.debug("Cache was invalid, making actual request...")
-                data = getattr(self.api, method)(*args, **kwargs)
-                cache_file.write_text(json.dumps(data))
-            else:
+            if not invalidated:
                 logger.debug("Cache was still valid, loading cached data...")
-                data = dotdict(json.loads(cache_file.read_text()))
+                loaded = snapshot.load_lazy()
+                if loaded is not None:
+                    return dotdict(loaded[1])
+            logger.debug("Cache was invalid, making actual request...")
+            validator_key = None
+            if method == 'get':
+                query = {key:value for key, value in kwargs.items() if key != '_as_json'}
+                validator_key = self.api._call_key('GET', self.api.get_url(*args), query, kwargs.get('_as_json', True))
+            not_modified = []
+            def _load_snapshot():
+                # Called by API only when server responds with 304 Not Modified.
+                not_modified.append(True)
+                return snapshot.load_lazy()[1]
+            if validator_key:
+                # Revalidating existing snapshot (if any) instead of downloading it again.
+                # Snapshot is the only copy of data needed for that.
+                self.api._validators.put(validator_key,
+                        meta.get('etag') if meta else None,
+                        meta.get('last_modified') if meta else None,
+                        _load_snapshot,
+                        )
+            data = getattr(self.api, method)(*args, **kwargs)
+            if not_modified:
+                logger.debug("Cache was not modified.")
+                snapshot.touch()
+            else:
+                entry = self.api._validators.get(validator_key) if validator_key else None
+                snapshot.save(data,
+                        # Top-level entries of data are decoded on demand (see Snapshot.load_lazy).
+                        _sections=('data',) if isinstance(data.get('data'), dict) else None,
+                        etag=entry.etag if entry else None,
+                        last_modified=entry.last_modified if entry else None,
+                        )
             return data
         def get(self, *args, **kwargs):
             return self._cached_request('get', *args, **kwargs)
@@ -159,13 +983,39 @@ class API(object):
         def __getattr__(self, attr): # pragma: no cover
             return getattr(self.api, attr)
 
-    def __init__(self, base_url, login, password, batch_mode=True):
+    def __init__(self, base_url, login, password, batch_mode=True,
+            pool_connections=None, pool_maxsize=None, pool_block=False,
+            keep_alive=True, shared_rate_limit=True, journal=None, cassette=None):
         """ Creates authenticated API instance.
-        If batch_mode is True (default), introduces significant delays
-        between consequent requests to reduce load on Habitica server.
-        Otherwise (for user input) uses default nominal delay <1 sec.
+        Requests are rate limited (see RateLimiter) according to Habitica rate limits,
+        synchronizing with actual rate limit headers from server responses.
+        If batch_mode is True (default), only short bursts of requests are allowed
+        and longer series of requests are spread in time
+        to reduce load on Habitica server.
+
+        Connection pool settings:
+        - pool_connections: amount of hosts to keep pools for (default is API.POOL_CONNECTIONS);
+        - pool_maxsize: max amount of connections per host (default is API.POOL_MAXSIZE);
+        - pool_block: if True, no more than pool_maxsize connections per host
+          are opened, calls will wait for free connection instead;
+        - keep_alive: if False, connections are closed after each request.
+
+        If shared_rate_limit is True (default), rate limit budget is shared
+        between all processes on this machine that use the same account
+        (state is stored in the cache dir).
+
+        If journal is given (see habitica.journal.Journal), API works in write-behind mode:
+        calls that support it (e.g. scoring tasks) are only appended to the journal
+        and should be replayed later via journal.flush(api).
+
+        If cassette is given (see Cassette), all HTTP requests are recorded to
+        or replayed from it. Recorded cassette is saved when API is closed.
+        Replay does not wait for rate limiter and does not touch shared rate limit state,
+        so replayed runs are deterministic.
         """
         self.base_url = base_url.rstrip('/')
+        self.journal = journal
+        self.cassette = cassette
         self.login = login
         self.password = password
         self.headers = {
@@ -174,25 +1024,97 @@ class API(object):
               'x-client': USER_ID + '-habitica', # TODO take appName from package?
               'content-type': 'application/json',
               }
+        if not keep_alive:
+            self.headers['connection'] = 'close'
+        self.pool_connections = pool_connections or self.POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or self.POOL_MAXSIZE
+        self.pool_block = pool_block
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._inflight = SingleFlight()
+        self._async_inflight = {} # {(event loop, call key): task}, see AsyncAPI.call
+        self._async_inflight_lock = threading.Lock()
+        self._validators = ValidatorCache()
+        self._retry_policy = self.RetryPolicy(self.MAX_RETRY,
+                backoff_base=self.RETRY_BACKOFF, backoff_max=self.RETRY_BACKOFF_MAX,
+                )
         self._response_hook = None
-        self._inside_response_hook = False
-        if batch_mode:
+        self._mutation_hook = None
+        self._local = threading.local()
+        state_file = None
+        if shared_rate_limit and not self._replaying:
+            state_file = Path(config.get_cache_dir())/('{0}.ratelimit'.format(login))
+        if self._replaying:
+            # Replayed responses are not served by Habitica, so there is nothing to throttle.
+            self._delay = Delay(0)
+        elif batch_mode:
             # Third-party API tools should introduce delays between calls
             # to reduce load on Habitica server.
             # See https://habitica.fandom.com/wiki/Template:Third_Party_Tool_Rules?section=T-4
-            self._delay = self.Delay(1,
-                    get=3,
-                    post=10, put=10, delete=10,
+            self._delay = self.RateLimiter(self.RATE_LIMIT, self.RATE_LIMIT_PERIOD,
+                    burst=self.BATCH_BURST, state_file=state_file,
                     )
         else:
-            self._delay = self.Delay(0.5)
+            self._delay = self.RateLimiter(self.RATE_LIMIT, self.RATE_LIMIT_PERIOD,
+                    state_file=state_file,
+                    )
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    @property
+    def _replaying(self):
+        """ True if responses are served from cassette instead of network. """
+        return self.cassette is not None and self.cassette.mode == Cassette.REPLAY
+    @property
+    def _inside_response_hook(self):
+        """ True if response hook is being called in current thread. """
+        return getattr(self._local, 'inside_response_hook', False)
+    @_inside_response_hook.setter
+    def _inside_response_hook(self, value):
+        self._local.inside_response_hook = value
+    @property
+    def session(self):
+        """ Persistent HTTP session with connection pool.
+        Created on the first actual request.
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+    def _create_session(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block,
+                max_retries=0, # Retries are handled by RetryPolicy.
+                )
+        if self.cassette is not None:
+            adapter = self.cassette.adapter(adapter)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    def close(self):
+        """ Closes all pooled connections.
+        API object is still usable afterwards, new session will be created on demand.
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
-    def cached(self, cache_entry_name): # pragma: no cover -- TODO see Cached class above.
+    def cached(self, cache_entry_name):
         return API.Cached(self, cache_entry_name)
 
     @property
     def v4(self):
         return self.APIv4(self)
+    @property
+    def aio(self):
+        """ Asyncio counterpart of this API (see AsyncAPI). """
+        return AsyncAPI(self)
 
     def set_response_hook(self, hook_function): # pragma: no cover -- TODO
         """ Sets hook that accepts full response object
@@ -201,6 +1123,21 @@ class API(object):
         Return value is not checked.
         """
         self._response_hook = hook_function
+    def set_mutation_hook(self, hook_function):
+        """ Sets hook (without arguments) that is called after every mutating call
+        (anything but GET), even failed one, as changes could be applied on server anyway.
+        Should be also triggered for calls that are postponed to write-behind journal
+        (see notify_mutation).
+        """
+        self._mutation_hook = hook_function
+    def notify_mutation(self):
+        """ Calls mutation hook (if any): data on server is (or is going to be) changed. """
+        if not self._mutation_hook:
+            return
+        try:
+            self._mutation_hook()
+        except:
+            logger.exception('Exception in custom API mutation hook!')
     def get_url(self, *parts):
         """ Makes URL to call specified .../subpath/of/parts. """
         return '/'.join([self.base_url, 'api', 'v3'] + list(parts))
@@ -234,55 +1171,115 @@ class API(object):
         """
         uri = self.get_url(*path)
         return self.call('GET', uri, query=query, as_json=_as_json)
+    def map(self, paths, max_workers=None, **query):
+        """ Performs GET for each of /specified/sub/paths/ (sequences of parts)
+        concurrently on a bounded thread pool (default size is API.MAX_WORKERS).
+        Kwargs are passed as query params to every call.
+        All calls are subject to the same rate limit as any other call.
+        Returns list of responses in the order of paths.
+        If any call fails, its exception is re-raised after all calls are finished.
+        >>> api.map([('tasks', task_id) for task_id in task_ids])
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        max_workers = min(max_workers or self.MAX_WORKERS, len(paths))
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(self.get, *path, **query) for path in paths]
+        return [future.result() for future in futures]
     def call(self, method, uri, query=None, body=None, as_json=True):
         """ Performs actual call to URI using given method (GET/POST/PUT/DELETE etc).
         Data should correspond to specified method.
         Query is a dict and is passed as query params.
         Body is a dict and is passed as body params (JSON-encoded).
         May raise exceptions from requests.
-        May freeze for several seconds to ensure delay between requests
-        (see POST_AUTO_REQUEST_DELAY, GET_AUTO_REQUEST_DELAY)
+        May freeze for several seconds when rate limit is reached
+        (see RateLimiter)
+        Identical concurrent GET requests are coalesced into a single actual request
+        (see SingleFlight).
         """
-        self._delay.wait_for(method)
-        return self._retry_call(method, uri, query=query, body=body, as_json=as_json)
-    def _retry_call(self, method, uri, query=None, body=None, as_json=True, tries=MAX_RETRY):
+        if method.upper() == 'GET':
+            return self._inflight.do(self._call_key(method, uri, query, as_json),
+                    self._throttled_call, method, uri, query=query, body=body, as_json=as_json,
+                    )
         try:
-            logger.debug('Sending {0} {1}'.format(method.upper(), uri))
-            logger.debug('Query: {0}'.format(query))
-            logger.debug('Body: {0}'.format(body))
-            return self._direct_call(method, uri, query=query, body=body, as_json=as_json)
-        except requests.exceptions.ReadTimeout as e:
-            if tries <= 0:
-                raise
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code not in [502]:
-                raise
-            if tries <= 0:
-                raise
-        except requests.exceptions.ConnectionError as e:
-            if tries <= 0:
-                raise
-        return self._retry_call(method, uri, query=query, body=body, as_json=as_json, tries=tries-1)
+            return self._throttled_call(method, uri, query=query, body=body, as_json=as_json)
+        finally:
+            self.notify_mutation()
+    @staticmethod
+    def _call_key(method, uri, query, as_json):
+        return (method.upper(), uri, json.dumps(query or {}, sort_keys=True, default=str), as_json)
+    def _throttled_call(self, method, uri, query=None, body=None, as_json=True):
+        return self._retry_call(method, uri, query=query, body=body, as_json=as_json)
+    def _retry_call(self, method, uri, query=None, body=None, as_json=True, _throttled=False):
+        """ Performs call, retrying it according to RetryPolicy.
+        Every attempt waits for its turn in rate limiter (see RateLimiter),
+        so retries are accounted in shared rate limit state as well.
+        If _throttled is True, caller has already waited for the first attempt.
+        """
+        attempt = 0
+        while True:
+            if attempt > 0 or not _throttled:
+                self._delay.wait_for(method)
+            try:
+                logger.debug('Sending {0} {1}'.format(method.upper(), uri))
+                logger.debug('Query: {0}'.format(query))
+                logger.debug('Body: {0}'.format(body))
+                return self._direct_call(method, uri, query=query, body=body, as_json=as_json)
+            except requests.exceptions.RequestException as e:
+                delay = self._retry_policy.get_delay(method, e, attempt)
+                if delay is None:
+                    raise
+                logger.debug('Retrying after {0}: {1}'.format(delay, repr(e)))
+                self._retry_policy.sleep(delay)
+                attempt += 1
     def _direct_call(self, method, uri, query=None, body=None, as_json=True):
-        """ Direct call without any retry/timeout checks. """
-        session = requests.Session()
-        retries = urllib3.util.retry.Retry(total=5, backoff_factor=0.1)
-        session.mount('https://', requests.adapters.HTTPAdapter(max_retries=retries))
-
+        """ Direct call without any retry/timeout checks.
+        GET requests that caller opted in for (see ValidatorCache.put)
+        are conditional if validators (ETag, Last-Modified) of previous response are known,
+        in this case caller's loader of previous content is used if server responds with 304 Not Modified.
+        """
+        session = self.session
+        validator_key = None
         if method.upper() in ['PUT', 'POST', 'DELETE']:
-            response = getattr(session, method.lower())(uri, headers=self.headers,
+            http_response = getattr(session, method.lower())(uri, headers=self.headers,
                     params=query, data=json.dumps(body or {}), timeout=API.TIMEOUT)
         else:
-            response = getattr(session, method.lower())(uri, headers=self.headers,
-                                            params=query, timeout=API.TIMEOUT)
-        self._delay.update()
-        logger.debug('Answered: {0} {1}'.format(response.status_code, response.reason))
-        if response.status_code != requests.codes.ok:
-            logger.debug('Responded with error: {0}'.format(response.content))
-            response.raise_for_status()
-        if as_json:
-            response = response.json()
-        logger.debug('Response: {0}'.format(json.dumps(response, indent=2, sort_keys=True)))
+            headers = self.headers
+            if as_json:
+                validator_key = self._call_key(method, uri, query, as_json)
+                headers = dict(self.headers, **self._validators.conditional_headers(validator_key))
+            http_response = getattr(session, method.lower())(uri, headers=headers,
+                                            params=query, timeout=API.TIMEOUT,
+                                            stream=as_json)
+        response = http_response
+        try:
+            if not self._replaying: # Recorded rate limit headers are stale.
+                self._delay.update(response.headers)
+            logger.debug('Answered: {0} {1}'.format(response.status_code, response.reason))
+            not_modified = None
+            if response.status_code == requests.codes.not_modified and validator_key:
+                not_modified = self._validators.get(validator_key)
+            if not_modified:
+                logger.debug('Not modified, using previous content.')
+                response = not_modified.load()
+            elif response.status_code != requests.codes.ok:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('Responded with error: {0}'.format(response.content))
+                response.raise_for_status()
+                if as_json:
+                    response = response.json(object_hook=dotdict)
+            elif as_json:
+                if validator_key:
+                    self._validators.update(validator_key,
+                            response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                            )
+                response = decode_json_stream(response)
+        finally:
+            if as_json:
+                http_response.close()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Response: {0}'.format(json.dumps(response, indent=2, sort_keys=True)))
         if self._response_hook and not self._inside_response_hook: # pragma: no cover -- TODO
             try:
                 self._inside_response_hook = True
@@ -291,4 +1288,112 @@ class API(object):
                 logger.exception('Exception in custom API response hook!')
             finally:
                 self._inside_response_hook = False
+        if isinstance(response, dotdict):
+            return response
         return dotdict(response)
+
+class AsyncAPI(object):
+    """ Asyncio facade for API: all calls are coroutines.
+    Wraps existing API object, so connection pool, delays between requests
+    and response hook are shared with it.
+    Blocking HTTP calls are performed in executor threads,
+    delays between requests are awaited without blocking event loop.
+    >>> user = (await api.aio.get('user')).data
+    """
+    APIv4 = API.APIv4
+
+    def __init__(self, api, executor=None):
+        """ Wraps given API object.
+        Executor is passed to loop.run_in_executor(), default executor is used if None.
+        """
+        self.api = api
+        self.executor = executor
+    @property
+    def v4(self):
+        return self.APIv4(self)
+    async def post(self, *path, _body=None, **kwargs):
+        """ Coroutine version of API.post() """
+        uri = self.get_url(*path)
+        return await self.call('POST', uri, body=_body, query=kwargs)
+    async def put(self, *path, _body=None, **kwargs):
+        """ Coroutine version of API.put() """
+        uri = self.get_url(*path)
+        return await self.call('PUT', uri, body=_body, query=kwargs)
+    async def delete(self, *path, **query):
+        """ Coroutine version of API.delete() """
+        uri = self.get_url(*path)
+        return await self.call('DELETE', uri, query=query)
+    async def get(self, *path, _as_json=True, **query):
+        """ Coroutine version of API.get() """
+        uri = self.get_url(*path)
+        return await self.call('GET', uri, query=query, as_json=_as_json)
+    async def call(self, method, uri, query=None, body=None, as_json=True):
+        """ Coroutine version of API.call()
+        Identical concurrent GET requests are coalesced
+        both with other coroutines and with other threads,
+        and only the call that is actually performed waits for rate limiter.
+        """
+        if method.upper() != 'GET':
+            try:
+                return await self._throttled_call(method, uri, query=query, body=body, as_json=as_json)
+            finally:
+                self.api.notify_mutation()
+        key = self.api._call_key(method, uri, query, as_json)
+        loop_key = (asyncio.get_running_loop(), key)
+        inflight, lock = self.api._async_inflight, self.api._async_inflight_lock
+        with lock:
+            entry = inflight.get(loop_key)
+            is_leader = entry is None
+            if is_leader:
+                task = asyncio.ensure_future(self._coalesced_call(key, method, uri, query=query, body=body, as_json=as_json))
+                entry = inflight[loop_key] = [task, 0]
+            else:
+                entry[1] += 1
+        task = entry[0]
+        if is_leader:
+            def _forget(_):
+                with lock:
+                    if inflight.get(loop_key) is entry:
+                        del inflight[loop_key]
+            task.add_done_callback(_forget)
+        result = await asyncio.shield(task)
+        with lock:
+            has_waiters = entry[1] > 0
+            if inflight.get(loop_key) is entry:
+                del inflight[loop_key] # No new waiters once result is handed out.
+        if is_leader and not has_waiters:
+            return result
+        return copy.deepcopy(result)
+    async def _coalesced_call(self, key, method, uri, query=None, body=None, as_json=True):
+        """ Joins identical call in flight in other threads (see SingleFlight)
+        or performs it, waiting for rate limiter only in the latter case.
+        """
+        single_flight = self.api._inflight
+        call, is_leader = single_flight._join(key)
+        if call is None: # pragma: no cover -- re-entrant sync call from event loop thread.
+            return await self._throttled_call(method, uri, query=query, body=body, as_json=as_json)
+        if not is_leader:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, single_flight._wait, key, call)
+        try:
+            result = await self._throttled_call(method, uri, query=query, body=body, as_json=as_json, _call=call)
+        except BaseException as e:
+            single_flight._finish(key, call, error=e)
+            raise
+        return single_flight._finish(key, call, result=result)
+    async def _throttled_call(self, method, uri, query=None, body=None, as_json=True, _call=None):
+        """ Waits for rate limiter without blocking event loop,
+        then performs call in executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        # Rate limiter state may be shared via locked file, so it is accessed in executor too.
+        delay = await loop.run_in_executor(self.executor, self.api._delay.get_delay, method)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        def _perform():
+            if _call is not None: # Re-entrant calls from response hook should not wait for themselves.
+                _call.thread = threading.get_ident()
+            return self.api._retry_call(method, uri, query=query, body=body, as_json=as_json, _throttled=True)
+        return await loop.run_in_executor(self.executor, _perform)
+    def __getattr__(self, attr):
+        return getattr(self.api, attr)
@@ -27,6 +27,8 @@ from . import api, core
 from .core import Habitica, Group
 from . import timeutils, config
 from . import extra
+from . import journal
+from . import mirror
 
 logging.PRINT = (logging.INFO + logging.WARNING)//2
 logging.addLevelName(logging.PRINT, 'PRINT')
@@ -182,19 +184,75 @@ class PrintEventHandler(core.base.EventHandler): # pragma: no cover
 		if self._enabled:
 			print(str(event), file=sys.stderr)
 
+def score_tasks(user, tasks, direction): # pragma: no cover
+	""" Scores tasks ('up' or 'down'; for checkable tasks means complete/undo).
+	Several tasks are scored at once with a single bulk request.
+	"""
+	if len(tasks) > 1:
+		user.score_many([(task, direction) for task in tasks])
+		return
+	for task in tasks:
+		if isinstance(task, core.Habit):
+			task.up() if direction == 'up' else task.down()
+		elif direction == 'up':
+			task.complete()
+		else:
+			task.undo()
+
 @click.group()
 @click.version_option(version=VERSION)
 @click.option('-q', '--quiet', is_flag=True, help='Hide any normal output, show only warnings and errors.')
 @click.option('-v', '--verbose', is_flag=True, help='Show some logging information')
 @click.option('-d', '--debug', is_flag=True, help='Show all logging information')
 @click.option('--notifications/--no-notifications', default=True, help='Display notifications from Habitica (prints to stderr). By default is enabled.')
+@click.option('--write-behind', is_flag=True, help='Do not wait for task scoring: store it in local journal and send to Habitica in background.')
+@click.option('--record-cassette', type=click.Path(dir_okay=False), help='Record all HTTP requests and responses (without auth data) to specified file.')
+@click.option('--replay-cassette', type=click.Path(exists=True, dir_okay=False), help='Serve HTTP responses from previously recorded file instead of network.')
+@click.option('--mirror', 'use_mirror', is_flag=True, help='List tasks and tags from local mirror of account and sync it in background when it is stale.')
+@click.option('--cassette-latency', help="Simulated latency for replayed responses: seconds or 'recorded' to use actual recorded response times. By default there is no latency.")
 @click.pass_context
-def cli(ctx, quiet=False, verbose=False, debug=False, notifications=False): # pragma: no cover
+def cli(ctx, quiet=False, verbose=False, debug=False, notifications=False, write_behind=False,
+		record_cassette=None, replay_cassette=None, cassette_latency=None, use_mirror=False,
+		): # pragma: no cover
 	""" Habitica command-line interface. """
+	cassette = None
+	if record_cassette and replay_cassette:
+		raise click.UsageError('Only one of --record-cassette, --replay-cassette could be specified')
+	elif record_cassette:
+		cassette = api.Cassette(record_cassette, api.Cassette.RECORD)
+	elif replay_cassette:
+		latency = None
+		if cassette_latency == 'recorded':
+			latency = True
+		elif cassette_latency:
+			latency = float(cassette_latency)
+		cassette = api.Cassette(replay_cassette, latency=latency)
+	write_behind_journal = journal.Journal() if write_behind else None
+	auth = config.load_auth()
+	remote = api.API(auth['url'], auth['x-api-user'], auth['x-api-key'],
+			journal=write_behind_journal, cassette=cassette,
+			)
+	ctx.call_on_close(remote.close) # Also saves recorded cassette.
+	account_mirror = mirror.Mirror(login=auth['x-api-user']) if use_mirror else None
 	# Click's context object is authenticated Habitica endpoint.
-	ctx.obj = Habitica(auth=config.load_auth(), event_handler=PrintEventHandler())
+	ctx.obj = Habitica(event_handler=PrintEventHandler(), _api=remote, mirror=account_mirror)
+	if account_mirror:
+		def _sync_in_background():
+			# Changes made by command invalidate mirror as well.
+			# Command does not wait for sync, fresh data will be used by the next ones.
+			if account_mirror.is_stale():
+				mirror.spawn_syncer()
+		ctx.call_on_close(_sync_in_background)
 	if not notifications or quiet:
 		ctx.obj.events.printing_enabled(False)
+	if write_behind_journal:
+		conflicts = write_behind_journal.conflicts()
+		if conflicts:
+			logger.warning('{0} journaled call(s) were rejected by Habitica, see `habitica journal`.'.format(len(conflicts)))
+		def _flush_in_background():
+			if write_behind_journal.pending():
+				journal.spawn_flusher()
+		ctx.call_on_close(_flush_in_background)
 
 	if not logger.handlers:
 		handler = logging.StreamHandler(sys.stdout)
@@ -215,7 +273,7 @@ def cli(ctx, quiet=False, verbose=False, debug=False, notifications=False): # pr
 def status(habitica): # pragma: no cover
 	""" Show HP, XP, GP, and more """
 	# gather status info
-	user = habitica.user()
+	user = habitica.user(fields=['stats', 'items.currentPet', 'items.currentMount', 'items.food'])
 	stats = user.stats
 
 	quest = user.party().quest
@@ -275,7 +333,7 @@ def reward(habitica, item=None, full=False): # pragma: no cover
 
 	If ITEM is not specified, lists all available items.
 	"""
-	user = habitica.user()
+	user = habitica.user(fields=['stats'])
 	rewards = user.rewards()
 	if item is None:
 		print_task_list(rewards)
@@ -316,13 +374,15 @@ def habits_up(habitica, tasks, full=False): # pragma: no cover
 	You can pass one or more <task-id> parameters, using either comma-separated lists or ranges or both. For example, `todos done 1,3,6-9,11`.
 	"""
 	habits = habitica.user.habits()
+	selected = []
 	for habit in filter_tasks(habits, tasks):
-		try:
-			habit.up()
-			logger.print('incremented task \'%s\'' % habit.text)
-		except CannotScoreUp as e:
-			logger.error(e)
+		if not habit.can_score_up:
+			logger.error(core.CannotScoreUp(habit))
 			continue
+		selected.append(habit)
+	score_tasks(habitica.user, selected, 'up')
+	for habit in selected:
+		logger.print('incremented task \'%s\'' % habit.text)
 	print_habits(habits, full=full)
 
 @habits.command('down')
@@ -335,13 +395,15 @@ def habits_down(habitica, tasks, full=False): # pragma: no cover
 	You can pass one or more <task-id> parameters, using either comma-separated lists or ranges or both. For example, `todos done 1,3,6-9,11`.
 	"""
 	habits = habitica.user.habits()
+	selected = []
 	for habit in filter_tasks(habits, tasks):
-		try:
-			habit.down()
-			logger.print('decremented task \'%s\'' % habit.text)
-		except CannotScoreDown as e:
-			logger.error(e)
+		if not habit.can_score_down:
+			logger.error(core.CannotScoreDown(habit))
 			continue
+		selected.append(habit)
+	score_tasks(habitica.user, selected, 'down')
+	for habit in selected:
+		logger.print('decremented task \'%s\'' % habit.text)
 	print_habits(habits, full=full)
 
 @cli.group(cls=click_default_group.DefaultGroup, default='list', default_if_no_args=True)
@@ -355,7 +417,7 @@ def dailies(habitica): # pragma: no cover
 @click.pass_obj
 def dailies_list(habitica, full=False, list_all=False): # pragma: no cover
 	""" List daily tasks """
-	user = habitica.user()
+	user = habitica.user(fields=['preferences.timezoneOffset'])
 	timezoneOffset = user.preferences.timezoneOffset
 	dailies = user.dailies()
 	print_task_list(dailies, hide_completed=not list_all, timezoneOffset=timezoneOffset, with_notes=full)
@@ -370,14 +432,15 @@ def dailies_done(habitica, tasks, full=False, list_all=False): # pragma: no cove
 
 	You can pass one or more <task-id> parameters, using either comma-separated lists or ranges or both. For example, `todos done 1,3,6-9,11`.
 	"""
-	user = habitica.user()
+	user = habitica.user(fields=['stats', 'preferences.timezoneOffset'])
 	timezoneOffset = user.preferences.timezoneOffset
 	dailies = user.dailies()
-	for task in filter_tasks(dailies, tasks):
+	selected = list(filter_tasks(dailies, tasks))
+	score_tasks(user, selected, 'up')
+	for task in selected:
 		title = task.text
 		if hasattr(task, 'parent'):
 			title = task.parent.text + ' : ' + title
-		task.complete()
 		logger.print('marked daily \'%s\' completed' % title)
 	print_task_list(dailies, hide_completed=not list_all, timezoneOffset=timezoneOffset, with_notes=full)
 
@@ -391,14 +454,15 @@ def dailies_undo(habitica, tasks, full=False, list_all=False): # pragma: no cove
 
 	You can pass one or more <task-id> parameters, using either comma-separated lists or ranges or both. For example, `todos done 1,3,6-9,11`.
 	"""
-	user = habitica.user()
+	user = habitica.user(fields=['stats', 'preferences.timezoneOffset'])
 	timezoneOffset = user.preferences.timezoneOffset
 	dailies = user.dailies()
-	for task in filter_tasks(dailies, tasks):
+	selected = list(filter_tasks(dailies, tasks))
+	score_tasks(user, selected, 'down')
+	for task in selected:
 		title = task.text
 		if hasattr(task, 'parent'):
 			title = task.parent.text + ' : ' + title
-		task.undo()
 		logger.print('marked daily \'%s\' incomplete' % title)
 	print_task_list(dailies, hide_completed=not list_all, timezoneOffset=timezoneOffset, with_notes=full)
 
@@ -426,11 +490,12 @@ def todos_done(habitica, tasks, full=False): # pragma: no cover
 	You can pass one or more <task-id> parameters, using either comma-separated lists or ranges or both. For example, `todos done 1,3,6-9,11`.
 	"""
 	todos = [e for e in habitica.user.todos() if not e.is_completed]
-	for task in filter_tasks(todos, tasks):
+	selected = list(filter_tasks(todos, tasks))
+	score_tasks(habitica.user, selected, 'up')
+	for task in selected:
 		title = task.text
 		if hasattr(task, 'parent'):
 			title = task.parent.text + ' : ' + title
-		task.complete()
 		logger.print('marked todo \'%s\' completed' % title)
 	with_notes = full
 	print_task_list(todos, with_notes=full, hide_completed=True)
@@ -456,7 +521,7 @@ def todos_add(habitica): # difficuly=None): # pragma: no cover -- FIXME not test
 @click.pass_obj
 def health(habitica): # pragma: no cover
 	""" Buy health potion """
-	user = habitica.user()
+	user = habitica.user(fields=['stats'])
 	try:
 		user.buy(habitica.content.potion)
 		logger.print('Bought Health Potion, HP: {0:.1f}/{1}'.format(user.stats.hp, user.stats.maxHealth))
@@ -474,7 +539,7 @@ def spells(habitica, cast=None, habits=None, todos=None): # pragma: no cover
 
 	If spell to CAST is not specified, lists available spells.
 	"""
-	user = habitica.user()
+	user = habitica.user(fields=['stats'])
 	user_class = user.stats.class_name
 	if not cast:
 		for spell in user.spells():
@@ -571,6 +636,21 @@ def show_news(habitica, seen=False): # pragma: no cover
 	if seen:
 		news.mark_as_read()
 
+@cli.command('content-changes')
+@click.option('--seen', is_flag=True, help='Remember current content as seen.')
+@click.pass_obj
+def content_changes(habitica, seen=False): # pragma: no cover
+	""" Lists content entries that were added, removed or changed
+	since content was marked as seen last time.
+	"""
+	changes = habitica.content.unseen_changes(mark_as_seen=seen)
+	if changes is None:
+		logger.print('Content was never marked as seen, use --seen.')
+		return
+	for kind, paths in zip(('added', 'removed', 'changed'), changes):
+		for path in paths:
+			logger.print('{0}: {1}'.format(kind, '.'.join(path)))
+
 @cli.command('tavern')
 @click.option('--in', 'go_in', is_flag=True, help='Enter tavern to rest.')
 @click.option('--out', 'go_out', is_flag=True, help='Exit tavern.')
@@ -583,7 +663,7 @@ def tavern(habitica, go_in=False, go_out=False, toggle=False): # pragma: no cove
 	if sum(map(int, (go_in, go_out, toggle))) > 1:
 		logger.error('Only one flag can be specified')
 		return False
-	user = habitica.user()
+	user = habitica.user(fields=['preferences.sleep'])
 	if toggle:
 		if user.preferences.sleep:
 			go_out = True
@@ -598,5 +678,22 @@ def tavern(habitica, go_in=False, go_out=False, toggle=False): # pragma: no cove
 	else:
 		logger.print('Out of tavern.')
 
+@cli.command('journal')
+@click.option('--flush', is_flag=True, help='Send pending calls to Habitica now.')
+@click.option('--clear-conflicts', is_flag=True, help='Forget calls that were rejected by Habitica.')
+@click.pass_obj
+def show_journal(habitica, flush=False, clear_conflicts=False): # pragma: no cover
+	""" Shows local journal of calls made in write-behind mode (see --write-behind).
+	"""
+	write_behind_journal = journal.Journal()
+	if flush:
+		write_behind_journal.flush(habitica.api)
+	if clear_conflicts:
+		write_behind_journal.clear_conflicts()
+	for entry in write_behind_journal.pending():
+		logger.print('pending: {0} /{1} (attempts: {2})'.format(entry.method, '/'.join(entry.path), entry.attempts))
+	for entry in write_behind_journal.conflicts():
+		logger.error('conflict: {0} /{1}: {2}'.format(entry.method, '/'.join(entry.path), entry.error))
+
 if __name__ == '__main__': # pragma: no cover
 	cli()
@@ -1,13 +1,16 @@
+import threading
 from .. import api
 from ..api import dotdict
-from . import base, content, tasks, groups, user, quests, tags
+from . import base, content, tasks, groups, user, quests, tags, loadout
 from .content import *
 from .groups import *
 from .tasks import *
 from .user import *
 from .tags import *
 from .quests import *
-from .user import UserProxy
+from .loadout import Loadout, GearCatalog
+from .user import UserProxy, AsyncUserProxy
+from .base import UnfetchedField
 
 # TODO the whole /debug/ route for development
 
@@ -204,29 +207,42 @@ class Habitica(base.ApiInterface):
 	# TODO PUT /user/auth/update-password
 	# TODO PUT /user/auth/update-username
 	# TODO webhooks
-	def __init__(self, auth=None, event_handler=None, _api=None):
+	def __init__(self, auth=None, event_handler=None, _api=None, journal=None, mirror=None):
+		""" If journal is given, task scoring works in write-behind mode
+		(see habitica.journal.Journal).
+		If mirror is given, lists of user's tasks and tags are taken from it
+		once it is synced (see habitica.mirror.Mirror).
+		Any change made via this object invalidates mirror until the next sync.
+		"""
 		# TODO POST /user/auth/local/login
-		self.api = _api or api.API(auth['url'], auth['x-api-user'], auth['x-api-key'])
+		self.api = _api or api.API(auth['url'], auth['x-api-user'], auth['x-api-key'], journal=journal)
 		self.events = event_handler or CollectEventHandler()
-		self.api.set_response_hook(self._api_notifications_hook)
+		self.mirror = mirror
 		self._content = None
+		self._content_lock = threading.Lock()
+		self._notifications_lock = threading.RLock()
+		self.api.set_response_hook(self._api_notifications_hook)
+		if mirror is not None:
+			self.api.set_mutation_hook(mirror.invalidate)
 		self._reported_notifications = self.child(Notifications, [])
 	def _api_notifications_hook(self, response):
 		if not isinstance(response, dict):
 			return
 		message = response.get('message')
-		if message:
-			self.events.add(str(message))
-		notifications = self.child(Notifications, response.get('notifications', []))
-		for notification in notifications:
-			if notification.seen:
-				continue
-			if notification in self._reported_notifications:
-				continue
-			self._reported_notifications.add(notification)
-			self.events.add(str(notification))
+		notifications = list(self.child(Notifications, response.get('notifications', [])))
+		with self._notifications_lock:
+			if message:
+				self.events.add(str(message))
+			for notification in notifications:
+				if notification.seen:
+					continue
+				if notification in self._reported_notifications:
+					continue
+				self._reported_notifications.add(notification)
+				self.events.add(str(notification))
 	def mark_all_notifications_as_seen(self):
-		self._reported_notifications.mark_as_seen()
+		with self._notifications_lock:
+			self._reported_notifications.mark_as_seen()
 	def home_url(self):
 		""" Returns main Habitica Web URL to open in browser. """
 		return self.api.base_url + '/#/tasks'
@@ -237,7 +253,12 @@ class Habitica(base.ApiInterface):
 	@property
 	def content(self):
 		if self._content is None:
-			self._content = Content(_api=self.api)
+			# Lock is not held during actual request,
+			# concurrent identical requests are coalesced by API anyway.
+			content = Content(_api=self.api)
+			with self._content_lock:
+				if self._content is None:
+					self._content = content
 		return self._content
 	def coupon(self, code):
 		return self.child(Coupon, code)
@@ -324,3 +345,23 @@ class Habitica(base.ApiInterface):
 			}).data)
 	def _get_tag(self, tag_id):
 		return self.child(Tag, self.api.get('tags', tag_id).data)
+
+class AsyncHabitica(Habitica):
+	""" Asyncio version of main Habitica entry point.
+	Main network-bound entry points are coroutines:
+		user = await habitica.user()
+		todos = await habitica.user.todos()
+		groups = await habitica.groups(Group.PARTY)
+		messages = await groups[0].chat.messages()
+	All produced objects are regular ones and keep blocking API for other operations.
+	"""
+	@property
+	def user(self):
+		return self.child_interface(AsyncUserProxy)
+	async def groups(self, *group_types, paginate=False, page=0):
+		""" Returns list of groups of given types (see Habitica.groups()). """
+		if paginate or page:
+			result = (await self.api.aio.get('groups', type=','.join(group_types), paginate="true", page=page)).data
+		else:
+			result = (await self.api.aio.get('groups', type=','.join(group_types))).data
+		return self.children(groups.AsyncGroup, result)
@@ -5,6 +5,7 @@ import functools
 import vintage
 import logging
 logger = logging.getLogger('habitica')
+from ..api import dotdict
 
 def textsign(value):
 	if value < 0:
@@ -32,6 +33,56 @@ def update_dict_deep(original, new_values):
 			original[key] = new_values[key]
 	return original
 
+class UnfetchedField(KeyError):
+	""" Raised when accessing field of partial document (see PartialDocument)
+	that was not requested from server.
+	"""
+	def __init__(self, path, fields):
+		super().__init__(path)
+		self.path = path
+		self.fields = fields
+	def __str__(self):
+		return "Field '{0}' was not fetched (fetched fields: {1})".format(self.path, ', '.join(sorted(self.fields)))
+
+class PartialDocument(dotdict):
+	""" Document fetched with projection of fields
+	(list of dotted paths, e.g. ['stats', 'preferences.sleep']).
+	Accessing missing key raises UnfetchedField if key was not requested,
+	either via [], .get() or dotted access.
+	For requested but missing keys behaviour is as usual:
+	[] raises KeyError, .get() and dotted access return default/None.
+	Nested dicts are converted to PartialDocuments in-place on the first access.
+	IDs of documents (ALWAYS_FETCHED) are returned by server regardless of projection.
+	"""
+	ALWAYS_FETCHED = ('_id', 'id')
+	def __init__(self, data, fields, _prefix=''):
+		super().__init__(data)
+		object.__setattr__(self, '_fields', frozenset(fields))
+		object.__setattr__(self, '_prefix', _prefix)
+	def _is_fetched(self, path):
+		if path in self.ALWAYS_FETCHED:
+			return True
+		return any(path == field or path.startswith(field + '.') for field in self._fields)
+	def __getitem__(self, key):
+		path = self._prefix + key
+		if key not in self:
+			if self._is_fetched(path):
+				raise KeyError(key)
+			raise UnfetchedField(path, self._fields)
+		value = dict.__getitem__(self, key)
+		if type(value) in (dict, dotdict) and not self._is_fetched(path):
+			value = PartialDocument(value, self._fields, _prefix=path + '.')
+			dict.__setitem__(self, key, value)
+		return value
+	def get(self, key, default=None):
+		if key not in self and self._is_fetched(self._prefix + key):
+			return default
+		return self[key]
+	def __getattr__(self, attr):
+		if attr.startswith('__'):
+			raise AttributeError(attr) # Special methods (e.g. for copy/pickle) should not be treated as fields.
+		return self.get(attr)
+
 class ApiInterface:
 	""" Base class for all objects that:
 	- has immediate parent (._parent);
@@ -1,5 +1,9 @@
 """ Habitica's content: database of all availables items and definitions.
 """
+import re
+import json
+import bisect
+import hashlib
 import datetime
 import functools
 from collections import namedtuple, defaultdict
@@ -10,28 +14,353 @@ from .base import Marketable, MarketableForGold, MarketableForGems
 HabiticaEvent = namedtuple('HabiticaEvent', 'start end')
 
 def parse_habitica_event(data):
-	start = datetime.datetime.strptime(data['start'], '%Y-%m-%d').date()
-	end = datetime.datetime.strptime(data['end'], '%Y-%m-%d').date()
+	return _parse_habitica_event(data['start'], data['end'])
+
+@functools.lru_cache(maxsize=None)
+def _parse_habitica_event(start, end):
+	""" Each event window is parsed only once. """
+	start = datetime.datetime.strptime(start, '%Y-%m-%d').date()
+	end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
 	return HabiticaEvent(start, end)
 
+class DerivedContentData:
+	""" Base class for data derived from raw content (indexes, hashes etc),
+	which can be stored next to the content cache (see load()).
+	Subclasses should implement build().
+	"""
+	FORMAT_VERSION = 1
+
+	def __init__(self, data):
+		self._data = data
+	@classmethod
+	def load(cls, data, storage=None, version=None):
+		""" Returns derived data for given content data.
+		If storage (api.Snapshot) and content version (e.g. ETag) are given,
+		derived data is loaded from storage when it was built for the same version,
+		otherwise it is built and saved to storage.
+		"""
+		if storage is not None and version is not None:
+			loaded = storage.load()
+			if loaded and loaded[0].get('version') == version and loaded[0].get('format') == [cls.__name__, cls.FORMAT_VERSION]:
+				return cls(loaded[1])
+		result = cls.build(data)
+		if storage is not None and version is not None:
+			result.save(storage, version=version)
+		return result
+	@classmethod
+	def restore(cls, storage):
+		""" Returns derived data previously saved to storage or None. """
+		loaded = storage.load()
+		if not loaded or loaded[0].get('format') != [cls.__name__, cls.FORMAT_VERSION]:
+			return None
+		return cls(loaded[1])
+	def save(self, storage, **meta):
+		storage.save(self._data, format=[type(self).__name__, self.FORMAT_VERSION], **meta)
+	@classmethod
+	def build(cls, data): # pragma: no cover
+		raise NotImplementedError
+
+class ContentIndex(DerivedContentData):
+	""" Precomputed indexes over raw content data for fast lookups
+	(by class, set, egg, potion, quest category/level, event dates etc).
+	Indexes contain only keys of entries, so they are small.
+	"""
+	FORMAT_VERSION = 3
+	BACKGROUND_SET_KEY = re.compile(r'^backgrounds(\d\d)(\d{4})$')
+	EVENT_COLLECTIONS = ('gear', 'quests', 'hatchingPotions', 'premiumHatchingPotions', 'mystery')
+
+	def __getitem__(self, index_name):
+		return self._data[index_name]
+	@classmethod
+	def build(cls, data):
+		""" Builds all indexes from raw content data. """
+		def _group(entries, *fields):
+			result = defaultdict(list)
+			for key, entry in entries.items():
+				for field in fields:
+					if entry.get(field) is not None:
+						result[entry[field]].append(key)
+			return dict(result)
+		gear = data.get('gear', {}).get('flat', {})
+		quests = data.get('quests', {})
+		events = []
+		for collection_name in cls.EVENT_COLLECTIONS:
+			entries = gear if collection_name == 'gear' else data.get(collection_name, {})
+			for key, entry in entries.items():
+				event = entry if collection_name == 'mystery' else entry.get('event')
+				if event and event.get('start') and event.get('end'):
+					events.append([event['start'][:10], event['end'][:10], collection_name, key])
+		events.sort()
+		background_sets = defaultdict(dict)
+		background_set_by_item = {}
+		for key, items in data.get('backgrounds', {}).items():
+			match = cls.BACKGROUND_SET_KEY.match(key)
+			if match:
+				month, year = match.groups()
+				background_sets[year][month] = key
+			for item in items:
+				background_set_by_item[item['key']] = key
+		return cls({
+			'gear_by_class' : _group(gear, 'klass', 'specialClass'),
+			'gear_by_set' : _group(gear, 'set'),
+			'gear_by_type' : _group(gear, 'type'),
+			'pets_by_egg' : _group(data.get('petInfo', {}), 'egg'),
+			'pets_by_potion' : _group(data.get('petInfo', {}), 'potion'),
+			'mounts_by_egg' : _group(data.get('mountInfo', {}), 'egg'),
+			'mounts_by_potion' : _group(data.get('mountInfo', {}), 'potion'),
+			'quests_by_category' : _group(quests, 'category'),
+			'quests_by_level' : sorted([entry['lvl'], key] for key, entry in quests.items() if entry.get('lvl') is not None),
+			'events' : events,
+			'event_segments' : cls._event_segments(events),
+			'background_sets' : dict(background_sets),
+			'background_set_by_item' : background_set_by_item,
+			})
+	def quests_by_level(self, min_level=None, max_level=None):
+		""" Returns keys of quests with level requirement in given range (inclusive). """
+		levels = self._data['quests_by_level']
+		start = 0 if min_level is None else bisect.bisect_left(levels, [min_level])
+		end = len(levels) if max_level is None else bisect.bisect_left(levels, [max_level + 1])
+		return [key for _, key in levels[start:end]]
+	@staticmethod
+	def _event_segments(events):
+		""" Splits timeline by all event boundaries into segments
+		and lists events that are active within each segment.
+		Returns pair (sorted segment starts, list of event indexes for each segment).
+		Event with window [start, end] (dates, inclusive) is active from start
+		till the first string greater than end (end + '\\0').
+		"""
+		boundaries = sorted({start for start, _, _, _ in events} | {end + '\0' for _, end, _, _ in events})
+		active = [[] for _ in boundaries]
+		for event_index, (start, end, _, _) in enumerate(events):
+			for segment in range(bisect.bisect_left(boundaries, start), bisect.bisect_left(boundaries, end + '\0')):
+				active[segment].append(event_index)
+		return [boundaries, active]
+	def events(self, date, end_date=None):
+		""" Returns pairs (collection name, key) for entries with event active on given date
+		or, if end_date is given, at any day within range [date, end_date].
+		Finds segments of the timeline via binary search,
+		so time depends only on amount of found events.
+		"""
+		boundaries, active = self._data['event_segments']
+		first = bisect.bisect_right(boundaries, date.isoformat()) - 1
+		last = first if end_date is None else bisect.bisect_right(boundaries, end_date.isoformat()) - 1
+		found = set()
+		for segment in range(max(first, 0), last + 1):
+			found.update(active[segment])
+		events = self._data['events']
+		return [tuple(events[event_index][2:]) for event_index in sorted(found)]
+
+ContentDiff = namedtuple('ContentDiff', 'added removed changed')
+
+class ContentHashes(DerivedContentData):
+	""" Merkle tree of hashes over raw content data.
+	Each node is a pair [hash, children], where children is a dict of nodes
+	for dict values (up to MAX_DEPTH) and None for leaves.
+	Hash of a dict node is computed over keys and hashes of its children,
+	so equal hashes mean equal subtrees and diff() skips them entirely.
+	"""
+	MAX_DEPTH = 3 # Collection name, sub-collection and key of an entry at most.
+
+	@property
+	def hash(self):
+		return self._data[0]
+	@classmethod
+	def build(cls, data):
+		return cls(cls._node(data, 0))
+	@classmethod
+	def _node(cls, value, depth):
+		if isinstance(value, dict) and depth < cls.MAX_DEPTH:
+			children = {str(key) : cls._node(child, depth + 1) for key, child in value.items()}
+			digest = hashlib.sha1()
+			for key in sorted(children):
+				digest.update(key.encode('utf-8'))
+				digest.update(b'\0')
+				digest.update(children[key][0])
+			return [digest.digest(), children]
+		text = json.dumps(value, sort_keys=True, ensure_ascii=False)
+		return [hashlib.sha1(text.encode('utf-8')).digest(), None]
+	def diff(self, other):
+		""" Returns changes from this version of content to the other one
+		as ContentDiff with sorted lists of paths (tuples of keys)
+		of added, removed and changed subtrees.
+		Only subtrees with different hashes are visited.
+		"""
+		result = ContentDiff([], [], [])
+		if self.hash != other.hash:
+			self._diff(self._data, other._data, (), result)
+		for paths in result:
+			paths.sort()
+		return result
+	@classmethod
+	def _diff(cls, old, new, path, result):
+		if old[1] is None or new[1] is None:
+			result.changed.append(path)
+			return
+		old_children, new_children = old[1], new[1]
+		for key in new_children:
+			if key not in old_children:
+				result.added.append(path + (key,))
+			elif old_children[key][0] != new_children[key][0]:
+				cls._diff(old_children[key], new_children[key], path + (key,), result)
+		for key in old_children:
+			if key not in new_children:
+				result.removed.append(path + (key,))
+
+class FieldIndex:
+	""" Indexes over values of a single field of content collection entries:
+	hash index (value -> keys) for equality filters
+	and sorted index (built on the first range filter) for range filters.
+	"""
+	OPERATORS = ('eq', 'in', 'lt', 'le', 'gt', 'ge')
+
+	def __init__(self, collection, raw_key, default=None):
+		self._values = {key : entry.get(raw_key, default) for key, entry in collection.items()}
+		self._by_value = defaultdict(set)
+		for key, value in self._values.items():
+			self._by_value[value].add(key)
+		self._sorted = None
+	def _sorted_index(self):
+		""" Returns pair of lists (sorted values, corresponding keys). """
+		if self._sorted is None:
+			pairs = sorted((value, key) for key, value in self._values.items() if value is not None)
+			self._sorted = [value for value, _ in pairs], [key for _, key in pairs]
+		return self._sorted
+	def select(self, operator, value):
+		""" Returns set of keys of entries which field value matches
+		given operator (see OPERATORS) and value.
+		"""
+		if operator == 'eq':
+			return set(self._by_value.get(value, ()))
+		if operator == 'in':
+			return set().union(*(self._by_value.get(item, ()) for item in value))
+		values, keys = self._sorted_index()
+		if operator == 'lt':
+			start, end = 0, bisect.bisect_left(values, value)
+		elif operator == 'le':
+			start, end = 0, bisect.bisect_right(values, value)
+		elif operator == 'gt':
+			start, end = bisect.bisect_right(values, value), len(values)
+		elif operator == 'ge':
+			start, end = bisect.bisect_left(values, value), len(values)
+		else:
+			raise ValueError('Unknown query operator: {0}. Expected one of: {1}'.format(operator, ', '.join(self.OPERATORS)))
+		return set(keys[start:end])
+
 class Content(base.ApiInterface):
 	""" Cache for all Habitica content. """
 	# TODO achievements (pet colors, quest series etc).
 	# TODO itemList
 	# TODO events
 	# TODO bundles (purchaseable quests)
-	# TODO questsByLevel
 	# TODO appearances
 	def __init__(self, _api=None):
 		super().__init__(_api=_api, _content=self)
-		self._data = self.api.cached('content').get('content').data
+		self._cached = self.api.cached('content')
+		self._data = self._cached.get('content').data
+		self._index = None
+		self._hashes = None
+		self._field_indexes = {}
+		self._gear_catalog = None
+		self._entries = {}
+	@property
+	def index(self):
+		""" Indexes over content (see ContentIndex).
+		Built on the first access and stored next to the content cache.
+		"""
+		if self._index is None:
+			self._index = self._load_derived(ContentIndex, 'index')
+		return self._index
+	@property
+	def hashes(self):
+		""" Hashes of content subtrees (see ContentHashes).
+		Built on the first access and stored next to the content cache.
+		"""
+		if self._hashes is None:
+			self._hashes = self._load_derived(ContentHashes, 'hashes')
+		return self._hashes
+	def _load_derived(self, derived_type, name):
+		version = getattr(self._cached, 'version', None)
+		if callable(version):
+			return derived_type.load(self._data, self._cached.sidecar(name), version())
+		return derived_type.build(self._data)
+	def query(self, entry_type, **filters):
+		""" Returns entries of given type (sorted by key) that match all filters.
+		Filters are fields of entry type (see QUERY_FIELDS of entry type) with optional operator:
+		  field=value (equality), field__in=[values],
+		  field__lt=value, field__le=..., field__gt=..., field__ge=... (ranges).
+		E.g.: content.query(Gear, klass='rogue', type='weapon'); content.query(Quest, level__ge=10)
+		Indexes for each field are built on the first use.
+		"""
+		collection = self._query_collection(entry_type)
+		keys = None
+		for name, value in sorted(filters.items()):
+			field, _, operator = name.partition('__')
+			matched = self._field_index(entry_type, field).select(operator or 'eq', value)
+			keys = matched if keys is None else keys & matched
+			if not keys:
+				break
+		if keys is None:
+			keys = collection.keys()
+		return [self._entry(entry_type, collection[key]) for key in sorted(keys)]
+	def _query_collection(self, entry_type):
+		path = getattr(entry_type, 'QUERY_COLLECTION', None)
+		if path is None:
+			raise ValueError('Entries of type {0} cannot be queried'.format(entry_type.__name__))
+		collection = self._data
+		for key in path:
+			collection = collection[key]
+		return collection
+	def _field_index(self, entry_type, field):
+		if field not in entry_type.QUERY_FIELDS:
+			raise ValueError('Cannot query {0} by field {1}. Expected one of: {2}'.format(
+				entry_type.__name__, field, ', '.join(sorted(entry_type.QUERY_FIELDS)),
+				))
+		index = self._field_indexes.get((entry_type, field))
+		if index is None:
+			raw_key, default = entry_type.QUERY_FIELDS[field]
+			index = FieldIndex(self._query_collection(entry_type), raw_key, default)
+			index = self._field_indexes.setdefault((entry_type, field), index)
+		return index
+	def changes(self, since):
+		""" Returns changes (ContentDiff) from given previous version
+		of content (ContentHashes) to the current one.
+		"""
+		return since.diff(self.hashes)
+	def unseen_changes(self, mark_as_seen=False):
+		""" Returns changes (ContentDiff) since the last time changes were marked as seen
+		or None if they were never marked or cache is not available.
+		If mark_as_seen is True, current version of content is remembered as seen.
+		"""
+		sidecar = getattr(self._cached, 'sidecar', None)
+		if not callable(sidecar):
+			return None
+		storage = sidecar('seen')
+		seen = ContentHashes.restore(storage)
+		if mark_as_seen:
+			self.hashes.save(storage)
+		if seen is None:
+			return None
+		return self.changes(seen)
+	def _entry(self, entry_type, data, **params):
+		""" Returns shared ContentEntry for given data:
+		there is only one instance per entry type, key and params (identity map).
+		"""
+		if not isinstance(data, dict) or data.get('key') is None:
+			return self.child(entry_type, data, **params)
+		cache_key = (entry_type, data['key'], tuple(sorted(params.items())))
+		entry = self._entries.get(cache_key)
+		if entry is None:
+			entry = self.child(entry_type, data, **params)
+			entry.__dict__['_shared'] = True
+			entry = self._entries.setdefault(cache_key, entry)
+		return entry
 	def _get_collection_entry(self, entry_type, collection_name, key=None):
 		""" Returns list of all entries from collection.
 		If key is specified, returns only that entry.
 		"""
 		if key:
-			return self.child(entry_type, self._data[collection_name][key])
-		return self.children(entry_type, self._data[collection_name].values())
+			return self._entry(entry_type, self._data[collection_name][key])
+		return [self._entry(entry_type, entry) for entry in self._data[collection_name].values()]
 	def _get_collection_entry_by_access(self, entry_type, access_list_name, collection_name, key=None, **params):
 		""" Returns list of all entries from collection access list.
 		If key is specified, returns only that entry.
@@ -40,9 +369,9 @@ class Content(base.ApiInterface):
 		"""
 		if key is not None:
 			if self._data[access_list_name].get(key):
-				return self.child(entry_type, self._data[collection_name][key])
+				return self._entry(entry_type, self._data[collection_name][key])
 			return None
-		return [self.child(entry_type, self._data[collection_name][key], **params) for key, value in self._data[access_list_name].items() if value]
+		return [self._entry(entry_type, self._data[collection_name][key], **params) for key, value in self._data[access_list_name].items() if value]
 	@property
 	def potion(self):
 		return self.child(HealthPotion, self._data['potion'])
@@ -106,56 +435,117 @@ class Content(base.ApiInterface):
 				_special=True,
 				)
 	def get_background(self, name):
-		return self.child(Background, self._data['backgroundsFlat'][name])
+		return self._entry(Background, self._data['backgroundsFlat'][name])
 	def get_background_set(self, year, month=None):
 		""" Returns background set for given year and month.
 		If month is None, returns all sets for this year.
 		If year is None (explicitly), returns time travel backgrounds.
 		"""
 		if year is None: # TODO time travel - needs some constant name
-			return self.child(BackgroundSet, {
-				'key' : 'timeTravelBackgrounds',
-				'items' : self.children(Background, self._data['backgrounds']['timeTravelBackgrounds']),
-				})
-		months = ['{0:02}'.format(month)] if month else ['{0:02}'.format(number) for number in range(1, 13)]
-		patterns = ['backgrounds{month}{year}'.format(year=year, month=month) for month in months]
-		result = []
-		for key in self._data['backgrounds']:
-			if key in patterns:
-				result.append((
-					key,
-					self.children(Background, self._data['backgrounds'][key]),
-					))
-		result = self.children(BackgroundSet, [
-			{
-				'key' : key,
-				'items' : items,
-				}
-			for key, items
-			in result
-			])
+			return self._entry(BackgroundSet, {'key' : 'timeTravelBackgrounds'})
+		sets = self.index['background_sets'].get(str(year), {})
+		if month:
+			keys = [sets['{0:02}'.format(month)]] if '{0:02}'.format(month) in sets else []
+		else:
+			keys = [key for _, key in sorted(sets.items())]
+		result = [self._entry(BackgroundSet, {'key' : key}) for key in keys]
 		if len(result) > 1:
 			return result
 		return result[0]
+	def background_calendar(self):
+		""" Returns list of tuples (year, month, BackgroundSet)
+		for all monthly background sets in chronological order.
+		Items of sets are not created until accessed.
+		"""
+		return [
+				(int(year), int(month), self._entry(BackgroundSet, {'key' : key}))
+				for year, sets in sorted(self.index['background_sets'].items())
+				for month, key in sorted(sets.items())
+				]
+	def get_background_set_of(self, name):
+		""" Returns background set that contains given background
+		or None if background does not belong to any set.
+		"""
+		key = self.index['background_set_by_item'].get(name)
+		if key is None:
+			return None
+		return self._entry(BackgroundSet, {'key' : key})
 	def special_items(self, key=None):
 		return self._get_collection_entry(SpecialItem, 'special', key=key)
 	def cards(self):
 		return [self.child(SpecialItem, self._data['special'][key]) for key in self._data['cardTypes'].keys()]
 	def spells(self, class_name):
-		return self.children(Spell, self._data['spells'][class_name].values())
+		return [self._entry(Spell, spell) for spell in self._data['spells'][class_name].values()]
 	def get_spell(self, class_name, spell_key):
-		return self.child(Spell, self._data['spells'][class_name][spell_key])
+		return self._entry(Spell, self._data['spells'][class_name][spell_key])
 	@property
 	def userCanOwnQuestCategories(self):
 		return self._data['userCanOwnQuestCategories']
 	def quests(self, key):
 		from .quests import Quest
-		return self.child(Quest, self._data['quests'][key])
+		return self._entry(Quest, self._data['quests'][key])
 	def get_quest(self, quest_key):
 		from .quests import Quest
-		return self.child(Quest, self._data['quests'][quest_key])
+		return self._entry(Quest, self._data['quests'][quest_key])
 	def gear(self, key):
-		return self.child(Gear, self._data['gear']['flat'][key])
+		return self._entry(Gear, self._data['gear']['flat'][key])
+	@property
+	def gear_catalog(self):
+		""" Stats of all gear (see loadout.GearCatalog), built on the first access. """
+		if self._gear_catalog is None:
+			from .loadout import GearCatalog
+			self._gear_catalog = GearCatalog(self._data['gear']['flat'])
+		return self._gear_catalog
+	def gear_for_class(self, class_name):
+		""" Returns all gear of given class (including special gear for that class). """
+		return [self.gear(key) for key in self.index['gear_by_class'].get(class_name, [])]
+	def gear_set(self, set_name):
+		return [self.gear(key) for key in self.index['gear_by_set'].get(set_name, [])]
+	def gear_of_type(self, gear_type):
+		""" Returns all gear of given type (weapon, armor, head etc). """
+		return [self.gear(key) for key in self.index['gear_by_type'].get(gear_type, [])]
+	def pets_for_egg(self, egg_key):
+		return [self.petInfo(key) for key in self.index['pets_by_egg'].get(egg_key, [])]
+	def pets_for_potion(self, potion_key):
+		return [self.petInfo(key) for key in self.index['pets_by_potion'].get(potion_key, [])]
+	def mounts_for_egg(self, egg_key):
+		return [self.mountInfo(key) for key in self.index['mounts_by_egg'].get(egg_key, [])]
+	def mounts_for_potion(self, potion_key):
+		return [self.mountInfo(key) for key in self.index['mounts_by_potion'].get(potion_key, [])]
+	def quests_by_category(self, category):
+		return [self.get_quest(key) for key in self.index['quests_by_category'].get(category, [])]
+	def quests_by_level(self, min_level=None, max_level=None):
+		""" Returns quests with level requirement in given range (inclusive),
+		sorted by level.
+		"""
+		return [self.get_quest(key) for key in self.index.quests_by_level(min_level, max_level)]
+	def event_items(self, date=None):
+		""" Returns entries (gear, quests, hatching potions)
+		which event is active on given date (default is today).
+		"""
+		return [
+				entry for entry in self.available_on(date or datetime.date.today())
+				if not isinstance(entry, MysterySet)
+				]
+	def available_on(self, date, end_date=None):
+		""" Returns time-limited entries (gear, quests, hatching potions, mystery sets)
+		which event window includes given date
+		or, if end_date is given, intersects range [date, end_date].
+		Uses interval index over all event windows (see ContentIndex.events).
+		"""
+		from .quests import Quest
+		entry_types = {
+				'gear' : Gear,
+				'quests' : Quest,
+				'hatchingPotions' : HatchingPotion,
+				'premiumHatchingPotions' : PremiumHatchingPotion,
+				'mystery' : MysterySet,
+				}
+		result = []
+		for collection_name, key in self.index.events(date, end_date):
+			collection = self._data['gear']['flat'] if collection_name == 'gear' else self._data[collection_name]
+			result.append(self._entry(entry_types[collection_name], collection[key]))
+		return result
 	def gear_tree(self, gear_type, gear_class, gear_index):
 		return self.child(Gear, self._data['gear']['tree'][gear_type][gear_class][gear_index])
 	def mystery(self, key):
@@ -168,7 +558,20 @@ class Content(base.ApiInterface):
 
 @functools.total_ordering
 class ContentEntry(base.ApiObject):
-	""" Base class for all content entries. """
+	""" Base class for all content entries.
+	Entries produced by Content are shared (see Content._entry)
+	and cannot be modified.
+
+	Subclasses that can be queried (see Content.query) define
+	QUERY_COLLECTION (path to collection in content data)
+	and QUERY_FIELDS (field name -> (key in entry data, default value)).
+	"""
+	QUERY_COLLECTION = None
+	QUERY_FIELDS = {}
+	def __setattr__(self, name, value):
+		if self.__dict__.get('_shared'):
+			raise AttributeError('Shared content entry cannot be modified: {0}.{1}'.format(type(self).__name__, name))
+		super().__setattr__(name, value)
 	def __repr__(self): # pragma: no cover
 		return '{0}({1})'.format(type(self).__name__, repr(self.key))
 	def __str__(self):
@@ -176,6 +579,8 @@ class ContentEntry(base.ApiObject):
 	def __lt__(self, other):
 		return self.key < other.key
 	def __eq__(self, other):
+		if self is other:
+			return True
 		return self.key == other.key
 	def __hash__(self):
 		return hash(self.key)
@@ -247,6 +652,12 @@ class Egg(ContentEntry, MarketableForGems, base.Sellable):
 		return self.api.post('user', 'sell', 'eggs', self.key)
 
 class HatchingPotion(ContentEntry, MarketableForGems, base.Sellable):
+	QUERY_COLLECTION = ('hatchingPotions',)
+	QUERY_FIELDS = {
+			'premium' : ('premium', False),
+			'limited' : ('limited', False),
+			'wacky' : ('wacky', False),
+			}
 	@property
 	def _addlNotes(self):
 		return self._data.get('_addlNotes', '')
@@ -272,10 +683,16 @@ class HatchingPotion(ContentEntry, MarketableForGems, base.Sellable):
 		return self.api.post('user', 'sell', 'hatchingPotions', self.key)
 
 class PremiumHatchingPotion(HatchingPotion):
+	QUERY_COLLECTION = ('premiumHatchingPotions',)
 	def _buy(self, user):
 		return self.api.post('user', 'purchase', 'premiumHatchingPotions', self.key)
 
 class Food(ContentEntry, MarketableForGems, base.Sellable):
+	QUERY_COLLECTION = ('food',)
+	QUERY_FIELDS = {
+			'target' : ('target', None),
+			'canDrop' : ('canDrop', None),
+			}
 	@property
 	def textThe(self):
 		return self._data['textThe']
@@ -299,13 +716,22 @@ class Background(ContentEntry, MarketableForGems):
 	@property
 	def set_name(self):
 		return self._data['set']
+	@property
+	def background_set(self):
+		return self.content.get_background_set_of(self.key)
 	def _buy(self, user):
 		return self.api.post('user', 'unlock', path='background.{0}'.format(self.key))
 
 class BackgroundSet(ContentEntry, MarketableForGems):
 	@property
 	def items(self):
-		return self._data['items']
+		""" Backgrounds of the set, created on the first access. """
+		if '_items' not in self.__dict__:
+			self.__dict__['_items'] = [
+					self.content._entry(Background, item)
+					for item in self.content._data['backgrounds'][self.key]
+					]
+		return self.__dict__['_items']
 	def __getitem__(self, index):
 		return self.items[index]
 	def _buy(self, user):
@@ -422,6 +848,22 @@ class Spell(ContentEntry, Castable):
 		return self._data['lvl']
 
 class Gear(ContentEntry, BaseStats, MarketableForGold):
+	QUERY_COLLECTION = ('gear', 'flat')
+	QUERY_FIELDS = {
+			'klass' : ('klass', None),
+			'specialClass' : ('specialClass', None),
+			'type' : ('type', None),
+			'index' : ('index', None),
+			'set_name' : ('set', None),
+			'gearSet' : ('gearSet', None),
+			'mystery' : ('mystery', None),
+			'twoHanded' : ('twoHanded', False),
+			'last' : ('last', False),
+			'str' : ('str', None),
+			'int' : ('int', None),
+			'con' : ('con', None),
+			'per' : ('per', None),
+			}
 	@property
 	def klass(self):
 		return self._data['klass']
@@ -4,6 +4,13 @@ from functools import lru_cache
 from collections import defaultdict
 from . import base, content, tasks, quests, user
 
+def fetch_tasks(api_obj, class_type, task_ids):
+	""" Loads tasks by their IDs concurrently (see API.map).
+	Returns list of objects of class_type in the order of IDs.
+	"""
+	responses = api_obj.api.map([('tasks', task_id) for task_id in task_ids])
+	return [api_obj.child(class_type, response.data) for response in responses]
+
 def iterate_pages(api_obj, class_type, *get_request_path, _limit=30, **query_params):
 	""" Loads paged entities via GET request.
 	Yields produced objects of class_type.
@@ -20,6 +27,20 @@ def iterate_pages(api_obj, class_type, *get_request_path, _limit=30, **query_par
 	for entity in batch:
 		yield entity
 
+async def aiterate_pages(api_obj, class_type, *get_request_path, _limit=30, **query_params):
+	""" Asyncio version of iterate_pages().
+	Async generator, should be used in `async for`.
+	"""
+	batch = api_obj.children(class_type, (await api_obj.api.aio.get(*get_request_path, **query_params)).data)
+	lastId = batch[-1].id
+	while len(batch) >= _limit:
+		for entity in batch:
+			yield entity
+		batch = api_obj.children(class_type, (await api_obj.api.aio.get(*get_request_path, lastId=lastId, **query_params)).data)
+		lastId = batch[-1].id
+	for entity in batch:
+		yield entity
+
 class Challenge(base.Entity):
 	# TODO get challenge by id: get:/challenges/:id
 	# TODO .categories
@@ -52,13 +73,13 @@ class Challenge(base.Entity):
 		return self._data['official']
 	# TODO GET /tasks/challenge/:id ? type=[daily,...]
 	def rewards(self):
-		return [self.child(tasks.Reward, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['rewards']]
+		return fetch_tasks(self, tasks.Reward, self._data['tasksOrder']['rewards'])
 	def todos(self):
-		return [self.child(tasks.Todo, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['todos']]
+		return fetch_tasks(self, tasks.Todo, self._data['tasksOrder']['todos'])
 	def dailies(self):
-		return [self.child(tasks.Daily, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['dailys']]
+		return fetch_tasks(self, tasks.Daily, self._data['tasksOrder']['dailys'])
 	def habits(self):
-		return [self.child(tasks.Habit, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['habits']]
+		return fetch_tasks(self, tasks.Habit, self._data['tasksOrder']['habits'])
 	def create_task(self, task_obj):
 		data = self.api.post('tasks', 'challenge', self.id, _body=task_obj._data).data
 		return self.child(tasks.Task.type_from_str(data['type']), data)
@@ -154,6 +175,16 @@ class Chat(base.ApiInterface):
 		else:
 			return self.api.post('groups', self.group.id, 'chat', _body={'message':message_text})
 
+class AsyncChat(Chat):
+	""" Chat with asyncio version of messages():
+	>>> messages = await group.chat.messages()
+	"""
+	async def messages(self):
+		if self._entries is None:
+			data = (await self.api.aio.get('groups', self.group.id, 'chat')).data
+			self._entries = self.children(ChatMessage, data, _parent=self.group)
+		return self._entries
+
 class Group(base.Entity):
 	""" Habitica's user group: a guild, a party, the Tavern. """
 	PARTY = 'party'
@@ -210,13 +241,13 @@ class Group(base.Entity):
 		return self._data['leaderMessage']
 	# TODO GET /tasks/group/:id ? type=[daily,...]
 	def rewards(self):
-		return [self.child(tasks.Reward, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['rewards']]
+		return fetch_tasks(self, tasks.Reward, self._data['tasksOrder']['rewards'])
 	def todos(self):
-		return [self.child(tasks.Todo, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['todos']]
+		return fetch_tasks(self, tasks.Todo, self._data['tasksOrder']['todos'])
 	def dailies(self):
-		return [self.child(tasks.Daily, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['dailys']]
+		return fetch_tasks(self, tasks.Daily, self._data['tasksOrder']['dailys'])
 	def habits(self):
-		return [self.child(tasks.Habit, self.api.get('tasks', task_id).data) for task_id in self._data['tasksOrder']['habits']]
+		return fetch_tasks(self, tasks.Habit, self._data['tasksOrder']['habits'])
 	def create_task(self, task_obj):
 		data = self.api.post('tasks', 'group', self.id, _body=task_obj._data).data
 		return self.child(tasks.Task.type_from_str(data['type']), data)
@@ -305,3 +336,13 @@ class Party(Group):
 		return self.child(quests.Quest, None, _group_progress=self._data['quest'])
 	def invite_to_quest(self, quest):
 		self._data['quest'] = self.api.post('groups', self.id, 'quests', 'invite', quest.key).data
+
+class AsyncGroup(Group):
+	""" Group with asyncio versions of network-bound entry points. """
+	@property
+	def chat(self):
+		return self.child_interface(AsyncChat)
+	async def members(self, includeAllPublicFields=False, includeTasks=False):
+		""" Yields all current members of the group (async generator). """
+		async for member in aiterate_pages(self, user.Member, 'groups', self.id, 'members', includeAllPublicFields=includeAllPublicFields, includeTasks=includeTasks):
+			yield member
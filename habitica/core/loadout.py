@@ -0,0 +1,126 @@
+""" Gear loadouts: picking the best owned gear for given stats.
+"""
+from collections import namedtuple
+try:
+	import numpy
+except ImportError: # pragma: no cover -- optional, used for vectorized scoring.
+	numpy = None
+
+Loadout = namedtuple('Loadout', 'items score')
+
+class GearCatalog:
+	""" Stats of all gear in content, one row per item.
+	If NumPy is available, stats are kept in matrix and scored in vectorized way,
+	otherwise plain lists are used.
+	Catalog is built once per content (see Content.gear_catalog).
+	"""
+	STATS = ('str', 'int', 'con', 'per')
+	CLASS_BONUS = 1.5 # Gear of user's class gives 50% more stats.
+	SLOTS = ('weapon', 'armor', 'head', 'shield', 'back', 'body', 'headAccessory', 'eyewear')
+
+	def __init__(self, gear_data):
+		""" Gear data is a dict of raw gear entries (content.gear.flat). """
+		self.keys = list(gear_data)
+		self._positions = {key : row for row, key in enumerate(self.keys)}
+		entries = [gear_data[key] for key in self.keys]
+		stats = [[entry.get(stat) or 0 for stat in self.STATS] for entry in entries]
+		classes = [entry.get('klass') for entry in entries]
+		special_classes = [entry.get('specialClass') for entry in entries]
+		slot_rows = {slot : [] for slot in self.SLOTS}
+		two_handed = []
+		for row, entry in enumerate(entries):
+			if entry.get('type') not in slot_rows:
+				continue
+			if entry.get('type') == 'weapon' and entry.get('twoHanded'):
+				two_handed.append(row)
+			else:
+				slot_rows[entry['type']].append(row)
+		if numpy is not None:
+			self._stats = numpy.array(stats, dtype=float).reshape(len(entries), len(self.STATS))
+			self._classes = numpy.array(classes, dtype=object)
+			self._special_classes = numpy.array(special_classes, dtype=object)
+			self._slot_rows = {slot : numpy.array(rows, dtype=int) for slot, rows in slot_rows.items()}
+			self._two_handed_rows = numpy.array(two_handed, dtype=int)
+		else:
+			self._stats = stats
+			self._classes = classes
+			self._special_classes = special_classes
+			self._slot_rows = slot_rows
+			self._two_handed_rows = two_handed
+	def _weights(self, objective):
+		if isinstance(objective, str):
+			objective = objective.split('+')
+		if not isinstance(objective, dict):
+			objective = {stat : 1 for stat in objective}
+		unknown = set(objective) - set(self.STATS)
+		if unknown:
+			raise ValueError('Unknown stats in objective: {0}. Expected: {1}'.format(', '.join(sorted(unknown)), ', '.join(self.STATS)))
+		return [objective.get(stat, 0) for stat in self.STATS]
+	def scores(self, objective, class_name=None, owned=None):
+		""" Returns scores of all items (in order of .keys) for given objective:
+		weighted sum of stats (with class bonus for gear of given class).
+		Objective is a dict of weights per stat ({'str':1, 'per':0.5}),
+		a sequence of stat names or a string like 'str+per'.
+		If owned (keys of owned items) is given, items that are not owned
+		get score of -inf.
+		"""
+		weights = self._weights(objective)
+		if numpy is not None:
+			scores = self._stats @ numpy.array(weights, dtype=float)
+			if class_name is not None:
+				bonus = (self._classes == class_name) | (self._special_classes == class_name)
+				scores = numpy.where(bonus, scores * self.CLASS_BONUS, scores)
+			if owned is not None:
+				mask = numpy.zeros(len(self.keys), dtype=bool)
+				mask[[self._positions[key] for key in owned if key in self._positions]] = True
+				scores = numpy.where(mask, scores, -numpy.inf)
+			return scores
+		scores = [sum(value * weight for value, weight in zip(stats, weights)) for stats in self._stats]
+		if class_name is not None:
+			scores = [
+					score * self.CLASS_BONUS if class_name in (klass, special_class) else score
+					for score, klass, special_class in zip(scores, self._classes, self._special_classes)
+					]
+		if owned is not None:
+			owned = {self._positions[key] for key in owned if key in self._positions}
+			scores = [score if row in owned else float('-inf') for row, score in enumerate(scores)]
+		return scores
+	@staticmethod
+	def _best(scores, rows):
+		""" Returns row with the max score or None if there are no eligible rows
+		or none of them improves objective (score <= 0).
+		"""
+		if not len(rows):
+			return None
+		if numpy is not None:
+			best = rows[int(numpy.argmax(scores[rows]))]
+		else:
+			best = max(rows, key=scores.__getitem__)
+		if scores[best] <= 0:
+			return None
+		return best
+	def best_loadout(self, objective, class_name=None, owned=None):
+		""" Returns best combination of items for given objective (see scores())
+		as pair (dict {slot: key of item}, total score).
+		Slots without eligible items or without items that improve the score
+		(e.g. only items without stats of objective) are not included,
+		so currently equipped items are kept there.
+		Two-handed weapon leaves shield slot empty,
+		so it is chosen only if it beats best one-handed weapon and shield together.
+		"""
+		scores = self.scores(objective, class_name=class_name, owned=owned)
+		best = {slot : self._best(scores, rows) for slot, rows in self._slot_rows.items()}
+		two_handed = self._best(scores, self._two_handed_rows)
+		if two_handed is not None:
+			one_handed_score = sum(scores[best[slot]] for slot in ('weapon', 'shield') if best[slot] is not None)
+			if scores[two_handed] > one_handed_score:
+				best['weapon'], best['shield'] = two_handed, None
+		items = {slot : self.keys[row] for slot, row in best.items() if row is not None}
+		return items, float(sum(scores[row] for row in best.values() if row is not None))
+
+def best_loadout(content, objective, class_name=None, owned=None):
+	""" Returns Loadout (dict {slot: Gear}, total score) with the best
+	owned gear for given objective (see GearCatalog.scores).
+	"""
+	items, score = content.gear_catalog.best_loadout(objective, class_name=class_name, owned=owned)
+	return Loadout({slot : content.gear(key) for slot, key in items.items()}, score)
@@ -179,6 +179,12 @@ class LazyQuestData:
 		return self._data.get(key, default)
 
 class Quest(ContentEntry, MarketableForGems):
+	QUERY_COLLECTION = ('quests',)
+	QUERY_FIELDS = {
+			'category' : ('category', None),
+			'level' : ('lvl', None),
+			'group' : ('group', None),
+			}
 	def __init__(self, *args, _content=None, _data=None, _group_progress=None, _user_progress=None, **kwargs):
 		if _data is None:
 			assert _group_progress or _user_progress
@@ -165,6 +165,29 @@ class Task(base.Entity):
 		self._add_event(QuestProgressEvent, '_tmp', 'quest', 'progressDelta', data=data)
 		self._track_stat('class', data=data)
 		self._track_stat('gp', data=data)
+	def _post_score(self, *path):
+		""" Sends scoring call and returns resulting data.
+		In write-behind mode (API has journal) call is only appended to the journal
+		and None is returned.
+		"""
+		journal = getattr(self.api, 'journal', None)
+		if journal is not None:
+			journal.append('post', *path)
+			self.api.notify_mutation()
+			return None
+		return self.api.post(*path).data
+	def _score(self, direction):
+		""" Scores task up or down and applies value delta.
+		In write-behind mode value is not changed until journal is replayed.
+		"""
+		# TODO data also stores updated user stats, needs to calculate diff and notify.
+		result = self._post_score('tasks', self.id, 'score', direction)
+		if result is None:
+			return
+		self._apply_score(result)
+	def _apply_score(self, result):
+		self._handle_events(result)
+		self._data['value'] += result['delta']
 
 	@property
 	def task_type(self):
@@ -395,22 +418,17 @@ class Habit(Task, TaskValue):
 	@property
 	def frequency(self):
 		return self._data['frequency']
-	def up(self):
-		if not self._data['up']:
+	def _check_score(self, direction):
+		if direction == 'up' and not self._data['up']:
 			raise CannotScoreUp(self)
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'up').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
-	def down(self):
-		if not self._data['down']:
+		if direction == 'down' and not self._data['down']:
 			raise CannotScoreDown(self)
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'down').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
+	def up(self):
+		self._check_score('up')
+		self._score('up')
+	def down(self):
+		self._check_score('down')
+		self._score('down')
 
 class Checkable:
 	""" Base class for task or sub-item that can be checked (completed) or unchecked.
@@ -433,17 +451,13 @@ class SubItem(Task, Checkable):
 		""" Marks subitem as completed. """
 		if self.is_completed:
 			return
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		self.api.post('tasks', self._parent.id, 'checklist', self.id, 'score')
+		self._post_score('tasks', self._parent.id, 'checklist', self.id, 'score')
 		super().complete()
 	def undo(self):
 		""" Marks subitem as not completed. """
 		if not self.is_completed:
 			return
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		self.api.post('tasks', self._parent.id, 'checklist', self.id, 'score')
+		self._post_score('tasks', self._parent.id, 'checklist', self.id, 'score')
 		super().undo()
 	def update(self, text):
 		self._parent._data = self.api.put('tasks', self._parent.id, 'checklist', self.id, _body={'text':text}).data
@@ -687,19 +701,11 @@ class Daily(Task, TaskValue, Checkable, Checklist):
 
 	def complete(self):
 		""" Marks daily as completed. """
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'up').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
+		self._score('up')
 		super().complete()
 	def undo(self):
 		""" Marks daily as not completed. """
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'down').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
+		self._score('down')
 		super().undo()
 
 class Todo(Task, TaskValue, Checkable, Checklist):
@@ -759,17 +765,53 @@ class Todo(Task, TaskValue, Checkable, Checklist):
 		return timeutils.time_from_string(self._data['dateCompleted']).date()
 	def complete(self):
 		""" Marks todo as completed. """
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'up').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
+		self._score('up')
 		super().complete()
 	def undo(self):
 		""" Marks todo as not completed. """
-		# TODO data also stores updated user stats, needs to calculate diff and notify.
-		# TODO also data._tmp is a Drop, need to display notification.
-		result = self.api.post('tasks', self.id, 'score', 'down').data
-		self._handle_events(result)
-		self._data['value'] += result['delta']
+		self._score('down')
 		super().undo()
+
+def score_many(api, scores):
+	""" Scores several tasks with a single request (POST /api/v4/tasks/bulk-score).
+	Scores is a sequence of pairs: (task, direction), where direction is 'up' or 'down'.
+	For checkable tasks 'up' means complete and 'down' means undo.
+	Returned deltas and drops are applied to each task the same way
+	as for the individual scoring (see Habit.up(), Daily.complete() etc).
+	Checklist items cannot be scored in bulk and are checked/unchecked individually.
+	In write-behind mode (API has journal) each task is journaled individually.
+	Raises CannotScoreUp/CannotScoreDown before any request is made
+	if any of habits cannot be scored in the specified direction.
+	"""
+	scores = list(scores)
+	for task, direction in scores:
+		if isinstance(task, Habit):
+			task._check_score(direction)
+	bulk = []
+	for task, direction in scores:
+		if isinstance(task, SubItem) or getattr(api, 'journal', None) is not None:
+			if isinstance(task, Habit):
+				task._score(direction)
+			elif direction == 'up':
+				task.complete()
+			else:
+				task.undo()
+			continue
+		bulk.append((task, direction))
+	if not bulk:
+		return
+	result = api.v4.post('tasks', 'bulk-score', _body=[
+		{'id' : task.id, 'direction' : direction}
+		for task, direction in bulk
+		]).data
+	task_results = {entry['id'] : entry for entry in result.get('tasks', [])}
+	for task, direction in bulk:
+		if task.id not in task_results: # pragma: no cover -- should not happen.
+			continue
+		task._apply_score(task_results[task.id])
+		if isinstance(task, Checkable):
+			task._data['completed'] = (direction == 'up')
+	# Stats are shared by all tasks, so any of them can track changes.
+	last_task = bulk[-1][0]
+	last_task._track_stat('class', data=result)
+	last_task._track_stat('gp', data=result)
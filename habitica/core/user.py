@@ -1,6 +1,6 @@
 """ User and user-related functionality: inventory, spells etc.
 """
-from . import base, content, tasks, groups, tags
+from . import base, content, tasks, groups, tags, loadout
 from ..api import dotdict
 
 class UserAppearance(base.ApiObject):
@@ -301,6 +301,12 @@ class _UserMethods:
 		return self.children(tasks.Todo, self.api.get('tasks', 'user', type='todos').data)
 	def rewards(self):
 		return self.children(tasks.Reward, self.api.get('tasks', 'user', type='rewards').data)
+	def score_many(self, scores):
+		""" Scores several tasks with a single request.
+		Scores is a sequence of pairs: (task, 'up'/'down').
+		See tasks.score_many() for details.
+		"""
+		tasks.score_many(self.api, scores)
 	def create_task(self, task_obj):
 		data = self.api.post('tasks', 'user', _body=task_obj._data).data
 		return self.child(tasks.Task.type_from_str(data['type']), data)
@@ -322,10 +328,67 @@ class UserProxy(base.ApiInterface, _UserMethods):
 	   real_user.todos()
 	   real_user.party()
 	   ...
+	To fetch only specific fields of user data, pass list of dotted paths:
+	   real_user = habitica.user(fields=['stats', 'preferences.sleep'])
+	Accessing fields that were not fetched raises UnfetchedField.
 	"""
-	def __call__(self):
-		# TODO supports query userFields=...,...
-		return self.child(User, self.api.get('user').data, _parent=self._parent)
+	def __call__(self, fields=None):
+		if not fields:
+			return self.child(User, self.api.get('user').data, _parent=self._parent)
+		data = self.api.get('user', userFields=','.join(fields)).data
+		return self.child(User, base.PartialDocument(data, fields), _parent=self._parent)
+	@property
+	def _mirror(self):
+		""" Local mirror of Habitica object, if it is already synced. """
+		mirror = getattr(self._parent, 'mirror', None)
+		if mirror is None or mirror.version() is None:
+			return None
+		return mirror
+	def habits(self):
+		if self._mirror is None:
+			return super().habits()
+		return self.children(tasks.Habit, self._mirror.tasks('habit'))
+	def dailies(self, dueDate=None):
+		if self._mirror is None or dueDate:
+			return super().dailies(dueDate=dueDate)
+		return self.children(tasks.Daily, self._mirror.tasks('daily'))
+	def todos(self):
+		if self._mirror is None:
+			return super().todos()
+		return self.children(tasks.Todo, self._mirror.tasks('todo'))
+	def rewards(self):
+		if self._mirror is None:
+			return super().rewards()
+		return self.children(tasks.Reward, self._mirror.tasks('reward'))
+	def tags(self):
+		if self._mirror is None:
+			return super().tags()
+		return self.children(tags.Tag, self._mirror.tags())
+
+class AsyncUserProxy(UserProxy):
+	""" Asyncio version of UserProxy:
+	   real_user = await habitica.user()
+	   todos = await habitica.user.todos()
+	Produced objects are regular (sync) ones.
+	"""
+	async def __call__(self, fields=None):
+		if not fields:
+			return self.child(User, (await self.api.aio.get('user')).data, _parent=self._parent)
+		data = (await self.api.aio.get('user', userFields=','.join(fields))).data
+		return self.child(User, base.PartialDocument(data, fields), _parent=self._parent)
+	async def habits(self):
+		return self.children(tasks.Habit, (await self.api.aio.get('tasks', 'user', type='habits')).data)
+	async def dailies(self, dueDate=None):
+		query = {
+				'type' : 'dailys',
+				}
+		if dueDate: # pragma: no cover -- TODO requires real testing first.
+			query['dueDate'] = dueDate # FIXME convert to what format?
+		return self.children(tasks.Daily, (await self.api.aio.get('tasks', 'user', **query)).data)
+	async def todos(self):
+		return self.children(tasks.Todo, (await self.api.aio.get('tasks', 'user', type='todos')).data)
+	async def rewards(self):
+		return self.children(tasks.Reward, (await self.api.aio.get('tasks', 'user', type='rewards')).data)
 
 class Email:
 	""" External person: only e-mail and optional name.
@@ -409,7 +472,8 @@ class Member(base.Entity):
 class User(base.Entity, _UserMethods):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
-		self.stats._handle_events()
+		if 'stats' in self._data: # May be not fetched (see UserProxy).
+			self.stats._handle_events()
 	# TODO auth -- see model
 	# TODO achievements -- see model
 	# TODO backer -- see model
@@ -554,6 +618,29 @@ class User(base.Entity, _UserMethods):
 		if not isinstance(item, content.Gear):
 			raise RuntimeError("Can equip only Gear, not {0}".format(type(item)))
 		self._update(self.api.post('user', 'equip', 'equipped', item.key).data)
+	def best_loadout(self, objective, class_name=None):
+		""" Returns the best owned gear for given objective
+		(e.g. 'str+per' or {'str':1, 'per':0.5}, see loadout.GearCatalog.scores)
+		as loadout.Loadout. Gear of user's class (or given class) gets class bonus.
+		"""
+		owned = [key for key, is_owned in self.inventory.gear.items() if is_owned]
+		return loadout.best_loadout(self.content, objective,
+				class_name=class_name or self.stats.class_name,
+				owned=owned,
+				)
+	def equip_loadout(self, gear_loadout):
+		""" Equips all items of loadout (see best_loadout)
+		that are not equipped yet (equipping worn item would take it off).
+		Returns list of equipped items.
+		"""
+		equipped = self._data['items']['gear']['equipped']
+		items = [
+				item for slot, item in sorted(gear_loadout.items.items())
+				if equipped.get(slot) != item.key
+				]
+		for item in items:
+			self.equip_gear(item)
+		return items
 	def select_pet(self, pet):
 		if not isinstance(pet, content.Pet):
 			raise RuntimeError("Can select only Pet as a pet, not {0}".format(type(pet)))
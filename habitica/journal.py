@@ -0,0 +1,200 @@
+""" Write-behind journal for mutating API calls.
+
+In write-behind mode calls (like scoring tasks) are not sent to server immediately,
+but appended to local durable journal (SQLite) and return at once.
+Journal is replayed later in the same order by flusher (see Journal.flush),
+either in background thread (JournalFlusher) or in a detached process:
+	python -m habitica.journal
+"""
+import sys
+import json
+import time
+import sqlite3
+import threading
+import subprocess
+import contextlib
+import collections
+from pathlib import Path
+try:
+	import fcntl
+except ImportError: # pragma: no cover -- non-POSIX systems.
+	fcntl = None
+import logging
+logger = logging.getLogger('habitica')
+import requests
+from . import config
+
+class Journal:
+	""" Durable journal of mutating API calls, stored in SQLite database.
+	Entries are replayed strictly in order of appending.
+	Entries rejected by server (4xx) are marked as conflicts and are not retried,
+	all other failures (network, 5xx, rate limit) stop the replay until the next flush.
+	"""
+	PENDING, DONE, CONFLICT = 'pending', 'done', 'conflict'
+	Entry = collections.namedtuple('Entry', 'id created method path query body status attempts error')
+
+	def __init__(self, path=None):
+		""" Default journal location is in user data dir. """
+		self.path = Path(path or Path(config.get_data_dir())/'journal.sqlite')
+		self._lock = threading.Lock()
+		with self._connect() as db:
+			db.execute("""CREATE TABLE IF NOT EXISTS entries (
+				id INTEGER PRIMARY KEY AUTOINCREMENT,
+				created REAL NOT NULL,
+				method TEXT NOT NULL,
+				path TEXT NOT NULL,
+				query TEXT NOT NULL,
+				body TEXT,
+				status TEXT NOT NULL,
+				attempts INTEGER NOT NULL DEFAULT 0,
+				error TEXT
+				)""")
+	@contextlib.contextmanager
+	def _connect(self):
+		db = sqlite3.connect(str(self.path), timeout=30)
+		try:
+			with db:
+				yield db
+		finally:
+			db.close()
+	def append(self, method, *path, _body=None, **query):
+		""" Appends call to the journal: method, /sub/path/ and query params (kwargs).
+		Body should be passed as '_body={}' (for POST/PUT).
+		Returns id of the entry.
+		"""
+		with self._connect() as db:
+			cursor = db.execute("""INSERT INTO entries (created, method, path, query, body, status)
+				VALUES (?, ?, ?, ?, ?, ?)""", (
+					time.time(), method.upper(), json.dumps(list(path)),
+					json.dumps(query), json.dumps(_body) if _body is not None else None,
+					self.PENDING,
+					))
+			return cursor.lastrowid
+	def entries(self, status=PENDING):
+		""" Returns list of entries with given status in the order of appending. """
+		with self._connect() as db:
+			rows = db.execute("""SELECT id, created, method, path, query, body, status, attempts, error
+				FROM entries WHERE status = ? ORDER BY id""", (status,)).fetchall()
+		return [self.Entry(
+			entry_id, created, method, json.loads(path), json.loads(query),
+			json.loads(body) if body is not None else None,
+			status, attempts, error,
+			) for entry_id, created, method, path, query, body, status, attempts, error in rows]
+	def pending(self):
+		return self.entries(self.PENDING)
+	def conflicts(self):
+		return self.entries(self.CONFLICT)
+	def clear_conflicts(self):
+		""" Removes all conflicted entries. """
+		with self._connect() as db:
+			db.execute("DELETE FROM entries WHERE status = ?", (self.CONFLICT,))
+	def _set_status(self, entry, status, error=None):
+		with self._connect() as db:
+			if status == self.DONE:
+				db.execute("DELETE FROM entries WHERE id = ?", (entry.id,))
+			else:
+				db.execute("UPDATE entries SET status = ?, attempts = attempts + 1, error = ? WHERE id = ?",
+						(status, error, entry.id))
+	@contextlib.contextmanager
+	def _flushing(self):
+		""" Ensures that there is only one flusher for the journal at once
+		(both within process and between processes).
+		Yields False if journal is already being flushed.
+		"""
+		if not self._lock.acquire(blocking=False):
+			yield False
+			return
+		try:
+			if fcntl is None: # pragma: no cover
+				yield True
+				return
+			with open(str(self.path) + '.lock', 'w') as f:
+				try:
+					fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+				except OSError:
+					yield False
+					return
+				try:
+					yield True
+				finally:
+					fcntl.flock(f, fcntl.LOCK_UN)
+		finally:
+			self._lock.release()
+	def flush(self, api):
+		""" Replays pending entries using given API object.
+		Returns list of entries that conflicted during this flush.
+		Does nothing if journal is being flushed by someone else.
+		"""
+		conflicts = []
+		with self._flushing() as acquired:
+			if not acquired:
+				return conflicts
+			for entry in self.pending():
+				kwargs = dict(entry.query)
+				if entry.method in ['POST', 'PUT']:
+					kwargs['_body'] = entry.body
+				try:
+					getattr(api, entry.method.lower())(*entry.path, **kwargs)
+				except requests.exceptions.HTTPError as e:
+					status_code = e.response.status_code
+					if 400 <= status_code < 500 and status_code != 429:
+						error = '{0}: {1}'.format(status_code, e)
+						logger.warning('Journaled call {0} /{1} conflicted: {2}'.format(entry.method, '/'.join(entry.path), error))
+						self._set_status(entry, self.CONFLICT, error)
+						conflicts.append(entry._replace(status=self.CONFLICT, attempts=entry.attempts + 1, error=error))
+						continue
+					self._set_status(entry, self.PENDING, str(e))
+					break
+				except requests.exceptions.RequestException as e:
+					logger.debug('Failed to replay journal, will retry later: {0}'.format(e))
+					self._set_status(entry, self.PENDING, str(e))
+					break
+				self._set_status(entry, self.DONE)
+		return conflicts
+
+class JournalFlusher(threading.Thread):
+	""" Background thread that periodically replays journal. """
+	def __init__(self, journal, api, interval=10.0):
+		super().__init__(daemon=True)
+		self.journal = journal
+		self.api = api
+		self.interval = interval
+		self._stopped = threading.Event()
+	def run(self):
+		while not self._stopped.is_set():
+			try:
+				self.journal.flush(self.api)
+			except Exception: # pragma: no cover
+				logger.exception('Failed to flush journal!')
+			self._stopped.wait(self.interval)
+	def stop(self, flush=True):
+		""" Stops background thread.
+		If flush is True, makes last attempt to replay journal synchronously.
+		"""
+		self._stopped.set()
+		self.join()
+		if flush:
+			self.journal.flush(self.api)
+
+def spawn_flusher(): # pragma: no cover
+	""" Starts detached process that replays default journal
+	and exits when journal is empty.
+	"""
+	return subprocess.Popen([sys.executable, '-m', 'habitica.journal'],
+			stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+			start_new_session=True,
+			)
+
+def main(interval=10.0, max_rounds=30): # pragma: no cover
+	from . import api
+	auth = config.load_auth()
+	journal = Journal()
+	remote = api.API(auth['url'], auth['x-api-user'], auth['x-api-key'])
+	for _ in range(max_rounds):
+		journal.flush(remote)
+		if not journal.pending():
+			break
+		time.sleep(interval)
+
+if __name__ == '__main__': # pragma: no cover
+	main()
@@ -0,0 +1,236 @@
+""" Local mirror of account data.
+
+Mirror keeps tasks of all types (with checklists), tags, stats, inventory
+and party of the user in local SQLite database,
+so listings can be answered without network round trip.
+Mirror is refreshed incrementally (see Mirror.sync):
+user data and tasks are re-fetched only when user document version (`_v`) changes,
+and only tasks with changed `updatedAt` are rewritten.
+Sync can be performed in background thread (see MirrorSyncer)
+or in a detached process:
+	python -m habitica.mirror
+"""
+import sys
+import json
+import time
+import sqlite3
+import threading
+import subprocess
+import contextlib
+import collections
+from pathlib import Path
+import logging
+logger = logging.getLogger('habitica')
+from . import config
+from .api import dotdict
+
+class Mirror:
+	""" Local copy of account data, stored in SQLite database.
+	Data is stored as plain JSON documents, as returned by API.
+	"""
+	USER_FIELDS = ('_v', 'stats', 'items', 'party', 'tags', 'tasksOrder')
+	DOCUMENTS = ('stats', 'items', 'party')
+	MAX_AGE = 5 * 60 # Seconds after the last sync when mirror is considered stale.
+	SyncResult = collections.namedtuple('SyncResult', 'version user_updated tasks_updated tasks_deleted')
+
+	def __init__(self, path=None, login=None):
+		""" Default mirror location is in user cache dir,
+		separate for each login (if specified).
+		"""
+		if path is None:
+			name = '{0}.mirror.sqlite'.format(login) if login else 'mirror.sqlite'
+			path = Path(config.get_cache_dir())/name
+		self.path = Path(path)
+		self._lock = threading.Lock()
+		with self._connect() as db:
+			db.execute("""CREATE TABLE IF NOT EXISTS meta (
+				key TEXT PRIMARY KEY,
+				value TEXT NOT NULL
+				)""")
+			db.execute("""CREATE TABLE IF NOT EXISTS documents (
+				name TEXT PRIMARY KEY,
+				data TEXT NOT NULL
+				)""")
+			db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+				id TEXT PRIMARY KEY,
+				type TEXT NOT NULL,
+				position INTEGER NOT NULL,
+				updated_at TEXT,
+				data TEXT NOT NULL
+				)""")
+			db.execute("""CREATE INDEX IF NOT EXISTS tasks_by_type ON tasks (type, position)""")
+			db.execute("""CREATE TABLE IF NOT EXISTS tags (
+				id TEXT PRIMARY KEY,
+				position INTEGER NOT NULL,
+				data TEXT NOT NULL
+				)""")
+	@contextlib.contextmanager
+	def _connect(self):
+		db = sqlite3.connect(str(self.path), timeout=30)
+		try:
+			with db:
+				yield db
+		finally:
+			db.close()
+	def _get_meta(self, db, key):
+		row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+		return json.loads(row[0]) if row else None
+	def _set_meta(self, db, key, value):
+		db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+	def version(self):
+		""" Returns version (`_v`) of mirrored user document
+		or None if mirror was never synced.
+		"""
+		with self._connect() as db:
+			return self._get_meta(db, 'version')
+	def synced_at(self):
+		""" Returns time (timestamp) of the last successful sync or None. """
+		with self._connect() as db:
+			return self._get_meta(db, 'synced_at')
+	def invalidate(self):
+		""" Marks mirror as outdated (e.g. after changes made via API):
+		it is not used until the next sync and sync re-fetches everything.
+		"""
+		with self._connect() as db:
+			db.execute("DELETE FROM meta WHERE key IN ('version', 'synced_at')")
+	def is_stale(self, max_age=None):
+		""" Returns True if mirror was never synced
+		or was synced more than max_age (default is MAX_AGE) seconds ago.
+		"""
+		synced_at = self.synced_at()
+		if synced_at is None:
+			return True
+		return time.time() - synced_at > (self.MAX_AGE if max_age is None else max_age)
+	def tasks(self, task_type=None):
+		""" Returns list of mirrored tasks (task data) of given type ('habit', 'daily' etc)
+		in the user's order, or all tasks if type is not specified.
+		"""
+		with self._connect() as db:
+			if task_type:
+				rows = db.execute("SELECT data FROM tasks WHERE type = ? ORDER BY position", (task_type,)).fetchall()
+			else:
+				rows = db.execute("SELECT data FROM tasks ORDER BY type, position").fetchall()
+		return [json.loads(data, object_hook=dotdict) for data, in rows]
+	def tags(self):
+		""" Returns list of mirrored tags (tag data) in user's order. """
+		with self._connect() as db:
+			rows = db.execute("SELECT data FROM tags ORDER BY position").fetchall()
+		return [json.loads(data, object_hook=dotdict) for data, in rows]
+	def document(self, name):
+		""" Returns mirrored part of user data (see DOCUMENTS) or None. """
+		with self._connect() as db:
+			row = db.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+		return json.loads(row[0], object_hook=dotdict) if row else None
+
+	def sync(self, api, force=False):
+		""" Refreshes mirror using given API object.
+		User data (stats, inventory, party, tags, tasks order) and tasks are re-fetched
+		only if version of user document has changed (or if force is True),
+		as any change of tasks (e.g. scoring) updates user document as well.
+		Only changed tasks are rewritten.
+		Returns SyncResult.
+		"""
+		with self._lock:
+			stored_version = self.version()
+			version = stored_version
+			user = None
+			if force or stored_version is None:
+				user = api.get('user', userFields=','.join(self.USER_FIELDS)).data
+			else:
+				version = api.get('user', userFields='_v').data.get('_v')
+				if version != stored_version:
+					user = api.get('user', userFields=','.join(self.USER_FIELDS)).data
+			if user is None:
+				with self._connect() as db:
+					self._set_meta(db, 'synced_at', time.time())
+				logger.debug('Mirror is up to date: version {0}.'.format(version))
+				return self.SyncResult(version, False, 0, 0)
+			version = user.get('_v')
+			remote_tasks = api.get('tasks', 'user').data
+			with self._connect() as db:
+				self._store_user(db, user)
+				tasks_order = self._get_meta(db, 'tasks_order') or {}
+				updated, deleted = self._store_tasks(db, remote_tasks, tasks_order)
+				self._set_meta(db, 'version', version)
+				self._set_meta(db, 'synced_at', time.time())
+		logger.debug('Mirror synced: version {0}, {1} task(s) updated, {2} deleted.'.format(version, updated, deleted))
+		return self.SyncResult(version, True, updated, deleted)
+	def _store_user(self, db, user):
+		for name in self.DOCUMENTS:
+			if name in user:
+				db.execute("INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)", (name, json.dumps(user[name])))
+		if 'tags' in user:
+			db.execute("DELETE FROM tags")
+			db.executemany("INSERT INTO tags (id, position, data) VALUES (?, ?, ?)", [
+				(tag['id'], position, json.dumps(tag)) for position, tag in enumerate(user['tags'])
+				])
+		if 'tasksOrder' in user:
+			self._set_meta(db, 'tasks_order', user['tasksOrder'])
+	def _store_tasks(self, db, remote_tasks, tasks_order):
+		""" Rewrites only new and changed tasks, removes tasks that are gone.
+		Returns pair (amount of updated tasks, amount of deleted tasks).
+		"""
+		stored = dict(db.execute("SELECT id, updated_at FROM tasks").fetchall())
+		positions = {
+				task_id : position
+				for order in tasks_order.values()
+				for position, task_id in enumerate(order)
+				}
+		updated = 0
+		for position, task in enumerate(remote_tasks):
+			position = positions.get(task['id'], len(positions) + position)
+			updated_at = task.get('updatedAt')
+			if task['id'] in stored and stored[task['id']] == updated_at and updated_at is not None:
+				db.execute("UPDATE tasks SET position = ? WHERE id = ?", (position, task['id']))
+				continue
+			db.execute("INSERT OR REPLACE INTO tasks (id, type, position, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+					(task['id'], task['type'], position, updated_at, json.dumps(task)))
+			updated += 1
+		gone = set(stored) - {task['id'] for task in remote_tasks}
+		db.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in gone])
+		return updated, len(gone)
+
+class MirrorSyncer(threading.Thread):
+	""" Background thread that periodically syncs mirror.
+	Mirror is synced right after start.
+	"""
+	def __init__(self, mirror, api, interval=60.0):
+		super().__init__(daemon=True)
+		self.mirror = mirror
+		self.api = api
+		self.interval = interval
+		self._stopped = threading.Event()
+	def run(self):
+		while True: # Syncs at least once.
+			try:
+				self.mirror.sync(self.api)
+			except Exception: # pragma: no cover
+				logger.exception('Failed to sync mirror!')
+			if self._stopped.wait(self.interval):
+				break
+	def stop(self):
+		self._stopped.set()
+		self.join()
+
+def spawn_syncer(): # pragma: no cover
+	""" Starts detached process that syncs default mirror of current user and exits. """
+	return subprocess.Popen([sys.executable, '-m', 'habitica.mirror'],
+			stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+			start_new_session=True,
+			)
+
+def main(): # pragma: no cover
+	from . import api
+	auth = config.load_auth()
+	mirror = Mirror(login=auth['x-api-user'])
+	if not mirror.is_stale():
+		return # Already synced by someone else.
+	remote = api.API(auth['url'], auth['x-api-user'], auth['x-api-key'])
+	try:
+		mirror.sync(remote)
+	finally:
+		remote.close()
+
+if __name__ == '__main__': # pragma: no cover
+	main()
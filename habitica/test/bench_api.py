@@ -0,0 +1,68 @@
+""" Micro-benchmarks for API layer.
+
+Usage:
+	python -m habitica.test.bench_api [path/to/user.json]
+
+Argument is a saved response of GET /user (as returned by Habitica API).
+If it is not given, MockData.USER scaled up to the size of a real account is used.
+"""
+import sys
+import json
+import copy
+import timeit
+from .. import api
+from .mock_api import MockData
+
+class CopyingDotDict(dict):
+	""" Previous implementation of api.dotdict:
+	makes shallow copy of nested dict on every dotted access.
+	"""
+	def __getattr__(self, attr):
+		value = dict.get(self, attr)
+		if type(value) is dict:
+			value = CopyingDotDict(value)
+		return value
+	__setattr__ = dict.__setitem__
+	__delattr__ = dict.__delitem__
+
+def synthetic_user_payload(): # pragma: no cover
+	""" Returns /user response with amount of items comparable to a long-time player. """
+	user = copy.deepcopy(MockData.USER)
+	items = user['items']
+	items['gear']['owned'] = {'gear_{0}'.format(i) : True for i in range(600)}
+	items['pets'] = {'pet_{0}'.format(i) : 5 for i in range(300)}
+	items['mounts'] = {'mount_{0}'.format(i) : True for i in range(300)}
+	items['eggs'] = {'egg_{0}'.format(i) : 1 for i in range(50)}
+	items['food'] = {'food_{0}'.format(i) : 2 for i in range(50)}
+	return {'success' : True, 'data' : user}
+
+ACCESS_CHAINS = [
+		('data.stats.buffs.str', lambda r: r.data.stats.buffs.str),
+		('data.preferences.timezoneOffset', lambda r: r.data.preferences.timezoneOffset),
+		('data.party.quest.key', lambda r: r.data.party.quest.key),
+		('data.party.quest.progress.up', lambda r: r.data.party.quest.progress.up),
+		]
+
+def bench_dotdict(text, number=10000): # pragma: no cover
+	legacy = CopyingDotDict(json.loads(text))
+	current = json.loads(text, object_hook=api.dotdict)
+	print('{0:<36} {1:>12} {2:>12}'.format('access (x{0})'.format(number), 'copying, s', 'current, s'))
+	for name, chain in ACCESS_CHAINS:
+		legacy_time = timeit.timeit(lambda: chain(legacy), number=number)
+		current_time = timeit.timeit(lambda: chain(current), number=number)
+		print('{0:<36} {1:>12.4f} {2:>12.4f}'.format(name, legacy_time, current_time))
+	decode_number = max(1, number // 100)
+	legacy_time = timeit.timeit(lambda: CopyingDotDict(json.loads(text)), number=decode_number)
+	current_time = timeit.timeit(lambda: json.loads(text, object_hook=api.dotdict), number=decode_number)
+	print('{0:<36} {1:>12.4f} {2:>12.4f}'.format('decode (x{0})'.format(decode_number), legacy_time, current_time))
+
+def main(args): # pragma: no cover
+	if args:
+		with open(args[0], encoding='utf-8') as f:
+			text = f.read()
+	else:
+		text = json.dumps(synthetic_user_payload())
+	bench_dotdict(text)
+
+if __name__ == '__main__': # pragma: no cover
+	main(sys.argv[1:])
@@ -0,0 +1,100 @@
+""" Benchmark of loading cached content.
+
+Usage:
+	python -m habitica.test.bench_content [path/to/content.json]
+
+Argument is a saved response of GET /content (as returned by Habitica API).
+If it is not given, MockData.CONTENT_DATA scaled up to the size of a real content is used.
+
+Compares cold loading of plain JSON cache (baseline), full snapshot, lazily loaded sectioned snapshot
+and construction of core Content object over cached content,
+each followed by access to a few collections (as a typical command does).
+Also measures picking the best gear loadout over the whole gear catalog.
+"""
+import sys
+import json
+import copy
+import timeit
+import tempfile
+import random
+import unittest.mock
+from pathlib import Path
+from .. import api, core
+from .mock_api import MockData
+
+ACCESSED_COLLECTIONS = ('potion', 'spells', 'gear')
+
+def synthetic_content_payload(): # pragma: no cover
+	""" Returns /content response with amount of entries comparable to real content. """
+	content = copy.deepcopy(MockData.CONTENT_DATA)
+	for i in range(40):
+		content['filler_{0}'.format(i)] = {
+				'entry_{0}'.format(j) : {'key' : 'entry_{0}'.format(j), 'text' : 'Text ' * 20, 'value' : j}
+				for j in range(500)
+				}
+	gear_types = ('weapon', 'armor', 'head', 'shield', 'back', 'body', 'headAccessory', 'eyewear')
+	classes = ('warrior', 'rogue', 'wizard', 'healer', 'base', 'armoire')
+	rng = random.Random(0)
+	for i in range(1200):
+		key = 'gear_{0}'.format(i)
+		content['gear']['flat'][key] = {
+				'key' : key, 'text' : key,
+				'type' : rng.choice(gear_types), 'klass' : rng.choice(classes),
+				'str' : rng.randint(0, 20), 'int' : rng.randint(0, 20),
+				'con' : rng.randint(0, 20), 'per' : rng.randint(0, 20),
+				'twoHanded' : rng.random() < 0.1,
+				}
+	return {'success' : True, 'data' : content}
+
+def touch(data): # pragma: no cover
+	for name in ACCESSED_COLLECTIONS:
+		data['data'].get(name)
+
+def touch_content(content): # pragma: no cover
+	content.potion
+	content.spells('rogue')
+	content.gearTypes
+
+def bench_load(data, number=20): # pragma: no cover
+	with tempfile.TemporaryDirectory() as tempdir:
+		json_cache = Path(tempdir)/'content.json'
+		json_cache.write_text(json.dumps(data), encoding='utf-8')
+		full = api.Snapshot(Path(tempdir)/'full.snapshot')
+		full.save(data)
+		sectioned = api.Snapshot(Path(tempdir)/'sectioned.snapshot')
+		sectioned.save(data, _sections=('data',))
+		# Same layout as API.Cached stores content in.
+		api.Snapshot(Path(tempdir)/'content.cache').save(data, _sections=('data',))
+		timings = [
+				('json + dotdict', lambda: touch(json.loads(json_cache.read_bytes(), object_hook=api.dotdict))),
+				('full snapshot', lambda: touch(full.load()[1])),
+				('lazy snapshot', lambda: touch(sectioned.load_lazy()[1])),
+				]
+		with unittest.mock.patch('habitica.config.get_cache_dir', return_value=tempdir):
+			remote = api.API('http://localhost/', 'login', 'password', shared_rate_limit=False)
+			timings.append(('Content() + access', lambda: touch_content(core.content.Content(_api=remote))))
+			timings = [(name, timeit.timeit(func, number=number)) for name, func in timings]
+			remote.close()
+	print('{0:<36} {1:>12}'.format('load + access (x{0})'.format(number), 's'))
+	for name, seconds in timings:
+		print('{0:<36} {1:>12.4f}'.format(name, seconds))
+
+def bench_loadout(data, number=100): # pragma: no cover
+	gear = data['data']['gear']['flat']
+	catalog = core.GearCatalog(gear)
+	owned = list(gear)[::2]
+	loadout_time = timeit.timeit(lambda: catalog.best_loadout('str+per', class_name='rogue', owned=owned), number=number)
+	print('{0:<36} {1:>12} {2:>12}'.format('best loadout (x{0})'.format(number), 'items', 'ms per call'))
+	print('{0:<36} {1:>12} {2:>12.3f}'.format('numpy' if core.loadout.numpy is not None else 'plain python', len(gear), loadout_time * 1000 / number))
+
+def main(args): # pragma: no cover
+	if args:
+		with open(args[0], encoding='utf-8') as f:
+			data = json.load(f)
+	else:
+		data = synthetic_content_payload()
+	bench_load(data)
+	bench_loadout(data)
+
+if __name__ == '__main__': # pragma: no cover
+	main(sys.argv[1:])
@@ -37,6 +37,18 @@ class MockAPI:
 		def __getattr__(self, attr): # pragma: no cover
 			return getattr(self.api, attr)
 
+	class MockAsyncAPI:
+		def __init__(self, api):
+			self.api = api
+		async def get(self, *path, **params):
+			return self.api._perform_request('get', path, params=params)
+		async def post(self, *path, _body=None, **params): # pragma: no cover
+			return self.api._perform_request('post', path, params=params, body=_body)
+		async def put(self, *path, _body=None, **params): # pragma: no cover
+			return self.api._perform_request('put', path, params=params, body=_body)
+		async def delete(self, *path, **params): # pragma: no cover
+			return self.api._perform_request('delete', path, params=params)
+
 	def __init__(self, *requests):
 		self.base_url = 'http://localhost'
 		self.requests = list(requests)
@@ -45,11 +57,20 @@ class MockAPI:
 			MockRequest('get', ['content'], {'data': MockData.CONTENT_DATA}, cached=True),
 			]
 		self.hook = None
+		self.mutation_hook = None
 	@property
 	def v4(self):
 		return self.MockAPIv4(self)
+	@property
+	def aio(self):
+		return self.MockAsyncAPI(self)
 	def set_response_hook(self, hook):
 		self.hook = hook
+	def set_mutation_hook(self, hook):
+		self.mutation_hook = hook
+	def notify_mutation(self):
+		if self.mutation_hook:
+			self.mutation_hook()
 	def cached(self, *args, **kwargs):
 		return self
 	def _perform_request(self, method, path, params=None, body=None):
@@ -71,6 +92,8 @@ class MockAPI:
 			self.cache.append(request)
 		if self.hook:
 			self.hook(request.response)
+		if method != 'get':
+			self.notify_mutation()
 		return request.response
 	def get(self, *path, **params):
 		return self._perform_request('get', path, params=params)
@@ -80,6 +103,8 @@ class MockAPI:
 		return self._perform_request('put', path, params=params, body=_body)
 	def delete(self, *path, **params):
 		return self._perform_request('delete', path, params=params)
+	def map(self, paths, **params):
+		return [self.get(*path, **params) for path in paths]
 
 #### DATABASE AND REQUESTS #####################################################
 
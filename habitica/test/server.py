@@ -0,0 +1,375 @@
+""" Local stand-in for Habitica server for end-to-end and load testing.
+
+Implements subset of Habitica API routes used by habitica.core
+over real HTTP, so API layer (connection pooling, rate limits, retries,
+conditional requests, JSON decoding) is exercised for real.
+State is seeded from MockData (or synthetic data of arbitrary size)
+and is kept in memory.
+
+Usage:
+	python -m habitica.test.server [--port 8080] [--latency 0.05] [--error-rate 0.01] [--synthetic 1000]
+Then point 'url' in auth.cfg to http://localhost:8080
+"""
+import sys
+import re
+import json
+import copy
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+import urllib.parse
+import http.server
+from .mock_api import MockData
+
+TASK_TYPES = {
+		'habits' : 'habit',
+		'dailys' : 'daily',
+		'todos' : 'todo',
+		'rewards' : 'reward',
+		}
+MEMBERS_PAGE_SIZE = 30 # Same as in Habitica.
+
+def _with_ids(entries, type_name=None):
+	result = []
+	for key, value in sorted(entries.items(), key=lambda _:_[0]):
+		value = copy.deepcopy(value)
+		value.setdefault('id', key)
+		if type_name:
+			value.setdefault('type', type_name)
+		result.append(value)
+	return result
+
+def mock_data():
+	""" Returns server state seeded from MockData. """
+	tasks = []
+	for type_name, entries in [
+			('habit', MockData.HABITS),
+			('daily', MockData.DAILIES),
+			('todo', MockData.TODOS),
+			('reward', MockData.REWARDS),
+			]:
+		tasks.extend(_with_ids(entries, type_name))
+	groups = _with_ids(MockData.GROUPS)
+	return {
+			'user' : copy.deepcopy(MockData.USER),
+			'tasks' : tasks,
+			'groups' : groups,
+			'chat' : {'party' : copy.deepcopy(MockData.PARTY_CHAT)},
+			'members' : _with_ids(MockData.MEMBERS),
+			'tags' : _with_ids(MockData.TAGS),
+			'content' : copy.deepcopy(MockData.CONTENT_DATA),
+			'news' : copy.deepcopy(MockData.LATEST_NEWS),
+			}
+
+def synthetic_data(tasks=1000, messages=1000, members=100, seed=0):
+	""" Returns server state with specified amount of tasks (of each type),
+	chat messages (in party chat) and party members,
+	using MockData entries as templates.
+	"""
+	rng = random.Random(seed)
+	data = mock_data()
+	templates = {}
+	for task in data['tasks']:
+		templates.setdefault(task['type'], task)
+	data['tasks'] = []
+	for type_name, template in sorted(templates.items()):
+		for index in range(tasks):
+			task = copy.deepcopy(template)
+			task['id'] = '{0}-{1}'.format(type_name, index)
+			task['text'] = '{0} #{1}'.format(template['text'], index)
+			if 'value' in task and not isinstance(task['value'], bool):
+				task['value'] = round(rng.uniform(-20, 20), 2)
+			data['tasks'].append(task)
+	template = data['chat']['party'][0]
+	data['chat']['party'] = []
+	for index in range(messages):
+		message = dict(template, id='chat-{0}'.format(index),
+				timestamp=template['timestamp'] + index * 60,
+				text='{0} #{1}'.format(template['text'], index),
+				)
+		data['chat']['party'].append(message)
+	template = data['members'][0]
+	data['members'] = []
+	for index in range(members):
+		member_id = 'member-{0}'.format(index)
+		data['members'].append(dict(copy.deepcopy(template), id=member_id, _id=member_id))
+	return data
+
+class NotFound(Exception):
+	pass
+
+class HabiticaStandIn:
+	""" State and routes of stand-in server (without HTTP).
+	Options:
+	- latency: seconds to wait before each response (or pair (min, max) for random latency);
+	- error_rate: probability of 502 Bad Gateway response for any request;
+	- rate_limit: max requests per rate_limit_period seconds,
+	  exceeded requests get 429 with Retry-After;
+	- etags: if False, GET responses have no ETag and are never 304 Not Modified.
+	"""
+	def __init__(self, data=None, latency=0, error_rate=0, rate_limit=30, rate_limit_period=60.0, seed=None, etags=True):
+		self.data = data or mock_data()
+		self.etags = etags
+		self.latency = latency
+		self.error_rate = error_rate
+		self.rate_limit = rate_limit
+		self.rate_limit_period = rate_limit_period
+		self.requests = [] # Log of (method, path) for all handled requests.
+		self._lock = threading.Lock()
+		self._random = random.Random(seed)
+		self._window_start = time.time()
+		self._window_count = 0
+		self._fail_next = 0
+		self.routes = [
+				('GET', r'/api/v3/status', self.get_status),
+				('GET', r'/api/v3/user', self.get_user),
+				('GET', r'/api/v3/content', self.get_content),
+				('GET', r'/api/v3/tasks/user', self.get_user_tasks),
+				('GET', r'/api/v3/tasks/([^/]+)', self.get_task),
+				('PUT', r'/api/v3/tasks/([^/]+)', self.update_task),
+				('DELETE', r'/api/v3/tasks/([^/]+)', self.delete_task),
+				('POST', r'/api/v3/tasks/([^/]+)/score/(up|down)', self.score_task),
+				('POST', r'/api/v3/tasks/([^/]+)/checklist/([^/]+)/score', self.score_checklist_item),
+				('POST', r'/api/v4/tasks/bulk-score', self.bulk_score),
+				('GET', r'/api/v3/groups', self.get_groups),
+				('GET', r'/api/v3/groups/([^/]+)', self.get_group),
+				('GET', r'/api/v3/groups/([^/]+)/chat', self.get_chat),
+				('GET', r'/api/v3/groups/([^/]+)/members', self.get_group_members),
+				('POST', r'/api/v3/groups/([^/]+)/chat/seen', self.empty),
+				('GET', r'/api/v3/members/([^/]+)', self.get_member),
+				('GET', r'/api/v3/tags', self.get_tags),
+				('GET', r'/api/v3/news', self.get_news),
+				('POST', r'/api/v4/news/read', self.empty),
+				('POST', r'/api/v3/notifications/read', self.read_notifications),
+				('POST', r'/api/v3/notifications/([^/]+)/(read|see)', self.read_notifications),
+				('POST', r'/api/v3/cron', self.empty),
+				]
+	def fail_next(self, count=1):
+		""" Makes next `count` requests fail with 502 Bad Gateway. """
+		with self._lock:
+			self._fail_next += count
+
+	def _find(self, entries, entry_id):
+		for entry in entries:
+			if entry['id'] == entry_id:
+				return entry
+		raise NotFound(entry_id)
+	def empty(self, *args, query=None, body=None):
+		return {}
+	def get_status(self, query=None, body=None):
+		return {'status' : 'up'}
+	def get_user(self, query=None, body=None):
+		user = self.data['user']
+		if not query.get('userFields'):
+			return user
+		result = {'id' : user['id']}
+		for field in query['userFields'].split(','):
+			source, target = user, result
+			parts = field.split('.')
+			for part in parts[:-1]:
+				source = source.get(part, {})
+				target = target.setdefault(part, {})
+			if parts[-1] in source:
+				target[parts[-1]] = source[parts[-1]]
+		return result
+	def get_content(self, query=None, body=None):
+		return self.data['content']
+	def get_user_tasks(self, query=None, body=None):
+		tasks = self.data['tasks']
+		task_type = TASK_TYPES.get(query.get('type'))
+		if task_type:
+			tasks = [task for task in tasks if task['type'] == task_type]
+		return tasks
+	def get_task(self, task_id, query=None, body=None):
+		return self._find(self.data['tasks'], task_id)
+	def update_task(self, task_id, query=None, body=None):
+		task = self._find(self.data['tasks'], task_id)
+		task.update(body or {})
+		return task
+	def delete_task(self, task_id, query=None, body=None):
+		self.data['tasks'].remove(self._find(self.data['tasks'], task_id))
+		return {}
+	def _score(self, task, direction):
+		delta = 1.0 if direction == 'up' else -1.0
+		task['value'] = task.get('value', 0) + delta
+		if task['type'] in ['daily', 'todo']:
+			task['completed'] = (direction == 'up')
+		stats = self.data['user']['stats']
+		if task['type'] != 'reward':
+			stats['gp'] = stats.get('gp', 0) + delta
+		return delta
+	def score_task(self, task_id, direction, query=None, body=None):
+		task = self._find(self.data['tasks'], task_id)
+		delta = self._score(task, direction)
+		return dict(self.data['user']['stats'], delta=delta, _tmp={})
+	def score_checklist_item(self, task_id, item_id, query=None, body=None):
+		task = self._find(self.data['tasks'], task_id)
+		item = self._find(task.get('checklist', []), item_id)
+		item['completed'] = not item.get('completed', False)
+		return task
+	def bulk_score(self, query=None, body=None):
+		scored = []
+		for entry in body or []:
+			task = self._find(self.data['tasks'], entry['id'])
+			scored.append({'id' : task['id'], 'delta' : self._score(task, entry['direction']), '_tmp' : {}})
+		return dict(self.data['user']['stats'], tasks=scored)
+	def get_groups(self, query=None, body=None):
+		types = set(query.get('type', '').split(','))
+		if 'guilds' in types:
+			types.add('guild')
+		return [group for group in self.data['groups'] if group.get('type') in types]
+	def get_group(self, group_id, query=None, body=None):
+		return self._find(self.data['groups'], group_id)
+	def get_chat(self, group_id, query=None, body=None):
+		self._find(self.data['groups'], group_id)
+		return self.data['chat'].get(group_id, [])
+	def get_group_members(self, group_id, query=None, body=None):
+		""" Pages through all members (every group has the same ones),
+		starting after member with id=lastId.
+		"""
+		self._find(self.data['groups'], group_id)
+		members = self.data['members']
+		start = 0
+		if query.get('lastId'):
+			start = members.index(self._find(members, query['lastId'])) + 1
+		return members[start:start + MEMBERS_PAGE_SIZE]
+	def get_member(self, member_id, query=None, body=None):
+		return self._find(self.data['members'], member_id)
+	def get_tags(self, query=None, body=None):
+		return self.data['tags']
+	def get_news(self, query=None, body=None):
+		return self.data['news']
+	def read_notifications(self, *args, query=None, body=None):
+		return []
+
+	def _rate_limit_headers(self, now):
+		""" Counts request against fixed rate limit window.
+		Returns pair (headers, exceeded).
+		"""
+		if now - self._window_start >= self.rate_limit_period:
+			self._window_start, self._window_count = now, 0
+		self._window_count += 1
+		reset = datetime.datetime.fromtimestamp(self._window_start + self.rate_limit_period, datetime.timezone.utc)
+		headers = {
+				'X-RateLimit-Limit' : str(self.rate_limit),
+				'X-RateLimit-Remaining' : str(max(0, self.rate_limit - self._window_count)),
+				'X-RateLimit-Reset' : reset.strftime('%a %b %d %Y %H:%M:%S GMT+0000 (Coordinated Universal Time)'),
+				}
+		exceeded = self._window_count > self.rate_limit
+		if exceeded:
+			headers['Retry-After'] = str(max(1, int(self._window_start + self.rate_limit_period - now + 0.999)))
+		return headers, exceeded
+	def handle(self, method, url, headers, body):
+		""" Processes single request.
+		Returns tuple (status code, headers, body bytes).
+		"""
+		latency = self.latency
+		if isinstance(latency, (tuple, list)):
+			latency = self._random.uniform(*latency)
+		if latency:
+			time.sleep(latency)
+		url = urllib.parse.urlsplit(url)
+		query = dict(urllib.parse.parse_qsl(url.query))
+		with self._lock:
+			self.requests.append((method, url.path))
+			response_headers, exceeded = self._rate_limit_headers(time.time())
+			if self._fail_next > 0:
+				self._fail_next -= 1
+				return 502, {}, b'Bad Gateway'
+			if self.error_rate and self._random.random() < self.error_rate:
+				return 502, {}, b'Bad Gateway'
+			if exceeded:
+				return self._respond(429, response_headers, {'success':False, 'error':'TooManyRequests', 'message':'Rate limit exceeded'})
+			for route_method, pattern, handler in self.routes:
+				if route_method != method:
+					continue
+				match = re.fullmatch(pattern, url.path.rstrip('/'))
+				if not match:
+					continue
+				try:
+					data = handler(*match.groups(), query=query, body=json.loads(body) if body else None)
+				except NotFound as e:
+					return self._respond(404, response_headers, {'success':False, 'error':'NotFound', 'message':'Not found: {0}'.format(e)})
+				status, response_headers, content = self._respond(200, response_headers, {'success':True, 'data':data, 'notifications':[]})
+				if method == 'GET' and self.etags:
+					etag = 'W/"{0}"'.format(hashlib.sha1(content).hexdigest())
+					response_headers['ETag'] = etag
+					if headers.get('If-None-Match') == etag:
+						return 304, response_headers, b''
+				return status, response_headers, content
+			return self._respond(404, response_headers, {'success':False, 'error':'NotFound', 'message':'Unknown route: {0} {1}'.format(method, url.path)})
+	def _respond(self, status, headers, data):
+		headers = dict(headers)
+		headers['Content-Type'] = 'application/json; charset=utf-8'
+		return status, headers, json.dumps(data).encode('utf-8')
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1' # Keep-alive connections.
+	def _handle(self):
+		length = int(self.headers.get('Content-Length') or 0)
+		body = self.rfile.read(length) if length else None
+		status, headers, content = self.server.stand_in.handle(self.command, self.path, self.headers, body)
+		self.send_response(status)
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+	do_GET = do_POST = do_PUT = do_DELETE = _handle
+	def log_message(self, *args): # pragma: no cover
+		pass
+
+class StandInServer:
+	""" Runs HabiticaStandIn as HTTP server on localhost in background thread.
+	>>> with StandInServer(HabiticaStandIn()) as server:
+	...     api.API(server.url, 'login', 'password').get('user')
+	"""
+	POLL_INTERVAL = 0.05 # Seconds; shutdown waits for the current poll to finish.
+	def __init__(self, stand_in=None, host='127.0.0.1', port=0):
+		self.stand_in = stand_in or HabiticaStandIn()
+		self.httpd = http.server.ThreadingHTTPServer((host, port), RequestHandler)
+		self.httpd.daemon_threads = True
+		self.httpd.stand_in = self.stand_in
+		self._thread = None
+	@property
+	def url(self):
+		host, port = self.httpd.server_address[:2]
+		return 'http://{0}:{1}'.format(host, port)
+	def start(self):
+		self._thread = threading.Thread(target=self.httpd.serve_forever,
+				kwargs={'poll_interval' : self.POLL_INTERVAL}, daemon=True,
+				)
+		self._thread.start()
+		return self
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		self._thread.join()
+	def __enter__(self):
+		return self.start()
+	def __exit__(self, *args):
+		self.stop()
+
+def main(args): # pragma: no cover
+	parser = argparse.ArgumentParser(description='Local stand-in for Habitica server.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--latency', type=float, default=0, help='Latency for each response, in seconds.')
+	parser.add_argument('--error-rate', type=float, default=0, help='Probability of 502 response.')
+	parser.add_argument('--rate-limit', type=int, default=30, help='Max requests per minute.')
+	parser.add_argument('--synthetic', type=int, default=0, help='Generate synthetic data with given amount of tasks of each type.')
+	args = parser.parse_args(args)
+	data = synthetic_data(tasks=args.synthetic) if args.synthetic else None
+	stand_in = HabiticaStandIn(data, latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit)
+	server = StandInServer(stand_in, host=args.host, port=args.port)
+	print('Serving stand-in Habitica at {0}'.format(server.url))
+	try:
+		server.httpd.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__': # pragma: no cover
+	main(sys.argv[1:])
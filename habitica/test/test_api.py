@@ -1,7 +1,14 @@
 import unittest, unittest.mock
 unittest.defaultTestLoader.testMethodPrefix = 'should'
-import json
-import requests
+import json, copy, marshal
+import asyncio
+import tempfile, os, io, gzip
+import datetime
+import threading
+from pathlib import Path
+import requests, requests.adapters, requests.structures
+import urllib3.exceptions
+import http.client
 from .. import api
 
 class TestUtils(unittest.TestCase):
@@ -23,6 +30,54 @@ class TestUtils(unittest.TestCase):
 		d = api.dotdict({'field':'foo', 'nested' : {'subfield': 'bar'}})
 		self.assertEqual(d.field, 'foo')
 		self.assertEqual(d.nested.subfield, 'bar')
+	def should_not_copy_nested_dicts_on_each_access(self):
+		d = api.dotdict({'nested' : {'deeper' : {'value': 'bar'}}})
+		self.assertIs(d.nested, d.nested)
+		self.assertIs(d.nested.deeper, d['nested']['deeper'])
+		self.assertEqual(type(d['nested']), api.dotdict)
+	def should_write_through_nested_dotdicts(self):
+		d = api.dotdict({'nested' : {'deeper' : {'value': 'bar'}}})
+		d.nested.deeper.value = 'foo'
+		self.assertEqual(d['nested']['deeper']['value'], 'foo')
+		d.nested.new_value = 'baz'
+		self.assertEqual(d['nested']['new_value'], 'baz')
+	def should_decode_json_directly_into_dotdicts(self):
+		d = json.loads('{"nested": {"deeper": {"value": "bar"}}, "list": [{"item": 1}]}', object_hook=api.dotdict)
+		self.assertEqual(type(d), api.dotdict)
+		self.assertEqual(d.nested.deeper.value, 'bar')
+		self.assertEqual(d.list[0].item, 1)
+	def should_deepcopy_dotdicts(self):
+		d = api.dotdict({'nested' : {'deeper' : {'value': 'bar'}}})
+		d.nested.deeper
+		c = copy.deepcopy(d)
+		self.assertEqual(c, d)
+		self.assertEqual(type(c.nested), api.dotdict)
+		self.assertIsNot(c.nested, d.nested)
+	def should_read_response_stream_by_chunks(self):
+		response = MockRequestSession.Response(content=b'0123456789')
+		chunks = []
+		_iter_content = response.iter_content
+		response.iter_content = lambda chunk_size: (chunks.append(chunk) or chunk for chunk in _iter_content(chunk_size))
+		stream = api.ResponseStream(response, chunk_size=4)
+		self.assertEqual(stream.read(3), b'012')
+		self.assertEqual(chunks, [b'0123'])
+		self.assertEqual(stream.read(3), b'345')
+		self.assertEqual(stream.read(), b'6789')
+		self.assertEqual(stream.read(), b'')
+		self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+	def should_decode_json_stream_into_dotdicts(self):
+		content = b'{"data": {"nested": {"value": 1.5}, "list": [{"item": 1}]}}'
+		if api.ijson is None: # pragma: no cover
+			self.fail('ijson module should be installed for unit tests!')
+		data = api.decode_json_stream(MockRequestSession.Response(content=content))
+		self.assertEqual(type(data.data.nested), api.dotdict)
+		self.assertEqual(data.data.nested.value, 1.5)
+		self.assertEqual(type(data.data.nested.value), float)
+		self.assertEqual(data.data.list[0].item, 1)
+		with unittest.mock.patch.object(api, 'ijson', None):
+			fallback = api.decode_json_stream(MockRequestSession.Response(content=content))
+		self.assertEqual(type(fallback.data.nested), api.dotdict)
+		self.assertEqual(fallback, data)
 
 class MyException(api.API.Exception):
 	CODE, MESSAGE = 404, 'My object was not found'
@@ -98,14 +153,449 @@ class TestDelay(unittest.TestCase):
 				delay.wait_for('post')
 				self.assertAlmostEqual(sleep.call_args[0][0], 0.3)
 
+class TestRateLimiter(unittest.TestCase):
+	def should_allow_burst_of_requests(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			limiter = api.RateLimiter(30, 60, burst=10)
+			for _ in range(8):
+				self.assertEqual(limiter.get_delay('get'), 0)
+			self.assertTrue(0 < limiter.get_delay('get') < limiter.get_delay('get') < 2)
+			self.assertAlmostEqual(limiter.get_delay('get'), 2)
+	def should_slow_down_smoothly_when_budget_runs_out(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			limiter = api.RateLimiter(30, 60)
+			delays = [limiter.get_delay('get') for _ in range(30)]
+		self.assertEqual(delays[:23], [0] * 23)
+		self.assertEqual(delays[23:], sorted(delays[23:]))
+		self.assertTrue(0 < delays[23] < delays[-1] <= 2)
+	def should_refill_budget_over_time(self):
+		with unittest.mock.patch('time.time', return_value=1000) as get_time:
+			limiter = api.RateLimiter(30, 60, burst=2)
+			limiter.get_delay('get')
+			limiter.get_delay('get')
+			self.assertAlmostEqual(limiter.get_delay('get'), 2)
+			get_time.return_value = 1010
+			self.assertEqual(limiter.get_delay('get'), 0)
+	def should_sync_budget_with_server_headers(self):
+		with unittest.mock.patch('time.time', return_value=1000) as get_time:
+			limiter = api.RateLimiter(30, 60)
+			limiter.update({
+				'X-RateLimit-Limit' : '30',
+				'X-RateLimit-Remaining' : '0',
+				'X-RateLimit-Reset' : 'Thu Jan 01 1970 00:17:00 GMT+0000 (Coordinated Universal Time)',
+				})
+			self.assertAlmostEqual(limiter.get_delay('get'), 20)
+			get_time.return_value = 1020
+			self.assertEqual(limiter.get_delay('get'), 0)
+	def should_pace_remaining_server_budget_until_reset(self):
+		with unittest.mock.patch('time.time', return_value=1600000000):
+			limiter = api.RateLimiter(30, 60)
+			limiter.update({
+				'X-RateLimit-Remaining' : '4',
+				'X-RateLimit-Reset' : '1600000020',
+				})
+			self.assertAlmostEqual(limiter.get_delay('get'), 4)
+	def should_honour_retry_after(self):
+		with unittest.mock.patch('time.time', return_value=1000) as get_time:
+			limiter = api.RateLimiter(30, 60)
+			limiter.update({'Retry-After' : '5'})
+			self.assertAlmostEqual(limiter.get_delay('get'), 5)
+			get_time.return_value = 1005
+			self.assertEqual(limiter.get_delay('get'), 0)
+	def should_parse_http_date_in_headers(self):
+		self.assertEqual(api._parse_rate_limit_time('Thu, 01 Jan 1970 00:16:50 GMT', 1000), 1010)
+		self.assertIsNone(api._parse_rate_limit_time('tomorrow', 1000))
+	def should_ignore_missing_headers(self):
+		limiter = api.RateLimiter(30, 60)
+		limiter.update(None)
+		limiter.update({})
+		self.assertEqual(limiter._tokens, 30)
+	def should_not_sleep_while_budget_is_available(self):
+		limiter = api.RateLimiter(30, 60, burst=1)
+		with unittest.mock.patch('time.sleep') as sleep:
+			limiter.wait_for('get')
+			self.assertFalse(sleep.called)
+			limiter.wait_for('get')
+			self.assertTrue(sleep.called)
+	def should_reserve_budget_from_multiple_threads(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			limiter = api.RateLimiter(30, 60)
+			threads = [threading.Thread(target=limiter.get_delay, args=('get',)) for _ in range(20)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		self.assertEqual(limiter._tokens, 10)
+
+class TestRetryPolicy(unittest.TestCase):
+	def _http_error(self, status_code, headers=None):
+		response = requests.Response()
+		response.status_code = status_code
+		response.headers.update(headers or {})
+		return requests.exceptions.HTTPError(response=response)
+	def should_classify_errors_per_method(self):
+		policy = api.RetryPolicy()
+		self.assertTrue(policy.is_retryable('get', requests.exceptions.ReadTimeout()))
+		self.assertFalse(policy.is_retryable('post', requests.exceptions.ReadTimeout()))
+		self.assertTrue(policy.is_retryable('post', requests.exceptions.ConnectTimeout()))
+		refused = urllib3.exceptions.NewConnectionError(None, 'Connection refused')
+		self.assertTrue(policy.is_retryable('post', requests.exceptions.ConnectionError(
+			urllib3.exceptions.MaxRetryError(None, '/', refused),
+			)))
+		self.assertTrue(policy.is_retryable('post', requests.exceptions.ConnectionError(refused)))
+		dropped = requests.exceptions.ConnectionError(urllib3.exceptions.ProtocolError(
+			'Connection aborted.', http.client.RemoteDisconnected('Remote end closed connection without response'),
+			))
+		self.assertTrue(policy.is_retryable('get', dropped))
+		self.assertFalse(policy.is_retryable('post', dropped))
+		self.assertFalse(policy.is_retryable('post', requests.exceptions.ConnectionError()))
+		self.assertTrue(policy.is_retryable('post', self._http_error(429)))
+		self.assertTrue(policy.is_retryable('post', self._http_error(502)))
+		self.assertTrue(policy.is_retryable('put', self._http_error(504)))
+		self.assertFalse(policy.is_retryable('post', self._http_error(504)))
+		self.assertFalse(policy.is_retryable('get', self._http_error(404)))
+		self.assertFalse(policy.is_retryable('get', requests.exceptions.InvalidURL()))
+	def should_backoff_exponentially_with_jitter(self):
+		policy = api.RetryPolicy(max_retries=5, backoff_base=1, backoff_max=5, budget=api.RetryBudget())
+		error = requests.exceptions.ConnectionError()
+		with unittest.mock.patch('random.uniform', side_effect=lambda a, b: b):
+			delays = [policy.get_delay('get', error, attempt) for attempt in range(6)]
+		self.assertEqual(delays, [1, 2, 4, 5, 5, None])
+		with unittest.mock.patch('random.uniform', side_effect=lambda a, b: a):
+			self.assertEqual(policy.get_delay('get', error, 1), 0)
+	def should_honour_retry_after(self):
+		policy = api.RetryPolicy(backoff_base=1, backoff_max=30, budget=api.RetryBudget())
+		with unittest.mock.patch('time.time', return_value=1600000000):
+			self.assertEqual(policy.get_delay('get', self._http_error(429, {'Retry-After':'10'}), 0), 10)
+			self.assertIsNone(policy.get_delay('get', self._http_error(429, {'Retry-After':'3600'}), 0))
+	def should_stop_retrying_when_budget_is_exhausted(self):
+		with unittest.mock.patch('time.time', return_value=1600000000):
+			budget = api.RetryBudget(retries=2, period=60)
+			policy = api.RetryPolicy(budget=budget)
+			error = requests.exceptions.ConnectionError()
+			self.assertIsNotNone(policy.get_delay('get', error, 0))
+			self.assertIsNotNone(api.RetryPolicy(budget=budget).get_delay('get', error, 0))
+			self.assertIsNone(policy.get_delay('get', error, 0))
+		with unittest.mock.patch('time.time', return_value=1600000030):
+			self.assertIsNotNone(policy.get_delay('get', error, 0))
+
+class TestSingleFlight(unittest.TestCase):
+	def should_coalesce_concurrent_calls(self):
+		single_flight = api.SingleFlight()
+		started, release = threading.Event(), threading.Event()
+		calls = []
+		def _func(value):
+			calls.append(value)
+			started.set()
+			release.wait()
+			return {'data' : [value]}
+		results = []
+		leader = threading.Thread(target=lambda: results.append(single_flight.do('key', _func, 'first')))
+		leader.start()
+		started.wait()
+		call, waiting = single_flight._calls['key'], threading.Event()
+		def _wait(_original_wait=call.done.wait):
+			waiting.set()
+			return _original_wait()
+		call.done.wait = _wait
+		follower = threading.Thread(target=lambda: results.append(single_flight.do('key', _func, 'second')))
+		follower.start()
+		waiting.wait()
+		release.set()
+		leader.join()
+		follower.join()
+		self.assertEqual(calls, ['first'])
+		self.assertEqual(results, [{'data':['first']}, {'data':['first']}])
+		self.assertIsNot(results[0], results[1])
+		self.assertIsNot(results[0], call.result) # Leader does not share result with waiters.
+		self.assertIsNot(results[1], call.result)
+		self.assertEqual(single_flight._calls, {})
+	def should_not_copy_result_without_waiting_callers(self):
+		single_flight = api.SingleFlight()
+		result = {'data' : 'value'}
+		self.assertIs(single_flight.do('key', lambda: result), result)
+	def should_not_coalesce_sequential_calls(self):
+		single_flight = api.SingleFlight()
+		self.assertEqual(single_flight.do('key', lambda: 1), 1)
+		self.assertEqual(single_flight.do('key', lambda: 2), 2)
+	def should_perform_reentrant_calls_directly(self):
+		single_flight = api.SingleFlight()
+		def _outer():
+			return single_flight.do('key', lambda: 'inner') + ' outer'
+		self.assertEqual(single_flight.do('key', _outer), 'inner outer')
+		self.assertEqual(single_flight._calls, {})
+	def should_pass_exception_to_all_waiting_callers(self):
+		single_flight = api.SingleFlight()
+		call = single_flight._calls['key'] = api.SingleFlight._Call()
+		call.thread = None # In flight in some other thread.
+		call.error = RuntimeError('failed')
+		call.done.set()
+		with self.assertRaises(RuntimeError):
+			single_flight.do('key', lambda: 1)
+		del single_flight._calls['key']
+		with self.assertRaises(ZeroDivisionError):
+			single_flight.do('key', lambda: 1/0)
+		self.assertEqual(single_flight._calls, {})
+
+class TestValidatorCache(unittest.TestCase):
+	def should_track_validators_only_for_opted_in_keys(self):
+		cache = api.ValidatorCache()
+		cache.update('key', '"etag"', None)
+		self.assertIsNone(cache.get('key'))
+		self.assertEqual(cache.conditional_headers('key'), {})
+		load = lambda: {}
+		cache.put('key', None, None, load)
+		self.assertIs(cache.get('key').load, load)
+		self.assertEqual(cache.conditional_headers('key'), {})
+		cache.update('key', '"etag"', 'Wed, 21 Oct 2015 07:28:00 GMT')
+		self.assertIs(cache.get('key').load, load)
+		self.assertEqual(cache.conditional_headers('key'), {
+			'if-none-match' : '"etag"',
+			'if-modified-since' : 'Wed, 21 Oct 2015 07:28:00 GMT',
+			})
+		cache.update('key', None, None)
+		self.assertIs(cache.get('key').load, load)
+		self.assertEqual(cache.conditional_headers('key'), {})
+	def should_drop_least_recently_used_entries(self):
+		cache = api.ValidatorCache(max_size=2)
+		cache.put('first', '"1"', None, lambda: 1)
+		cache.put('second', '"2"', None, lambda: 2)
+		cache.get('first')
+		cache.put('third', '"3"', None, lambda: 3)
+		self.assertIsNotNone(cache.get('first'))
+		self.assertIsNone(cache.get('second'))
+		self.assertIsNotNone(cache.get('third'))
+
+class TestSnapshot(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.snapshot = api.Snapshot(Path(self.tempdir.name)/'content.cache')
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def should_treat_missing_snapshot_as_invalid(self):
+		self.assertIsNone(self.snapshot.meta())
+		self.assertIsNone(self.snapshot.load())
+	def should_save_and_load_snapshot(self):
+		data = api.dotdict({'data' : {'list' : [1, 2.5, None, True, 'text'], 'nested' : api.dotdict({'key':'value'})}})
+		self.snapshot.save(data, etag='"v1"')
+		self.assertEqual(self.snapshot.meta(), {'etag' : '"v1"'})
+		meta, loaded = self.snapshot.load()
+		self.assertEqual(meta, {'etag' : '"v1"'})
+		self.assertEqual(loaded, data)
+		self.assertEqual(os.listdir(self.tempdir.name), ['content.cache'])
+	def should_treat_incompatible_snapshot_as_invalid(self):
+		self.snapshot.save({'data':'old'})
+		with unittest.mock.patch.object(api.Snapshot, 'FORMAT_VERSION', api.Snapshot.FORMAT_VERSION + 1):
+			self.assertIsNone(self.snapshot.meta())
+			self.assertIsNone(self.snapshot.load())
+	def should_treat_corrupted_snapshot_as_invalid(self):
+		self.snapshot.path.write_bytes(b'')
+		self.assertIsNone(self.snapshot.load())
+		self.snapshot.path.write_bytes(b'{"data": "json"}')
+		self.assertIsNone(self.snapshot.load())
+		self.snapshot.save({'data':'value'})
+		self.snapshot.path.write_bytes(self.snapshot.path.read_bytes()[:-3])
+		self.assertIsNone(self.snapshot.load())
+	def should_load_sections_on_demand(self):
+		data = {'success' : True, 'data' : {'potion' : {'key':'HealthPotion'}, 'spells' : {'rogue' : [1, 2]}}}
+		self.snapshot.save(api.dotdict(data), _sections=('data',), etag='"v1"')
+		self.assertEqual(self.snapshot.load(), ({'etag' : '"v1"'}, data))
+		with unittest.mock.patch('marshal.loads', wraps=marshal.loads) as loads:
+			meta, loaded = self.snapshot.load_lazy()
+			self.assertEqual(loads.call_count, 1)
+			content = loaded['data']
+			self.assertIsInstance(content, api.LazySections)
+			self.assertEqual(sorted(content), ['potion', 'spells'])
+			self.assertEqual(loads.call_count, 1)
+			self.assertEqual(content.potion.key, 'HealthPotion')
+			self.assertEqual(content['potion']['key'], 'HealthPotion')
+			self.assertEqual(loads.call_count, 2)
+			self.assertIsNone(content.get('unknown'))
+			self.assertIsNone(content.unknown)
+		self.assertEqual(loaded, data)
+		self.assertEqual(dict(content), data['data'])
+		self.assertEqual(copy.deepcopy(content), data['data'])
+		self.assertFalse(content != data['data'])
+		self.assertEqual(json.loads(json.dumps(loaded)), data)
+	def should_treat_truncated_lazy_snapshot_as_invalid(self):
+		self.snapshot.save({'data':{'potion':'value'}}, _sections=('data',))
+		self.snapshot.path.write_bytes(self.snapshot.path.read_bytes()[:-3])
+		self.assertIsNone(self.snapshot.load_lazy())
+	def should_keep_previous_snapshot_if_writing_fails(self):
+		self.snapshot.save({'data':'old'})
+		with self.assertRaises(ValueError):
+			self.snapshot.save({'data':object()})
+		self.assertEqual(self.snapshot.load()[1], {'data':'old'})
+		self.assertEqual(os.listdir(self.tempdir.name), ['content.cache'])
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+	""" Transport adapter that serves the same response for every request. """
+	def __init__(self, status_code=200, content=b'', headers=None):
+		super().__init__()
+		self.status_code = status_code
+		self.content = content
+		self.headers = headers or {}
+		self.sent = []
+	def send(self, request, stream=False, **kwargs):
+		self.sent.append(request)
+		response = requests.Response()
+		response.status_code = self.status_code
+		response.reason = 'OK'
+		response.headers = requests.structures.CaseInsensitiveDict(self.headers)
+		response.raw = io.BytesIO(self.content)
+		response.url = request.url
+		response.request = request
+		response.elapsed = datetime.timedelta(seconds=0.25)
+		return response
+	def close(self):
+		pass
+
+class TestCassette(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tempdir.name)/'test.cassette'
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def _record(self, *contents):
+		cassette = api.Cassette(self.path, api.Cassette.RECORD)
+		transport = FakeAdapter(headers={'X-RateLimit-Remaining':'29', 'Content-Length':'100'})
+		session = requests.Session()
+		session.mount('http://', cassette.adapter(transport))
+		for content in contents:
+			transport.content = content
+			response = session.get('http://localhost/api/v3/user', headers={'x-api-key':'secret-key'}, stream=True)
+			self.assertEqual(response.content, content)
+		transport.content = b'{}'
+		session.post('http://localhost/api/v3/cron', data='{}', headers={'x-api-key':'secret-key'})
+		session.close()
+		return transport
+	def should_record_requests_with_scrubbed_auth(self):
+		transport = self._record(b'{"data": {"name": "\xd0\x96"}}', b'\xff\xfe')
+		self.assertEqual(len(transport.sent), 3)
+		with gzip.open(str(self.path), 'rb') as f:
+			raw = f.read()
+		self.assertNotIn(b'secret-key', raw)
+		cassette = api.Cassette(self.path)
+		self.assertEqual(len(cassette.interactions), 3)
+		request = cassette.interactions[0]['request']
+		self.assertEqual(request['headers']['x-api-key'], '<scrubbed>')
+		response = cassette.interactions[0]['response']
+		self.assertEqual(response['headers'], {'X-RateLimit-Remaining':'29'})
+		self.assertEqual(response['elapsed'], 0.25)
+	def should_replay_recorded_responses_in_order(self):
+		self._record(b'{"data": {"name": "first"}}', b'{"data": {"name": "second"}}')
+		obj = api.API('http://localhost/', 'login', 'password', shared_rate_limit=False,
+				cassette=api.Cassette(self.path),
+				)
+		self.assertEqual(obj.get('user').data.name, 'first')
+		self.assertEqual(obj.get('user').data.name, 'second')
+		self.assertEqual(obj.get('user').data.name, 'second')
+		self.assertEqual(obj.post('cron'), {})
+		with self.assertRaises(api.CassetteMiss):
+			obj.get('content')
+		obj.close()
+	def should_not_throttle_replayed_requests(self):
+		self._record(*([b'{}'] * 5))
+		with unittest.mock.patch('habitica.config.get_cache_dir', return_value=self.tempdir.name):
+			obj = api.API('http://localhost/', 'login', 'password', cassette=api.Cassette(self.path))
+		with unittest.mock.patch('time.sleep') as sleep:
+			for _ in range(50):
+				obj.get('user')
+			sleep.assert_not_called()
+		obj.close()
+		self.assertFalse((Path(self.tempdir.name)/'login.ratelimit').exists())
+	def should_simulate_latency_on_replay(self):
+		self._record(b'{}')
+		session = requests.Session()
+		session.mount('http://', api.Cassette(self.path, latency=True).adapter(FakeAdapter()))
+		with unittest.mock.patch('time.sleep') as sleep:
+			session.get('http://localhost/api/v3/user')
+			sleep.assert_called_once_with(0.25)
+		session.mount('http://', api.Cassette(self.path, latency=0.1).adapter(FakeAdapter()))
+		with unittest.mock.patch('time.sleep') as sleep:
+			session.get('http://localhost/api/v3/user')
+			sleep.assert_called_once_with(0.1)
+
+	def should_replay_binary_and_empty_bodies(self):
+		self._record(b'\xff\xfe')
+		cassette = api.Cassette(self.path)
+		self.assertEqual(cassette.interactions[0]['response']['body'], {'base64':'//4='})
+		cassette.interactions[1]['response']['body'] = None
+		session = requests.Session()
+		session.mount('http://', cassette.adapter(FakeAdapter()))
+		self.assertEqual(session.get('http://localhost/api/v3/user').content, b'\xff\xfe')
+		self.assertEqual(session.post('http://localhost/api/v3/cron', data='{}').content, b'')
+	def should_reject_unknown_mode_and_format(self):
+		with self.assertRaises(ValueError):
+			api.Cassette(self.path, 'rewind')
+		with gzip.open(str(self.path), 'wt', encoding='utf-8') as f:
+			json.dump({'version':0, 'interactions':[]}, f)
+		with self.assertRaises(ValueError):
+			api.Cassette(self.path)
+	def should_keep_previous_cassette_if_saving_fails(self):
+		self._record(b'{}')
+		cassette = api.Cassette(self.path, api.Cassette.RECORD)
+		cassette.interactions.append({'request':object()})
+		with self.assertRaises(TypeError):
+			cassette.save()
+		self.assertEqual(os.listdir(self.tempdir.name), ['test.cassette'])
+		self.assertEqual(len(api.Cassette(self.path).interactions), 2)
+
+class TestSharedRateLimiter(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.state_file = Path(self.tempdir.name)/'test.ratelimit'
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def should_share_budget_between_limiters(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			first = api.RateLimiter(30, 60, state_file=self.state_file)
+			second = api.RateLimiter(30, 60, state_file=self.state_file)
+			for _ in range(15):
+				first.get_delay('get')
+			for _ in range(15):
+				second.get_delay('get')
+			self.assertAlmostEqual(first.get_delay('get'), 2)
+			self.assertEqual(json.loads(self.state_file.read_text())['_tokens'], -1)
+	def should_share_server_headers_between_limiters(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			first = api.RateLimiter(30, 60, state_file=self.state_file)
+			second = api.RateLimiter(30, 60, state_file=self.state_file)
+			first.update({'Retry-After' : '5'})
+			self.assertAlmostEqual(second.get_delay('get'), 5)
+	def should_keep_own_burst_size(self):
+		with unittest.mock.patch('time.time', return_value=1000):
+			interactive = api.RateLimiter(30, 60, state_file=self.state_file)
+			batch = api.RateLimiter(30, 60, burst=10, state_file=self.state_file)
+			interactive.get_delay('get')
+			self.assertEqual(batch.get_delay('get'), 0)
+			self.assertEqual(batch.capacity, 10)
+			self.assertEqual(batch._tokens, 9)
+	def should_ignore_corrupted_state(self):
+		self.state_file.write_text('garbage')
+		limiter = api.RateLimiter(30, 60, state_file=self.state_file)
+		self.assertEqual(limiter.get_delay('get'), 0)
+		self.assertEqual(json.loads(self.state_file.read_text())['_tokens'], 29)
+
 class MockRequestSession:
 	class Response:
-		def __init__(self, status_code=None, reason=None, content=None):
+		def __init__(self, status_code=None, reason=None, content=None, headers=None):
 			self.status_code = status_code
 			self.reason = reason
 			self.content = content
-		def json(self):
+			self.headers = headers or {}
+		def json(self, **kwargs):
+			if isinstance(self.content, bytes):
+				return json.loads(self.content, **kwargs)
 			return self.content
+		def iter_content(self, chunk_size=1):
+			content = self.content
+			if not isinstance(content, bytes):
+				content = json.dumps(content).encode('utf-8')
+			for pos in range(0, len(content), chunk_size):
+				yield content[pos:pos+chunk_size]
+		def close(self):
+			self.closed = True
 		def raise_for_status(self):
 			pass
 
@@ -115,8 +605,11 @@ class MockRequestSession:
 	def raises(self, *exc_objects):
 		self._raises = exc_objects
 	def mount(self, *args, **kwargs): pass
+	def close(self):
+		self.closed = True
 	def _actual_call(self, method, args, kwargs):
 		self._request = (method, args, kwargs)
+		self.calls = getattr(self, 'calls', 0) + 1
 		if self._raises:
 			exc = self._raises[0]
 			self._raises = self._raises[1:]
@@ -142,11 +635,24 @@ class MockDelay:
 	def wait_for(self, method):
 		self.waited_for.append(method)
 		self.updated = False
-	def update(self):
+	def get_delay(self, method):
+		self.wait_for(method)
+		return 0
+	def update(self, headers=None):
 		self.updated = True
 
+class MockRetryPolicy(api.RetryPolicy):
+	def __init__(self, *args, **kwargs):
+		kwargs['budget'] = api.RetryBudget()
+		super().__init__(*args, **kwargs)
+		self.slept = []
+	def sleep(self, delay):
+		self.slept.append(delay)
+
 class MockAPI(api.API):
 	Delay = MockDelay
+	RateLimiter = MockDelay
+	RetryPolicy = MockRetryPolicy
 
 class TestAPI(unittest.TestCase):
 	def should_fill_request_headers(self):
@@ -158,6 +664,45 @@ class TestAPI(unittest.TestCase):
 	def should_create_target_url(self):
 		obj = MockAPI('http://localhost/', 'login', 'password')
 		self.assertEqual(obj.get_url('sample', 'request'), 'http://localhost/api/v3/sample/request')
+	def should_configure_connection_pool(self):
+		obj = MockAPI('http://localhost/', 'login', 'password', pool_maxsize=3, pool_block=True)
+		adapter = obj.session.get_adapter('https://habitica.com')
+		self.assertEqual(adapter._pool_connections, api.API.POOL_CONNECTIONS)
+		self.assertEqual(adapter._pool_maxsize, 3)
+		self.assertTrue(adapter._pool_block)
+		self.assertIs(obj.session.get_adapter('http://localhost'), adapter)
+	def should_share_rate_limit_state_by_default(self):
+		with unittest.mock.patch('habitica.config.get_cache_dir', return_value='/tmp/habitica'):
+			obj = MockAPI('http://localhost/', 'login', 'password')
+			self.assertEqual(obj._delay.kwargs['state_file'], Path('/tmp/habitica')/'login.ratelimit')
+			obj = MockAPI('http://localhost/', 'login', 'password', shared_rate_limit=False)
+			self.assertIsNone(obj._delay.kwargs['state_file'])
+	def should_disable_keep_alive(self):
+		obj = MockAPI('http://localhost/', 'login', 'password', keep_alive=False)
+		self.assertEqual(obj.headers['connection'], 'close')
+	def should_reuse_session_between_calls(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		create_session = unittest.mock.MagicMock(return_value=mock_session)
+		with unittest.mock.patch('requests.Session', create_session):
+			obj.get('path')
+			obj.post('path')
+			obj.v4.put('path')
+		self.assertEqual(create_session.call_count, 1)
+	def should_close_session_on_exit(self):
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			with MockAPI('http://localhost/', 'login', 'password') as obj:
+				obj.get('path')
+			self.assertTrue(mock_session.closed)
+			self.assertIsNone(obj._session)
+			obj.close()
 	def should_perform_a_call(self):
 		obj = MockAPI('http://localhost/', 'login', 'password')
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -170,6 +715,18 @@ class TestAPI(unittest.TestCase):
 			self.assertEqual(mock_session._request[0], 'post')
 			self.assertEqual(obj._delay.waited_for, ['post'])
 			self.assertTrue(obj._delay.updated)
+	def should_coalesce_only_get_requests(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			with unittest.mock.patch.object(obj._inflight, 'do', wraps=obj._inflight.do) as single_flight:
+				obj.get('path', query='value')
+				obj.post('path')
+				self.assertEqual(single_flight.call_count, 1)
+				self.assertEqual(single_flight.call_args[0][0], ('GET', 'http://localhost/api/v3/path', '{"query": "value"}', True))
 	def should_post_request(self):
 		obj = MockAPI('http://localhost/', 'login', 'password', batch_mode=False)
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -222,6 +779,96 @@ class TestAPI(unittest.TestCase):
 			self.assertEqual(mock_session._request[1], ('http://localhost/api/v3/path/to/request',))
 			self.assertTrue('data' not in mock_session._request[2])
 			self.assertEqual(mock_session._request[2]['params'], {'query1':'param1', 'query2':'param2'})
+	def should_decode_response_without_copying(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content=b'{"data": {"stats": {"buffs": {"str": 1}}}}',
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = obj.get('user')
+		self.assertEqual(type(response['data']['stats']), api.dotdict)
+		response.data.stats.buffs.str = 2
+		self.assertEqual(response['data']['stats']['buffs']['str'], 2)
+	def should_revalidate_get_requests_using_etag(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content=b'{"data": "test"}',
+			headers={'ETag' : '"v1"'},
+			))
+		stored = {}
+		obj._validators.put(obj._call_key('GET', obj.get_url('content'), {}, True), None, None,
+				lambda: api.dotdict(stored),
+				)
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = obj.get('content')
+			self.assertEqual(response, {'data':'test'})
+			self.assertNotIn('if-none-match', mock_session._request[2]['headers'])
+			stored.update(response)
+
+			mock_session._response = MockRequestSession.Response(
+					status_code=304,
+					content=b'',
+					)
+			response = obj.get('content')
+			self.assertEqual(response, {'data':'test'})
+			self.assertEqual(type(response), api.dotdict)
+			self.assertIsNot(obj.get('content'), response)
+			self.assertEqual(mock_session._request[2]['headers']['if-none-match'], '"v1"')
+			self.assertNotIn('if-modified-since', mock_session._request[2]['headers'])
+
+			mock_session._response = MockRequestSession.Response(
+					status_code=200,
+					content=b'{"data": "new"}',
+					headers={'ETag' : '"v2"', 'Last-Modified' : 'Wed, 21 Oct 2015 07:28:00 GMT'},
+					)
+			response = obj.get('content')
+			self.assertEqual(response, {'data':'new'})
+			self.assertEqual(obj._validators.conditional_headers(obj._call_key('GET', obj.get_url('content'), {}, True)), {
+				'if-none-match' : '"v2"',
+				'if-modified-since' : 'Wed, 21 Oct 2015 07:28:00 GMT',
+				})
+	def should_not_make_conditional_requests_for_other_resources(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content=b'{"data": "test"}',
+			headers={'ETag' : '"v1"'},
+			))
+		obj._validators.put(obj._call_key('GET', obj.get_url('content'), {}, True), None, None, dict)
+		with unittest.mock.patch('requests.Session', mock_session):
+			obj.get('content')
+			obj.get('content', language='en')
+			self.assertNotIn('if-none-match', mock_session._request[2]['headers'])
+			obj.post('content')
+			self.assertNotIn('if-none-match', mock_session._request[2]['headers'])
+			obj.get('user')
+			obj.get('user')
+			self.assertNotIn('if-none-match', mock_session._request[2]['headers']) # Not opted in.
+			self.assertIsNone(obj._validators.get(obj._call_key('GET', obj.get_url('user'), {}, True)))
+	def should_notify_about_mutating_calls(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mutations = []
+		obj.set_mutation_hook(lambda: mutations.append(True))
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			obj.get('user')
+			self.assertEqual(len(mutations), 0)
+			obj.post('tasks', 'id', 'score', 'up')
+			obj.v4.post('tasks', 'bulk-score')
+			asyncio.run(obj.aio.delete('tasks', 'id'))
+			self.assertEqual(len(mutations), 3)
+			mock_session.raises(requests.exceptions.ReadTimeout())
+			with self.assertRaises(requests.exceptions.ReadTimeout):
+				obj.post('tasks', 'id', 'score', 'up')
+			self.assertEqual(len(mutations), 4) # Change might be applied anyway.
+			obj.set_mutation_hook(lambda: 1/0)
+			with self.assertLogs('habitica', level='ERROR'):
+				obj.notify_mutation()
 	def should_retry_on_occasional_exceptions(self):
 		obj = MockAPI('http://localhost/', 'login', 'password')
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -233,12 +880,41 @@ class TestAPI(unittest.TestCase):
 				requests.exceptions.ConnectionError(),
 				)
 		with unittest.mock.patch('requests.Session', mock_session):
-			response = obj.post('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
+			response = obj.put('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
 			self.assertEqual(response, {'data':'test'})
-			self.assertEqual(mock_session._request[0], 'post')
+			self.assertEqual(mock_session._request[0], 'put')
 			self.assertEqual(mock_session._request[1], ('http://localhost/api/v3/path/to/request',))
 			self.assertEqual(json.loads(mock_session._request[2]['data']), {'request':'value'})
 			self.assertEqual(mock_session._request[2]['params'], {'query1':'param1', 'query2':'param2'})
+			self.assertEqual(len(obj._retry_policy.slept), 2)
+			self.assertEqual(obj._delay.waited_for, ['PUT', 'PUT', 'PUT']) # Each attempt takes its turn.
+	def should_not_retry_non_idempotent_requests_after_read_timeout(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		mock_session.raises(
+				requests.exceptions.ReadTimeout(),
+				)
+		with unittest.mock.patch('requests.Session', mock_session):
+			with self.assertRaises(requests.exceptions.ReadTimeout):
+				obj.post('path', _body={'request':'value'})
+			self.assertEqual(mock_session.calls, 1)
+		mock_session.raises(
+				requests.exceptions.ConnectionError('Connection aborted.'),
+				)
+		with unittest.mock.patch('requests.Session', mock_session):
+			with self.assertRaises(requests.exceptions.ConnectionError):
+				obj.post('path', _body={'request':'value'})
+			self.assertEqual(mock_session.calls, 2)
+		mock_session.raises(
+				requests.exceptions.ConnectionError(urllib3.exceptions.NewConnectionError(None, 'Connection refused')),
+				)
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = obj.post('path', _body={'request':'value'})
+			self.assertEqual(response, {'data':'test'})
+			self.assertEqual(mock_session.calls, 4)
 	def should_raise_on_endless_exceptions(self):
 		obj = MockAPI('http://localhost/', 'login', 'password')
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -257,9 +933,9 @@ class TestAPI(unittest.TestCase):
 				)
 		with unittest.mock.patch('requests.Session', mock_session):
 			with self.assertRaises(requests.exceptions.ReadTimeout):
-				response = obj.post('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
+				response = obj.put('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
 			with self.assertRaises(requests.exceptions.ConnectionError):
-				response = obj.post('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
+				response = obj.put('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
 	def should_raise_on_http_errors(self):
 		obj = MockAPI('http://localhost/', 'login', 'password')
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -296,6 +972,33 @@ class TestAPI(unittest.TestCase):
 
 			response = obj.post('path', 'to', 'request', query1='param1', query2='param2', _body={'request':'value'})
 			self.assertEqual(response, {'data':'test'})
+	def should_stream_json_responses_and_release_connection(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		http_response = MockRequestSession.Response(
+			status_code=200,
+			content=b'{"data": {"value": "test"}}',
+			)
+		mock_session = MockRequestSession(http_response)
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = obj.get('path')
+			self.assertEqual(response.data.value, 'test')
+			self.assertTrue(mock_session._request[2]['stream'])
+			self.assertTrue(http_response.closed)
+	def should_not_dump_responses_when_debug_is_disabled(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content=b'{"data": "test"}',
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			with unittest.mock.patch.object(api.logger, 'isEnabledFor', return_value=False):
+				with unittest.mock.patch('json.dumps', wraps=json.dumps) as dumps:
+					obj.get('path')
+					self.assertFalse([call for call in dumps.call_args_list if call[0][0] == {'data':'test'}])
+			with unittest.mock.patch.object(api.logger, 'isEnabledFor', return_value=True):
+				with self.assertLogs(api.logger, level='DEBUG') as logs:
+					obj.get('path')
+				self.assertTrue(any('"data": "test"' in line for line in logs.output))
 	def should_make_v4_calls(self):
 		obj = MockAPI('http://localhost/', 'login', 'password', batch_mode=False)
 		mock_session = MockRequestSession(MockRequestSession.Response(
@@ -309,3 +1012,129 @@ class TestAPI(unittest.TestCase):
 			self.assertEqual(mock_session._request[1], ('http://localhost/api/v4/path/to/request',))
 			self.assertEqual(json.loads(mock_session._request[2]['data']), {'request':'value'})
 			self.assertEqual(mock_session._request[2]['params'], {'query1':'param1', 'query2':'param2'})
+
+class TestAsyncAPI(unittest.TestCase):
+	def should_make_async_calls(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = asyncio.run(obj.aio.get('path', 'to', 'request', query1='param1'))
+			self.assertEqual(response, {'data':'test'})
+			self.assertEqual(mock_session._request[0], 'get')
+			self.assertEqual(mock_session._request[1], ('http://localhost/api/v3/path/to/request',))
+			self.assertEqual(mock_session._request[2]['params'], {'query1':'param1'})
+			self.assertEqual(obj._delay.waited_for, ['GET'])
+			self.assertTrue(obj._delay.updated)
+
+			response = asyncio.run(obj.aio.post('path', _body={'request':'value'}))
+			self.assertEqual(mock_session._request[0], 'post')
+			self.assertEqual(json.loads(mock_session._request[2]['data']), {'request':'value'})
+			response = asyncio.run(obj.aio.put('path', _body={'request':'value'}))
+			self.assertEqual(mock_session._request[0], 'put')
+			response = asyncio.run(obj.aio.delete('path'))
+			self.assertEqual(mock_session._request[0], 'delete')
+	def should_make_async_v4_calls(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			response = asyncio.run(obj.aio.v4.post('path', _body={'request':'value'}))
+			self.assertEqual(response, {'data':'test'})
+			self.assertEqual(mock_session._request[1], ('http://localhost/api/v4/path',))
+	def should_coalesce_identical_concurrent_get_requests(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		async def _main():
+			return await asyncio.gather(
+					obj.aio.get('user'),
+					obj.aio.get('user'),
+					obj.aio.get('user', userFields='stats'),
+					obj.aio.post('user', 'sleep'),
+					obj.aio.post('user', 'sleep'),
+					)
+		with unittest.mock.patch('requests.Session', mock_session):
+			responses = asyncio.run(_main())
+		self.assertEqual(mock_session.calls, 4)
+		self.assertEqual(responses[0], responses[1])
+		self.assertIsNot(responses[0], responses[1])
+		self.assertEqual(obj._async_inflight, {})
+	def should_throttle_only_actually_performed_get_requests(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		key = obj._call_key('GET', obj.get_url('user'), {}, True)
+		call = obj._inflight._calls[key] = api.SingleFlight._Call()
+		call.thread = None # In flight in some other thread.
+		call.waiters = 1
+		call.result = api.dotdict({'data':'test'})
+		call.done.set()
+		response = asyncio.run(obj.aio.get('user'))
+		self.assertEqual(response, {'data':'test'})
+		self.assertIsNot(response, call.result)
+		self.assertEqual(obj._delay.waited_for, [])
+	def should_check_rate_limiter_outside_of_event_loop_thread(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		threads = []
+		obj._delay.get_delay = lambda method: threads.append(threading.get_ident()) or 0
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		with unittest.mock.patch('requests.Session', mock_session):
+			asyncio.run(obj.aio.get('path'))
+			asyncio.run(obj.aio.post('path'))
+		self.assertEqual(len(threads), 2)
+		self.assertNotIn(threading.get_ident(), threads)
+	def should_map_get_requests_concurrently(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		barrier = threading.Barrier(2, timeout=5)
+		class _Session(MockRequestSession):
+			def get(self, uri, **kwargs):
+				barrier.wait() # Both calls should be in flight at once.
+				return MockRequestSession.Response(status_code=200, content={'data':uri.split('/')[-1]})
+		with unittest.mock.patch('requests.Session', _Session(None)):
+			responses = obj.map([('tasks', 'first'), ('tasks', 'second')], max_workers=2)
+		self.assertEqual([response.data for response in responses], ['first', 'second'])
+		self.assertEqual(obj._delay.waited_for, ['GET', 'GET'])
+		self.assertEqual(obj.map([]), [])
+	def should_reraise_exceptions_from_mapped_requests(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		class _Session(MockRequestSession):
+			def get(self, uri, **kwargs):
+				if uri.endswith('missing'):
+					raise requests.exceptions.InvalidURL(uri)
+				return MockRequestSession.Response(status_code=200, content={'data':'test'})
+		with unittest.mock.patch('requests.Session', _Session(None)):
+			with self.assertRaises(requests.exceptions.InvalidURL):
+				obj.map([('tasks', 'first'), ('tasks', 'missing')])
+	def should_track_response_hook_per_thread(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		obj._inside_response_hook = True
+		other_thread = []
+		thread = threading.Thread(target=lambda: other_thread.append(obj._inside_response_hook))
+		thread.start()
+		thread.join()
+		self.assertEqual(other_thread, [False])
+		self.assertTrue(obj._inside_response_hook)
+	def should_not_block_event_loop_while_waiting_for_delay(self):
+		obj = MockAPI('http://localhost/', 'login', 'password')
+		obj._delay.get_delay = lambda method: 0.5
+		mock_session = MockRequestSession(MockRequestSession.Response(
+			status_code=200,
+			content={'data':'test'},
+			))
+		async_sleeps = []
+		async def _sleep(delay):
+			async_sleeps.append(delay)
+		with unittest.mock.patch('requests.Session', mock_session):
+			with unittest.mock.patch('time.sleep') as time_sleep:
+				with unittest.mock.patch('asyncio.sleep', _sleep):
+					asyncio.run(obj.aio.get('path'))
+				self.assertEqual(async_sleeps, [0.5])
+				self.assertFalse(time_sleep.called)
@@ -2,6 +2,9 @@ import unittest, unittest.mock
 unittest.defaultTestLoader.testMethodPrefix = 'should'
 import datetime
 import copy
+import tempfile
+from pathlib import Path
+import asyncio
 from collections import namedtuple
 from .. import core, api, timeutils
 from ..core.base import Price
@@ -34,6 +37,39 @@ class TestBaseHabitica(unittest.TestCase):
 			MockDataRequest('get', ['user'], MockData.USER),
 			))
 		user = habitica.user()
+	def should_get_only_requested_user_fields(self):
+		api = MockAPI(
+			MockDataRequest('get', ['user'], {
+				'id' : MockData.USER['id'],
+				'preferences' : {'sleep' : True},
+				}),
+			)
+		events = unittest.mock.MagicMock()
+		habitica = core.Habitica(_api=api, event_handler=events)
+		user = habitica.user(fields=['preferences.sleep', 'profile'])
+		self.assertEqual(api.responses[-1].params, {'userFields' : 'preferences.sleep,profile'})
+		self.assertTrue(user.preferences.sleep)
+		with self.assertRaises(core.UnfetchedField) as e:
+			user.preferences.timezoneOffset
+		self.assertEqual(e.exception.path, 'preferences.timezoneOffset')
+		self.assertIn("'preferences.timezoneOffset' was not fetched", str(e.exception))
+		with self.assertRaises(core.UnfetchedField):
+			user.stats
+		with self.assertRaises(KeyError) as e:
+			user.name
+		self.assertNotIsInstance(e.exception, core.UnfetchedField)
+		self.assertEqual(user.id, 'jcdenton')
+		with self.assertRaises(core.UnfetchedField):
+			user._data.get('stats')
+		with self.assertRaises(core.UnfetchedField):
+			user._data.stats
+		with self.assertRaises(core.UnfetchedField):
+			user._data.preferences.get('timezoneOffset', 0)
+		self.assertTrue(user._data.preferences.get('sleep'))
+		self.assertIsNone(user._data.profile)
+		self.assertEqual(user._data.get('profile', {}), {})
+		self.assertEqual(copy.deepcopy(user._data), user._data)
+		events.track_stat.assert_not_called()
 	def should_get_groups(self):
 		habitica = core.Habitica(_api=MockAPI(
 			MockDataRequest('get', ['groups'], MockData.ORDERED.GROUPS),
@@ -137,6 +173,73 @@ class TestBaseHabitica(unittest.TestCase):
 		gear = market.open_mystery_item()
 		self.assertEqual(gear.key, 'mysterykatana')
 
+class TestAsyncHabitica(unittest.TestCase):
+	def should_get_user_asynchronously(self):
+		habitica = core.AsyncHabitica(_api=MockAPI(
+			MockDataRequest('get', ['user'], MockData.USER),
+			))
+		user = asyncio.run(habitica.user())
+		self.assertEqual(user.name, 'JC Denton')
+	def should_get_only_requested_user_fields_asynchronously(self):
+		api = MockAPI(
+			MockDataRequest('get', ['user'], {
+				'id' : MockData.USER['id'],
+				'preferences' : {'sleep' : True},
+				}),
+			)
+		habitica = core.AsyncHabitica(_api=api)
+		user = asyncio.run(habitica.user(fields=['preferences.sleep']))
+		self.assertEqual(api.responses[-1].params, {'userFields' : 'preferences.sleep'})
+		self.assertTrue(user.preferences.sleep)
+		self.assertEqual(user.id, 'jcdenton')
+		with self.assertRaises(core.UnfetchedField):
+			user.stats
+	def should_get_user_tasks_asynchronously(self):
+		habitica = core.AsyncHabitica(_api=MockAPI(
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.HABITS),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.DAILIES),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.TODOS),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.REWARDS),
+			))
+		async def _main():
+			return await asyncio.gather(
+					habitica.user.habits(),
+					habitica.user.dailies(),
+					habitica.user.todos(),
+					habitica.user.rewards(),
+					)
+		habits, dailies, todos, rewards = asyncio.run(_main())
+		self.assertEqual(habits[0].text, 'Join Bob Page')
+		self.assertTrue(all(isinstance(daily, core.Daily) for daily in dailies))
+		self.assertTrue(all(isinstance(todo, core.Todo) for todo in todos))
+		self.assertTrue(all(isinstance(reward, core.Reward) for reward in rewards))
+	def should_get_groups_and_chat_asynchronously(self):
+		habitica = core.AsyncHabitica(_api=MockAPI(
+			MockDataRequest('get', ['groups'], MockData.ORDERED.GROUPS),
+			MockDataRequest('get', ['groups', 'party', 'chat'], MockData.PARTY_CHAT),
+			))
+		async def _main():
+			groups = await habitica.groups(core.Group.PARTY, core.Group.GUILDS)
+			party = next(_ for _ in groups if _.type == 'party')
+			return party, await party.chat.messages()
+		party, messages = asyncio.run(_main())
+		self.assertEqual(party.name, 'Denton brothers')
+		self.assertEqual(messages[0].user, 'jcdenton')
+		self.assertIs(messages[0].group, party)
+	def should_iterate_pages_asynchronously(self):
+		habitica = core.AsyncHabitica(_api=MockAPI(
+			MockDataRequest('get', ['groups'], MockData.ORDERED.GROUPS),
+			MockDataRequest('get', ['groups', 'party', 'members'], [MockData.MEMBERS['pauldenton']] * 30),
+			MockDataRequest('get', ['groups', 'party', 'members'], [MockData.MEMBERS['pauldenton']] * 2),
+			))
+		async def _main():
+			groups = await habitica.groups(core.Group.PARTY, core.Group.GUILDS)
+			party = next(_ for _ in groups if _.type == 'party')
+			return [member async for member in party.members()]
+		members = asyncio.run(_main())
+		self.assertEqual(len(members), 32)
+		self.assertEqual(members[0].name, 'Paul Denton')
+
 class TestNotifications(unittest.TestCase):
 	def _response_with_notification(self, type=None, seen=False, _id=None, **data):
 		return MockRequest('get', ['status'], {
@@ -1175,6 +1278,21 @@ class TestUser(unittest.TestCase):
 		with self.assertRaises(RuntimeError):
 			user.equip_gear(habitica.content.armoire)
 		user.equip_gear(habitica.content.gear('ninja_katana'))
+	def should_equip_best_loadout(self):
+		user_data = copy.deepcopy(MockData.USER)
+		user_data['items']['gear']['owned'] = {'Dummy' : True, 'dragonstooth' : True, 'ninja_katana' : False}
+		equipped_data = copy.deepcopy(user_data)
+		equipped_data['items']['gear']['equipped']['weapon'] = 'dragonstooth'
+		habitica = core.Habitica(_api=MockAPI(
+			MockDataRequest('get', ['user'], user_data),
+			MockDataRequest('post', ['user', 'equip', 'equipped', 'dragonstooth'], equipped_data),
+			))
+		user = habitica.user()
+		loadout = user.best_loadout('str+per')
+		self.assertEqual(loadout.items, {'weapon' : habitica.content.gear('dragonstooth')})
+		self.assertAlmostEqual(loadout.score, 12.0)
+		self.assertEqual(user.equip_loadout(loadout), [habitica.content.gear('dragonstooth')])
+		self.assertEqual(user.equip_loadout(loadout), []) # Already equipped.
 	def should_wear_costume(self):
 		habitica = core.Habitica(_api=MockAPI(
 			MockDataRequest('get', ['user'], MockData.USER),
@@ -1635,6 +1753,71 @@ class TestEvents(unittest.TestCase):
 			"Class changed from 'rogue' to 'warrior'",
 			"Gp: +805.246",
 			])
+	def should_score_many_tasks_with_single_request(self):
+		habitica = core.Habitica(_api=MockAPI(
+			MockDataRequest('get', ['user'], MockData.USER),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.HABITS),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.DAILIES),
+			MockDataRequest('post', ['tasks', 'armory', 'checklist', 'lockpick', 'score'], {}),
+			MockDataRequest('post', ['tasks', 'bulk-score'], {
+				"tasks": [
+					{
+						"id": "stealth",
+						"delta": 1.1,
+						"_tmp": {
+							"drop": {
+								"dialog": "You've found a Cotton Candy Blue Hatching Potion!",
+								},
+							},
+						},
+					{
+						"id": "bobpage",
+						"delta": 0.5,
+						"_tmp": {},
+						},
+					{
+						"id": "armory",
+						"delta": 1,
+						"_tmp": {
+							"quest": {
+								"progressDelta": 0.6949999999999932
+								}
+							},
+						},
+					],
+				"class": "rogue",
+				"gp": 15.5,
+				}),
+			))
+		user = habitica.user()
+		habits = user.habits()
+		dailies = user.dailies()
+		with self.assertRaises(core.CannotScoreDown):
+			user.score_many([(habits[5], 'up'), (habits[0], 'down')])
+		self.assertEqual(habitica.api.requests[0].path, ['tasks', 'armory', 'checklist', 'lockpick', 'score'])
+
+		user.score_many([
+			(habits[5], 'up'),
+			(habits[0], 'up'),
+			(dailies[0][1], 'up'),
+			(dailies[0], 'up'),
+			])
+		self.assertTrue(habitica.api.responses[-1].v4)
+		self.assertEqual(habitica.api.responses[-1].body, [
+			{'id':'stealth', 'direction':'up'},
+			{'id':'bobpage', 'direction':'up'},
+			{'id':'armory', 'direction':'up'},
+			])
+		self.assertAlmostEqual(habits[5].value, 6.2)
+		self.assertAlmostEqual(habits[0].value, -49.6)
+		self.assertTrue(dailies[0][1].is_completed)
+		self.assertTrue(dailies[0].is_completed)
+		self.assertEqual(dailies[0].value, 11)
+		self.assertEqual(list(map(str, habitica.events.dump())), [
+			"You've found a Cotton Candy Blue Hatching Potion!",
+			"Quest progress: +0.695",
+			"Gp: +0.5",
+			])
 
 class TestHabits(unittest.TestCase):
 	def should_get_list_of_user_habits(self):
@@ -2412,6 +2595,173 @@ class TestContent(unittest.TestCase):
 		self.assertEqual(backgrounds[0].notes, "The Core")
 		self.assertEqual(backgrounds[0].price, Price(1, 'hourglass'))
 		self.assertEqual(backgrounds[0].set_name, 'timeTravel')
+	def should_index_backgrounds_by_calendar(self):
+		habitica = core.Habitica(_api=MockAPI())
+		content = habitica.content
+
+		calendar = content.background_calendar()
+		self.assertEqual([(year, month, background_set.key) for year, month, background_set in calendar], [
+			(2020, 8, 'backgrounds082020'),
+			(2020, 12, 'backgrounds122020'),
+			])
+		self.assertNotIn('_items', calendar[0][2].__dict__)
+		self.assertIs(calendar[0][2], content.get_background_set(2020, 8))
+		self.assertEqual(calendar[1][2][0].key, 'blizzard')
+
+		self.assertEqual(content.get_background('blizzard').background_set.key, 'backgrounds122020')
+		self.assertEqual(content.get_background_set_of('core').key, 'timeTravelBackgrounds')
+		self.assertIsNone(content.get_background_set_of('unknown'))
+	def should_query_content_using_indexes(self):
+		habitica = core.Habitica(_api=MockAPI())
+		content = habitica.content
+
+		self.assertEqual(sorted(gear.key for gear in content.gear_for_class('rogue')), ['dragonstooth', 'ninja_katana'])
+		self.assertEqual([gear.key for gear in content.gear_set('ninja-1')], ['ninja_katana'])
+		self.assertEqual(sorted(gear.key for gear in content.gear_of_type('weapon')), ['dragonstooth', 'ninja_katana'])
+		self.assertEqual(content.gear_set('unknown'), [])
+		self.assertEqual([pet.key for pet in content.pets_for_egg('fox')], ['fox'])
+		self.assertEqual([pet.key for pet in content.pets_for_potion('base')], ['fox'])
+		self.assertEqual([mount.key for mount in content.mounts_for_egg('wolf')], ['wolf'])
+		self.assertEqual([mount.key for mount in content.mounts_for_potion('base')], ['fox'])
+		self.assertEqual([quest.key for quest in content.quests_by_category('world')], ['area51'])
+		self.assertEqual([quest.key for quest in content.quests_by_level(30, 40)], ['747'])
+		self.assertEqual(content.quests_by_level(min_level=34), [])
+		self.assertEqual([quest.key for quest in content.quests_by_level()], ['747'])
+
+		items = content.event_items(datetime.date(2020, 1, 15))
+		self.assertEqual(sorted(item.key for item in items), ['area51', 'dragonstooth'])
+		self.assertEqual(content.event_items(datetime.date(2020, 2, 1)), [])
+	def should_find_items_available_on_date(self):
+		habitica = core.Habitica(_api=MockAPI())
+		content = habitica.content
+
+		self.assertEqual(sorted(item.key for item in content.available_on(datetime.date(2020, 1, 1))), ['area51', 'dragonstooth'])
+		self.assertEqual(sorted(item.key for item in content.available_on(datetime.date(2020, 1, 31))), ['area51', 'dragonstooth'])
+		self.assertEqual(content.available_on(datetime.date(2019, 12, 31)), [])
+		self.assertEqual(content.available_on(datetime.date(2020, 2, 1)), [])
+		self.assertEqual([item.key for item in content.available_on(datetime.date(2020, 12, 15))], ['202012'])
+		items = content.available_on(datetime.date(2020, 1, 31), datetime.date(2020, 12, 1))
+		self.assertEqual(sorted(item.key for item in items), ['202012', 'area51', 'dragonstooth'])
+		self.assertEqual(content.available_on(datetime.date(2020, 2, 1), datetime.date(2020, 11, 30)), [])
+
+		event = content.gear('dragonstooth').event
+		self.assertEqual(event, core.content.HabiticaEvent(datetime.date(2020, 1, 1), datetime.date(2020, 1, 31)))
+		self.assertIs(content.gear('dragonstooth').event, event) # Parsed only once.
+	def should_share_content_entries(self):
+		habitica = core.Habitica(_api=MockAPI())
+		content = habitica.content
+		self.assertIs(content.gear('ninja_katana'), content.gear('ninja_katana'))
+		self.assertIs(content.food('Meat'), [food for food in content.food() if food.key == 'Meat'][0])
+		self.assertIs(content.get_quest('747'), content.quests('747'))
+		self.assertIs(content.petInfo('fox'), content.pets_for_egg('fox')[0])
+		self.assertIsNot(content.specialPets()[0], content.petInfo(content.specialPets()[0].key))
+		with self.assertRaises(AttributeError):
+			content.gear('ninja_katana').text = 'Sword'
+		self.assertEqual(content.gear('ninja_katana').text, 'Katana')
+	def should_store_content_index_next_to_cache(self):
+		with tempfile.TemporaryDirectory() as tempdir:
+			storage = api.Snapshot(Path(tempdir)/'content.index.cache')
+			index = core.content.ContentIndex.load(MockData.CONTENT_DATA, storage, 'etag-1')
+			self.assertEqual(storage.load()[0]['version'], 'etag-1')
+			with unittest.mock.patch.object(core.content.ContentIndex, 'build') as build:
+				loaded = core.content.ContentIndex.load(MockData.CONTENT_DATA, storage, 'etag-1')
+				self.assertFalse(build.called)
+			self.assertEqual(loaded['gear_by_set'], index['gear_by_set'])
+			self.assertEqual(loaded.quests_by_level(), ['747'])
+			with unittest.mock.patch.object(core.content.ContentIndex, 'build', return_value=index) as build:
+				core.content.ContentIndex.load(MockData.CONTENT_DATA, storage, 'etag-2')
+				self.assertTrue(build.called)
+	def should_rebuild_content_index_of_stale_format(self):
+		with tempfile.TemporaryDirectory() as tempdir:
+			storage = api.Snapshot(Path(tempdir)/'content.index.cache')
+			with unittest.mock.patch.object(core.content.ContentIndex, 'FORMAT_VERSION', core.content.ContentIndex.FORMAT_VERSION - 1):
+				core.content.ContentIndex.load(MockData.CONTENT_DATA, storage, 'etag-1')
+			self.assertIsNone(core.content.ContentIndex.restore(storage))
+			with unittest.mock.patch.object(core.content.ContentIndex, 'build', wraps=core.content.ContentIndex.build) as build:
+				index = core.content.ContentIndex.load(MockData.CONTENT_DATA, storage, 'etag-1')
+				self.assertTrue(build.called)
+			self.assertEqual(storage.load()[0]['format'], ['ContentIndex', core.content.ContentIndex.FORMAT_VERSION])
+			self.assertEqual(core.content.ContentIndex.restore(storage)['gear_by_set'], index['gear_by_set'])
+	def should_query_content_entries(self):
+		from ..core.quests import Quest
+		habitica = core.Habitica(_api=MockAPI())
+		content = habitica.content
+
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, type='weapon')], ['dragonstooth', 'ninja_katana'])
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, type='weapon', klass='rogue')], ['ninja_katana'])
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, klass__in=['rogue', 'mystery'])], ['mysterykatana', 'ninja_katana'])
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, twoHanded=True)], ['mysterykatana'])
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, set_name='ninja-special')], ['dragonstooth'])
+		self.assertEqual([gear.key for gear in content.query(core.content.Gear, str__ge=5, per__lt=3)], [])
+		self.assertEqual(len(content.query(core.content.Gear)), 4)
+		self.assertIs(content.query(core.content.Gear, klass='rogue')[0], content.gear('ninja_katana'))
+
+		self.assertEqual([potion.key for potion in content.query(core.content.HatchingPotion, premium=False)], ['base'])
+		self.assertEqual([potion.key for potion in content.query(core.content.PremiumHatchingPotion, premium=True)], ['shadow'])
+		self.assertEqual([food.key for food in content.query(core.content.Food, target='Base')], ['Meat'])
+
+		self.assertEqual([quest.key for quest in content.query(Quest, level__ge=30)], ['747'])
+		self.assertEqual([quest.key for quest in content.query(Quest, level__gt=33)], [])
+		self.assertEqual([quest.key for quest in content.query(Quest, level__le=33, category='pet')], ['747'])
+
+		with self.assertRaises(ValueError):
+			content.query(core.content.Gear, unknown=1)
+		with self.assertRaises(ValueError):
+			content.query(core.content.Gear, str__between=1)
+		with self.assertRaises(ValueError):
+			content.query(core.content.Egg)
+	def should_pick_best_gear_loadout(self):
+		catalog = core.GearCatalog({
+			'sword' : {'key':'sword', 'type':'weapon', 'klass':'warrior', 'str':5},
+			'dagger' : {'key':'dagger', 'type':'weapon', 'klass':'rogue', 'str':2, 'per':4},
+			'axe' : {'key':'axe', 'type':'weapon', 'klass':'base', 'str':8, 'twoHanded':True},
+			'shield' : {'key':'shield', 'type':'shield', 'klass':'base', 'str':2, 'con':3},
+			'helm' : {'key':'helm', 'type':'head', 'klass':'base', 'con':1},
+			'cake' : {'key':'cake', 'type':'food'},
+			})
+		self.assertEqual(catalog.best_loadout('str'), ({'weapon':'axe'}, 8.0))
+		self.assertEqual(catalog.best_loadout({'str':1}, class_name='warrior'), ({'weapon':'sword', 'shield':'shield'}, 9.5))
+		self.assertEqual(catalog.best_loadout(['str', 'per'], class_name='rogue')[0]['weapon'], 'dagger')
+		self.assertEqual(catalog.best_loadout('str+con', owned=['dagger', 'helm', 'unknown']), ({'weapon':'dagger', 'head':'helm'}, 3.0))
+		self.assertEqual(catalog.best_loadout('str', owned=[]), ({}, 0.0))
+		self.assertEqual(list(catalog.scores('con', owned=['shield'])), [float('-inf')] * 3 + [3.0] + [float('-inf')] * 2)
+		with self.assertRaises(ValueError):
+			catalog.scores('luck')
+
+		content = core.Habitica(_api=MockAPI()).content
+		self.assertIs(content.gear_catalog, content.gear_catalog)
+	def should_diff_content_versions_by_subtree_hashes(self):
+		old_data = copy.deepcopy(MockData.CONTENT_DATA)
+		new_data = copy.deepcopy(MockData.CONTENT_DATA)
+		new_data['gear']['flat']['new_sword'] = {'key':'new_sword', 'text':'New Sword'}
+		del new_data['backgroundsFlat']['blizzard']
+		new_data['quests']['747']['text'] = 'Changed'
+		old = core.content.ContentHashes.build(old_data)
+		new = core.content.ContentHashes.build(new_data)
+		self.assertEqual(old.hash, core.content.ContentHashes.build(MockData.CONTENT_DATA).hash)
+		self.assertNotEqual(old.hash, new.hash)
+		self.assertEqual(old.diff(old), core.content.ContentDiff([], [], []))
+		with unittest.mock.patch.object(core.content.ContentHashes, '_diff', wraps=core.content.ContentHashes._diff) as visit:
+			diff = old.diff(new)
+			visited = {call[0][2] for call in visit.call_args_list}
+		self.assertEqual(diff.added, [('gear', 'flat', 'new_sword')])
+		self.assertEqual(diff.removed, [('backgroundsFlat', 'blizzard')])
+		self.assertEqual(diff.changed, [('quests', '747', 'text')])
+		self.assertEqual(visited, {
+			(), ('gear',), ('gear', 'flat'), ('backgroundsFlat',),
+			('quests',), ('quests', '747'), ('quests', '747', 'text'),
+			})
+
+		with tempfile.TemporaryDirectory() as tempdir:
+			storage = api.Snapshot(Path(tempdir)/'content.seen.cache')
+			self.assertIsNone(core.content.ContentHashes.restore(storage))
+			old.save(storage)
+			self.assertEqual(core.content.ContentHashes.restore(storage).diff(new), diff)
+			self.assertIsNone(core.content.ContentIndex.restore(storage))
+
+		content = core.Habitica(_api=MockAPI()).content
+		self.assertEqual(content.changes(new).removed, [('gear', 'flat', 'new_sword')])
+		self.assertIsNone(content.unseen_changes(mark_as_seen=True)) # No cache storage.
 	def should_get_special_items(self):
 		habitica = core.Habitica(_api=MockAPI())
 		content = habitica.content
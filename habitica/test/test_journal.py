@@ -0,0 +1,137 @@
+import unittest, unittest.mock
+unittest.defaultTestLoader.testMethodPrefix = 'should'
+import tempfile
+from pathlib import Path
+import requests
+from .. import core, journal
+from .mock_api import MockAPI, MockDataRequest, MockData
+
+def http_error(status_code):
+	response = requests.Response()
+	response.status_code = status_code
+	return requests.exceptions.HTTPError('{0} error'.format(status_code), response=response)
+
+class FailingAPI:
+	""" Records calls, raises given exceptions for specific paths. """
+	def __init__(self, **errors):
+		self.errors = errors
+		self.calls = []
+	def post(self, *path, _body=None, **query):
+		self.calls.append(('post', path, _body, query))
+		error = self.errors.get('/'.join(path))
+		if error:
+			raise error
+
+class TestJournal(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.journal = journal.Journal(Path(self.tempdir.name)/'journal.sqlite')
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def should_append_entries_in_order(self):
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		self.journal.append('put', 'tasks', 'stealth', _body={'text':'foo'}, query='value')
+		entries = journal.Journal(self.journal.path).pending()
+		self.assertEqual([entry.method for entry in entries], ['POST', 'PUT'])
+		self.assertEqual(entries[0].path, ['tasks', 'stealth', 'score', 'up'])
+		self.assertIsNone(entries[0].body)
+		self.assertEqual(entries[1].body, {'text':'foo'})
+		self.assertEqual(entries[1].query, {'query':'value'})
+	def should_replay_entries_in_order(self):
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'down')
+		remote = FailingAPI()
+		self.assertEqual(self.journal.flush(remote), [])
+		self.assertEqual([call[1][-1] for call in remote.calls], ['up', 'down'])
+		self.assertEqual(self.journal.pending(), [])
+	def should_stop_replay_on_network_errors(self):
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		self.journal.append('post', 'tasks', 'armory', 'score', 'up')
+		remote = FailingAPI(**{
+			'tasks/stealth/score/up' : requests.exceptions.ConnectionError(),
+			})
+		self.journal.flush(remote)
+		self.assertEqual(len(remote.calls), 1)
+		pending = self.journal.pending()
+		self.assertEqual(len(pending), 2)
+		self.assertEqual(pending[0].attempts, 1)
+
+		remote.errors = {'tasks/stealth/score/up' : http_error(502)}
+		self.journal.flush(remote)
+		self.assertEqual(len(self.journal.pending()), 2)
+
+		remote.errors = {}
+		self.journal.flush(remote)
+		self.assertEqual(self.journal.pending(), [])
+	def should_report_conflicts(self):
+		self.journal.append('post', 'tasks', 'deleted', 'score', 'up')
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		remote = FailingAPI(**{
+			'tasks/deleted/score/up' : http_error(404),
+			})
+		with self.assertLogs('habitica', level='WARNING'):
+			conflicts = self.journal.flush(remote)
+		self.assertEqual(len(conflicts), 1)
+		self.assertEqual(conflicts[0].path, ['tasks', 'deleted', 'score', 'up'])
+		self.assertEqual(self.journal.pending(), [])
+		conflicts = self.journal.conflicts()
+		self.assertEqual(len(conflicts), 1)
+		self.assertTrue(conflicts[0].error.startswith('404'))
+		self.journal.clear_conflicts()
+		self.assertEqual(self.journal.conflicts(), [])
+	def should_not_flush_concurrently(self):
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		remote = FailingAPI()
+		with self.journal._flushing() as acquired:
+			self.assertTrue(acquired)
+			other = journal.Journal(self.journal.path)
+			self.assertEqual(other.flush(remote), [])
+			self.assertEqual(remote.calls, [])
+		self.journal.flush(remote)
+		self.assertEqual(len(remote.calls), 1)
+	def should_flush_journal_in_background(self):
+		self.journal.append('post', 'tasks', 'stealth', 'score', 'up')
+		remote = FailingAPI()
+		flusher = journal.JournalFlusher(self.journal, remote, interval=60)
+		flusher.start()
+		flusher.stop()
+		self.assertEqual(len(remote.calls), 1)
+		self.assertEqual(self.journal.pending(), [])
+
+class TestWriteBehind(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.journal = journal.Journal(Path(self.tempdir.name)/'journal.sqlite')
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def should_journal_task_scoring(self):
+		api = MockAPI(
+			MockDataRequest('get', ['user'], MockData.USER),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.HABITS),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.DAILIES),
+			)
+		api.journal = self.journal
+		habitica = core.Habitica(_api=api)
+		user = habitica.user()
+		habits = user.habits()
+		habits[5].up()
+		self.assertAlmostEqual(habits[5].value, 5.1)
+		dailies = user.dailies()
+		dailies[0][1].complete()
+		self.assertTrue(dailies[0][1].is_completed)
+		dailies[0].complete()
+		self.assertTrue(dailies[0].is_completed)
+		self.assertEqual([entry.path for entry in self.journal.pending()], [
+			['tasks', 'stealth', 'score', 'up'],
+			['tasks', 'armory', 'checklist', 'lockpick', 'score'],
+			['tasks', 'armory', 'score', 'up'],
+			])
+
+		api = MockAPI(
+			MockDataRequest('post', ['tasks', 'stealth', 'score', 'up'], {'delta':1.1}),
+			MockDataRequest('post', ['tasks', 'armory', 'checklist', 'lockpick', 'score'], {}),
+			MockDataRequest('post', ['tasks', 'armory', 'score', 'up'], {'delta':1}),
+			)
+		self.assertEqual(self.journal.flush(api), [])
+		self.assertEqual(api.requests, [])
+		self.assertEqual(self.journal.pending(), [])
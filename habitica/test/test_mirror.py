@@ -0,0 +1,153 @@
+import unittest, unittest.mock
+unittest.defaultTestLoader.testMethodPrefix = 'should'
+import tempfile
+from pathlib import Path
+from .. import core, mirror
+from .mock_api import MockAPI, MockDataRequest, MockData
+
+def make_task(task_id, task_type, text, updated_at='2020-01-01T00:00:00.000Z'):
+	return {'id':task_id, 'type':task_type, 'text':text, 'value':0, 'updatedAt':updated_at}
+
+USER = {
+		'_v' : 10,
+		'stats' : {'hp' : 50, 'gp' : 10},
+		'items' : {'food' : {}},
+		'party' : {'_id' : 'party'},
+		'tags' : [{'id' : 'tag1', 'name' : 'First'}, {'id' : 'tag2', 'name' : 'Second'}],
+		'tasksOrder' : {
+			'habits' : ['habit2', 'habit1'],
+			'dailys' : ['daily1'],
+			'todos' : [],
+			'rewards' : [],
+			},
+		}
+TASKS = [
+		make_task('habit1', 'habit', 'First habit'),
+		make_task('habit2', 'habit', 'Second habit'),
+		make_task('daily1', 'daily', 'Daily'),
+		]
+
+class TestMirror(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.mirror = mirror.Mirror(Path(self.tempdir.name)/'mirror.sqlite')
+	def tearDown(self):
+		self.tempdir.cleanup()
+	def should_mirror_account_data(self):
+		self.assertIsNone(self.mirror.version())
+		api = MockAPI(
+			MockDataRequest('get', ['user'], USER),
+			MockDataRequest('get', ['tasks', 'user'], TASKS),
+			)
+		result = self.mirror.sync(api)
+		self.assertEqual(api.responses[0].params, {'userFields' : '_v,stats,items,party,tags,tasksOrder'})
+		self.assertEqual(result, (10, True, 3, 0))
+		self.assertEqual(self.mirror.version(), 10)
+		self.assertIsNotNone(self.mirror.synced_at())
+		self.assertEqual([task.id for task in self.mirror.tasks('habit')], ['habit2', 'habit1'])
+		self.assertEqual([task.id for task in self.mirror.tasks('daily')], ['daily1'])
+		self.assertEqual(len(self.mirror.tasks()), 3)
+		self.assertEqual([tag.name for tag in self.mirror.tags()], ['First', 'Second'])
+		self.assertEqual(self.mirror.document('stats').hp, 50)
+		self.assertIsNone(self.mirror.document('unknown'))
+	def should_sync_incrementally(self):
+		self.mirror.sync(MockAPI(
+			MockDataRequest('get', ['user'], USER),
+			MockDataRequest('get', ['tasks', 'user'], TASKS),
+			))
+		synced_at = self.mirror.synced_at()
+		api = MockAPI(
+			MockDataRequest('get', ['user'], {'_v' : 10}),
+			)
+		result = self.mirror.sync(api)
+		self.assertEqual(len(api.responses), 1)
+		self.assertEqual(api.responses[0].params, {'userFields' : '_v'})
+		self.assertEqual(result, (10, False, 0, 0))
+		self.assertGreaterEqual(self.mirror.synced_at(), synced_at)
+
+		api = MockAPI(
+			MockDataRequest('get', ['user'], {'_v' : 11}),
+			MockDataRequest('get', ['user'], dict(USER, _v=11, tags=[])),
+			MockDataRequest('get', ['tasks', 'user'], [
+				TASKS[1],
+				make_task('daily1', 'daily', 'Changed daily', updated_at='2020-01-02T00:00:00.000Z'),
+				]),
+			)
+		result = self.mirror.sync(api)
+		self.assertEqual(result, (11, True, 1, 1))
+		self.assertEqual(self.mirror.tags(), [])
+		self.assertEqual([task.id for task in self.mirror.tasks('habit')], ['habit2'])
+		self.assertEqual(self.mirror.tasks('daily')[0].text, 'Changed daily')
+	def should_detect_stale_mirror(self):
+		self.assertTrue(self.mirror.is_stale())
+		with unittest.mock.patch('time.time', return_value=1000):
+			self.mirror.sync(MockAPI(
+				MockDataRequest('get', ['user'], USER),
+				MockDataRequest('get', ['tasks', 'user'], TASKS),
+				))
+		with unittest.mock.patch('time.time', return_value=1000 + mirror.Mirror.MAX_AGE):
+			self.assertFalse(self.mirror.is_stale())
+			self.assertTrue(self.mirror.is_stale(max_age=10))
+		with unittest.mock.patch('time.time', return_value=1001 + mirror.Mirror.MAX_AGE):
+			self.assertTrue(self.mirror.is_stale())
+	def should_keep_separate_mirror_for_each_login(self):
+		with unittest.mock.patch('habitica.config.get_cache_dir', return_value=self.tempdir.name):
+			self.assertEqual(mirror.Mirror(login='jcdenton').path, Path(self.tempdir.name)/'jcdenton.mirror.sqlite')
+			self.assertEqual(mirror.Mirror().path, Path(self.tempdir.name)/'mirror.sqlite')
+	def should_list_user_tasks_from_mirror(self):
+		habitica = core.Habitica(_api=MockAPI(
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.HABITS),
+			), mirror=self.mirror)
+		self.assertEqual(len(habitica.user.habits()), len(MockData.HABITS))
+		self.mirror.sync(MockAPI(
+			MockDataRequest('get', ['user'], USER),
+			MockDataRequest('get', ['tasks', 'user'], TASKS),
+			))
+		habitica.api = MockAPI()
+		habits = habitica.user.habits()
+		self.assertEqual([habit.text for habit in habits], ['Second habit', 'First habit'])
+		self.assertEqual([daily.text for daily in habitica.user.dailies()], ['Daily'])
+		self.assertEqual(habitica.user.todos(), [])
+		self.assertEqual(habitica.user.rewards(), [])
+		self.assertEqual([tag.name for tag in habitica.user.tags()], ['First', 'Second'])
+	def should_invalidate_mirror_after_changes(self):
+		todos = [
+				dict(make_task('todo1', 'todo', 'First todo'), completed=False),
+				dict(make_task('todo2', 'todo', 'Second todo'), completed=False),
+				]
+		self.mirror.sync(MockAPI(
+			MockDataRequest('get', ['user'], dict(USER, tasksOrder={'todos':['todo1', 'todo2']})),
+			MockDataRequest('get', ['tasks', 'user'], todos),
+			))
+		habitica = core.Habitica(_api=MockAPI(
+			MockDataRequest('post', ['tasks', 'todo1', 'score', 'up'], {'delta':1}),
+			MockDataRequest('get', ['tasks', 'user'], [dict(todos[0], completed=True), todos[1]]),
+			), mirror=self.mirror)
+		pending = [todo for todo in habitica.user.todos() if not todo.is_completed]
+		self.assertEqual([todo.id for todo in pending], ['todo1', 'todo2'])
+		pending[0].complete()
+		self.assertTrue(self.mirror.is_stale())
+		self.assertIsNone(self.mirror.version())
+		pending = [todo for todo in habitica.user.todos() if not todo.is_completed]
+		self.assertEqual([todo.id for todo in pending], ['todo2'])
+		self.assertEqual(habitica.api.requests, [])
+	def should_fall_back_to_api_without_synced_mirror(self):
+		habitica = core.Habitica(_api=MockAPI(
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.DAILIES),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.TODOS),
+			MockDataRequest('get', ['tasks', 'user'], MockData.ORDERED.REWARDS),
+			MockDataRequest('get', ['tags'], MockData.ORDERED.TAGS),
+			), mirror=self.mirror)
+		self.assertEqual(len(habitica.user.dailies()), len(MockData.DAILIES))
+		self.assertEqual(len(habitica.user.todos()), len(MockData.TODOS))
+		self.assertEqual(len(habitica.user.rewards()), len(MockData.REWARDS))
+		self.assertEqual(len(habitica.user.tags()), len(MockData.TAGS))
+	def should_sync_mirror_in_background(self):
+		api = MockAPI(
+			MockDataRequest('get', ['user'], USER),
+			MockDataRequest('get', ['tasks', 'user'], TASKS),
+			)
+		syncer = mirror.MirrorSyncer(self.mirror, api, interval=60)
+		syncer.start()
+		syncer.stop()
+		self.assertEqual(self.mirror.version(), 10)
@@ -0,0 +1,199 @@
+import unittest, unittest.mock
+unittest.defaultTestLoader.testMethodPrefix = 'should'
+import tempfile
+import requests
+from .. import api, core
+from .server import HabiticaStandIn, StandInServer, synthetic_data
+
+class NoSleepRetryPolicy(api.RetryPolicy):
+	def __init__(self, *args, **kwargs):
+		kwargs['budget'] = api.RetryBudget()
+		super().__init__(*args, **kwargs)
+		self.slept = []
+	def sleep(self, delay):
+		self.slept.append(delay)
+
+class LocalAPI(api.API):
+	RetryPolicy = NoSleepRetryPolicy
+
+class TestStandInServer(unittest.TestCase):
+	def setUp(self):
+		self.cache_dir = tempfile.TemporaryDirectory()
+		self.patched_cache_dir = unittest.mock.patch('habitica.config.get_cache_dir', return_value=self.cache_dir.name)
+		self.patched_cache_dir.start()
+		self.stand_in = HabiticaStandIn()
+		self.server = StandInServer(self.stand_in).start()
+		self.api = LocalAPI(self.server.url, 'login', 'password',
+				batch_mode=False, shared_rate_limit=False,
+				)
+	def tearDown(self):
+		self.api.close()
+		self.server.stop()
+		self.patched_cache_dir.stop()
+		self.cache_dir.cleanup()
+	def should_serve_user_and_tasks(self):
+		habitica = core.Habitica(_api=self.api)
+		user = habitica.user()
+		self.assertEqual(user.name, 'JC Denton')
+		habits = user.habits()
+		self.assertEqual(habits[0].text, 'Join Bob Page')
+		dailies = user.dailies()
+		self.assertEqual(dailies[0].text, 'Restock at armory')
+		self.assertIn(('GET', '/api/v3/user'), self.stand_in.requests)
+	def should_score_tasks(self):
+		habitica = core.Habitica(_api=self.api)
+		user = habitica.user()
+		habits = user.habits()
+		value = habits[0].value
+		habits[0].up()
+		task = self.api.get('tasks', habits[0].id).data
+		self.assertAlmostEqual(task.value, value + 1)
+	def should_fetch_only_requested_user_fields(self):
+		habitica = core.Habitica(_api=self.api)
+		user = habitica.user(fields=['preferences.timezoneOffset'])
+		self.assertEqual(user.preferences.timezoneOffset, 180)
+		with self.assertRaises(core.UnfetchedField):
+			user.preferences.sleep
+	def should_fetch_group_tasks_concurrently(self):
+		habitica = core.Habitica(_api=self.api)
+		party = habitica.user.party()
+		self.assertEqual([task.id for task in party.habits()], ['carryon'])
+		self.assertEqual([task.id for task in party.rewards()], ['augments'])
+	def should_page_through_group_members(self):
+		self.stand_in.data['members'] = synthetic_data(tasks=0, messages=0, members=70)['members']
+		habitica = core.Habitica(_api=self.api)
+		party = habitica.user.party()
+		members = list(party.members())
+		self.assertEqual([member.id for member in members], ['member-{0}'.format(index) for index in range(70)])
+		pages = [request for request in self.stand_in.requests if request[1].endswith('/members')]
+		self.assertEqual(pages, [('GET', '/api/v3/groups/{0}/members'.format(party.id))] * 3)
+	def should_respond_not_modified_for_known_etag(self):
+		first = self.api.get('user')
+		second = self.api.get('user')
+		self.assertEqual(first, second)
+		response = requests.get(self.server.url + '/api/v3/user')
+		etag = response.headers['ETag']
+		response = requests.get(self.server.url + '/api/v3/user', headers={'If-None-Match':etag})
+		self.assertEqual(response.status_code, 304)
+	def should_revalidate_cached_response(self):
+		cached = self.api.cached('content')
+		first = cached.get('content')
+		self.assertEqual(first.data, self.stand_in.data['content'])
+		etag = cached.snapshot.meta()['etag']
+		self.assertTrue(etag)
+
+		self.assertEqual(cached.get('content').data, first.data)
+		self.assertEqual(len(self.stand_in.requests), 1)
+
+		cached.REVALIDATE_AFTER = -1
+		save = api.Snapshot.save
+		with unittest.mock.patch.object(api.Snapshot, 'save', autospec=True, side_effect=save) as saved:
+			second = cached.get('content')
+		self.assertEqual(second.data, first.data)
+		self.assertFalse(saved.called)
+		self.assertEqual(len(self.stand_in.requests), 2)
+		self.assertEqual(cached.snapshot.meta()['etag'], etag)
+	def should_load_not_modified_response_from_cached_snapshot(self):
+		cached = self.api.cached('content')
+		cached.get('content')
+		cached.REVALIDATE_AFTER = -1
+		load_lazy = api.Snapshot.load_lazy
+		with unittest.mock.patch.object(api.Snapshot, 'load_lazy', autospec=True, side_effect=load_lazy) as loaded:
+			response = cached.get('content')
+		loaded.assert_called_once()
+		self.assertEqual(response.data, self.stand_in.data['content'])
+		entry = self.api._validators.get(self.api._call_key('GET', self.api.get_url('content'), {}, True))
+		self.assertEqual(entry.etag, cached.snapshot.meta()['etag'])
+		self.assertEqual(entry.load()['data'], self.stand_in.data['content'])
+	def should_refresh_cached_response_on_change(self):
+		cached = self.api.cached('content')
+		cached.get('content')
+		etag = cached.snapshot.meta()['etag']
+		cached.REVALIDATE_AFTER = -1
+		self.stand_in.data['content'] = {'changed' : True}
+		self.assertEqual(cached.get('content').data, {'changed' : True})
+		self.assertNotEqual(cached.snapshot.meta()['etag'], etag)
+		cached.REVALIDATE_AFTER = 60
+		self.assertEqual(cached.get('content').data, {'changed' : True})
+		self.assertEqual(len(self.stand_in.requests), 2)
+	def should_refresh_cached_response_without_validators(self):
+		cached = self.api.cached('content')
+		cached.get('content')
+		cached.REVALIDATE_AFTER = -1
+		self.stand_in.etags = False
+		self.stand_in.data['content'] = {'changed' : True}
+		self.assertEqual(cached.get('content').data, {'changed' : True})
+		self.assertIsNone(cached.snapshot.meta()['etag'])
+		self.assertEqual(cached.snapshot.load()[1]['data'], {'changed' : True})
+		self.assertEqual(cached.get('content').data, {'changed' : True})
+		self.assertEqual(len(self.stand_in.requests), 3)
+	def should_not_revalidate_cache_within_response_hook(self):
+		cached = self.api.cached('content')
+		cached.get('content')
+		cached.REVALIDATE_AFTER = -1
+		self.api._inside_response_hook = True
+		try:
+			self.assertEqual(cached.get('content').data, self.stand_in.data['content'])
+		finally:
+			self.api._inside_response_hook = False
+		self.assertEqual(len(self.stand_in.requests), 1)
+	def should_cache_non_get_requests(self):
+		cached = self.api.cached('cron')
+		self.assertIsNone(cached.version())
+		cached.post('cron')
+		self.assertEqual(cached.post('cron').data, {})
+		self.assertIsNone(cached.version())
+		self.assertEqual(len(self.stand_in.requests), 1)
+
+		task_id = self.stand_in.data['tasks'][0]['id']
+		self.assertEqual(self.api.cached('update').put('tasks', task_id, _body={'text':'Updated'}).data.text, 'Updated')
+		self.assertEqual(self.api.cached('delete').delete('tasks', task_id).data, {})
+		self.assertNotIn(task_id, [task['id'] for task in self.stand_in.data['tasks']])
+		cached = self.api.cached('status')
+		self.assertEqual(cached.call('GET', cached.get_url('status')).data.status, 'up')
+		self.assertEqual(cached.snapshot.load()[1]['data'], {'status':'up'})
+	def should_track_unseen_content_changes(self):
+		content = core.content.Content(_api=self.api)
+		self.assertIsNone(content.unseen_changes())
+		self.assertIsNone(content.unseen_changes(mark_as_seen=True))
+		self.assertEqual(content.unseen_changes(), core.content.ContentDiff([], [], []))
+		index = content.index
+		with unittest.mock.patch.object(core.content.ContentIndex, 'build') as build:
+			self.assertEqual(core.content.Content(_api=self.api).index['gear_by_set'], index['gear_by_set'])
+			self.assertFalse(build.called)
+
+		self.stand_in.data['content']['gear']['flat']['new_sword'] = {'key':'new_sword', 'type':'weapon', 'text':'New Sword'}
+		with unittest.mock.patch.object(api.API.Cached, 'REVALIDATE_AFTER', -1):
+			content = core.content.Content(_api=self.api)
+		with unittest.mock.patch.object(core.content.ContentIndex, 'build', wraps=core.content.ContentIndex.build) as build:
+			self.assertIn('new_sword', content.index['gear_by_type']['weapon'])
+			self.assertTrue(build.called)
+		changes = content.unseen_changes(mark_as_seen=True)
+		self.assertEqual(changes.added, [('gear', 'flat', 'new_sword')])
+		self.assertEqual(changes.removed + changes.changed, [])
+		self.assertEqual(content.unseen_changes(), core.content.ContentDiff([], [], []))
+	def should_respond_with_not_found(self):
+		with self.assertRaises(requests.exceptions.HTTPError) as e:
+			self.api.get('tasks', 'unknown')
+		self.assertEqual(e.exception.response.status_code, 404)
+	def should_retry_server_errors(self):
+		self.stand_in.fail_next(2)
+		self.assertEqual(self.api.get('status').data.status, 'up')
+		self.assertEqual(len(self.api._retry_policy.slept), 2)
+		self.assertEqual(len(self.stand_in.requests), 3)
+	def should_emulate_rate_limit(self):
+		self.stand_in.rate_limit = 2
+		response = requests.get(self.server.url + '/api/v3/status')
+		self.assertEqual(response.headers['X-RateLimit-Remaining'], '1')
+		requests.get(self.server.url + '/api/v3/status')
+		response = requests.get(self.server.url + '/api/v3/status')
+		self.assertEqual(response.status_code, 429)
+		self.assertIn('Retry-After', response.headers)
+
+class TestSyntheticData(unittest.TestCase):
+	def should_generate_synthetic_data(self):
+		data = synthetic_data(tasks=10, messages=5, members=3)
+		self.assertEqual(len([task for task in data['tasks'] if task['type'] == 'habit']), 10)
+		self.assertEqual(len({task['id'] for task in data['tasks']}), len(data['tasks']))
+		self.assertEqual(len(data['chat']['party']), 5)
+		self.assertEqual(len(data['members']), 3)
@@ -41,6 +41,10 @@ setup(
         'click',
         'click-default-group',
     ],
+    extras_require={
+        'streaming': ['ijson'],
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'habitica = habitica.cli:cli',